@@ -1,39 +1,58 @@
 import arcpy
 import os
 from arcpy.sa import ExtractByMask
+from raster_output import set_arcpy_output_env
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # Enable Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
 
 # Input folder where original CHIRPS .tif files are located
-input_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps"
+input_folder = setting("chirps_clip", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps")
 
 # Temporary folder to store resampled rasters
-resampled_folder = os.path.join(input_folder, "Resampled_250m")
+resampled_folder = setting("chirps_clip", "resampled_folder", os.path.join(input_folder, "Resampled_250m"))
 if not os.path.exists(resampled_folder):
     os.makedirs(resampled_folder)
 
 # Output folder for clipped rasters
-clipped_folder = os.path.join(input_folder, "Clipped_250m")
+clipped_folder = setting("chirps_clip", "clipped_folder", os.path.join(input_folder, "Clipped_250m"))
 if not os.path.exists(clipped_folder):
     os.makedirs(clipped_folder)
 
 # Define environment
 arcpy.env.workspace = input_folder
 arcpy.env.overwriteOutput = True
+set_arcpy_output_env(arcpy)      # tiled, compressed GeoTIFF output (raster_output.py)
 
-# Define mask layer (already loaded in ArcGIS Pro project)
-mask_layer = "AOI_Provinces"
+# Define mask layer (already loaded in ArcGIS Pro project; outside the project,
+# e.g. from run_pipeline.py, set it to the AOI feature class path)
+mask_layer = setting("chirps_clip", "mask_layer", "AOI_Provinces")
 
 # Define desired resolution (250 m in degrees ≈ 0.00225)
-target_cell_size = "250"
+target_cell_size = setting("chirps_clip", "target_cell_size", "250")
 
 # Optional: use NDVI raster to align pixels
-snap_raster = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\NDVI_2020_02_18.tif"
+snap_raster = setting("chirps_clip", "snap_raster", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\NDVI_2020_02_18.tif")
 arcpy.env.snapRaster = snap_raster
 
-# Loop over all .tif rasters
-for raster in arcpy.ListRasters("*.tif"):
+# Inputs and parameters that every clipped raster depends on
+clip_params = {"cell_size": target_cell_size, "resampling": "BILINEAR", "mask": mask_layer}
+
+
+def plan(manifest):
+    """Names of the .tif rasters that are new or changed."""
+    items = []
+    for raster in arcpy.ListRasters("*.tif"):
+        clipped_path = os.path.join(clipped_folder, f"clip_{raster}")
+        inputs = [os.path.join(input_folder, raster), snap_raster]
+        if not manifest.is_current(clipped_path, inputs, clip_params):
+            items.append(raster)
+    return items
+
+
+def process(raster):
     print(f"Processing {raster}...")
 
     # Set paths
@@ -42,7 +61,7 @@ for raster in arcpy.ListRasters("*.tif"):
 
     # Step 1: Resample to 250 m (approx.)
     arcpy.management.Resample(
-        in_raster=raster,
+        in_raster=os.path.join(input_folder, raster),
         out_raster=resampled_path,
         cell_size=target_cell_size,
         resampling_type="BILINEAR"
@@ -53,5 +72,9 @@ for raster in arcpy.ListRasters("*.tif"):
     masked.save(clipped_path)
 
     print(f"Saved: {clipped_path}")
+    return [(clipped_path, [os.path.join(input_folder, raster), snap_raster], clip_params)], None
+
 
-print("All rasters processed successfully.")
+if __name__ == "__main__":
+    run_standalone(plan, process)
+    print("All rasters processed successfully.")
@@ -1,26 +1,56 @@
 import os
-import gzip
-import shutil
+from chirps_archive import extract, is_extracted
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # Paths
-input_dir = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps"
-output_dir = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Chirps_Extracted"
+input_dir = setting("chirps_extract", "input_dir", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps")
+output_dir = setting("chirps_extract", "output_dir", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Chirps_Extracted")
+
+# "files":  extract every new or changed archive to output_dir
+# "stream": write nothing; spi_calculation.py (aligned/native mode) reads the
+#           .tif.gz archives in place when native_chirps_folder points at them
+extract_mode = setting("chirps_extract", "extract_mode", "files")
+
+# Worker processes when run on its own (None = all cores, 1 = serial)
+n_workers = setting("chirps_extract", "n_workers", None)
 
 # Create output directory if it doesn't exist
 os.makedirs(output_dir, exist_ok=True)
 
-# Loop through all .gz files in input directory
-for filename in os.listdir(input_dir):
-    if filename.endswith(".gz"):
-        gz_path = os.path.join(input_dir, filename)
 
-        # Extract base name for output .tif file
-        tif_filename = filename[:-3]  # remove .gz extension
-        tif_path = os.path.join(output_dir, tif_filename)
+def plan(manifest):
+    """(gz_path, tif_path) of every .gz archive that is new or changed."""
+    if extract_mode == "stream":
+        print("Stream mode: archives are read in place, nothing to extract.")
+        return []
+    items = []
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.endswith(".gz"):
+            gz_path = os.path.join(input_dir, filename)
+
+            # Extract base name for output .tif file
+            tif_filename = filename[:-3]  # remove .gz extension
+            tif_path = os.path.join(output_dir, tif_filename)
+            if manifest.is_current(tif_path, [gz_path]):
+                continue
+            # Complete extraction not in the manifest yet (gzip size + mtime): adopt it
+            if is_extracted(gz_path, tif_path):
+                manifest.record(tif_path, [gz_path])
+                continue
+            items.append((gz_path, tif_path))
+    return items
+
+
+def process(item):
+    gz_path, tif_path = item
+
+    # Extract .tif from .gz (streamed, renamed into place when complete)
+    size = extract(gz_path, tif_path)
+    print(f"Extracted {os.path.basename(tif_path)} ({size / 1e6:.1f} MB)")
+    return [(tif_path, [gz_path], None)], None
 
-        # Extract .tif from .gz
-        with gzip.open(gz_path, 'rb') as f_in:
-            with open(tif_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
 
-print("Extraction complete. All .tif files saved to:", output_dir)
\ No newline at end of file
+if __name__ == "__main__":
+    run_standalone(plan, process, workers=n_workers)
+    print("Extraction complete. All .tif files saved to:", output_dir)
@@ -1,123 +1,175 @@
-import arcpy
 import os
 import re
 import csv
-from arcpy.sa import *
+import rasterio
+from zonal_engine import load_zone_index, exceedance_counts
+from zonal_coverage import load_coverage, coverage_exceedance
+from row_writer import open_row_writer
+from drought_frequency import EverAffectedAccumulator
+from raster_catalog import catalog_files
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # ---------------- CONFIG ----------------
-arcpy.CheckOutExtension("Spatial")
-arcpy.env.overwriteOutput = True
-
 # Folder with zscore rasters
-z_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\NDVI_Anomalies"
-
-# Zone layer (corregimientos)
-zone_fc = "AOI_Corregimientos"
-zone_id_field = "OBJECTID"         # Adjust
-zone_name_field = "Corregimie"   # Adjust
-
-# CSV outputs
-csv_per_raster = os.path.join(z_folder, "z_exceed_by_raster_corregimiento.csv")
+z_folder = setting("drought_affected", "z_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\NDVI_Anomalies")
+
+# Zone layer (corregimientos, exported from the project)
+zone_fc = setting("drought_affected", "zone_fc", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Boundaries\AOI_Corregimientos.shp")
+# ID field; OBJECTID / FID are taken from the feature ID when the layer has no
+# such attribute (a shapefile export only has the implicit 0-based FID, so its
+# OBJECTID is FID + 1, as in the geodatabase feature class)
+zone_id_field = setting("drought_affected", "zone_id_field", "OBJECTID")         # Adjust
+zone_name_field = setting("drought_affected", "zone_name_field", "Corregimie")   # Adjust
+
+# Zone index raster (rasterized once onto the z-score grid and cached)
+zone_index_tif = os.path.join(z_folder, "zone_index_corregimientos.tif")
+
+# Pixel weighting:
+# "centre"   -> pixel belongs to the zone containing its centre (as ArcGIS)
+# "coverage" -> pixels weighted by the fraction of their area inside the zone
+#               (zonal_coverage.py); pixel columns are then weighted pixel counts
+zonal_weighting = setting("drought_affected", "zonal_weighting", "centre")
+coverage_npz = os.path.join(z_folder, "coverage_corregimientos.npz")
+
+# Per-raster output: "csv" or "parquet" (needs pyarrow); summary is always CSV
+out_format = setting("drought_affected", "out_format", "csv")
+out_per_raster = os.path.join(z_folder, "z_exceed_by_raster_corregimiento." + ("parquet" if out_format == "parquet" else "csv"))
 csv_summary = os.path.join(z_folder, "z_exceed_summary_by_corregimiento.csv")
 
-# Thresholds
-thr1 = 2.0
-thr2 = 3.0
-
-# ---------------- LOAD RASTERS ----------------
-arcpy.env.workspace = z_folder
-z_rasters = arcpy.ListRasters("zscore_*.tif") or []
-if len(z_rasters) == 0:
-    raise SystemExit("No zscore rasters found in folder: " + z_folder)
-
-# Prepare CSV header for per-raster file
-with open(csv_per_raster, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["raster_name", "date_yyyy_mm_dd", zone_id_field, zone_name_field,
-                     "pixels_zone_total", f"pixels_abs_gt_{thr1}", f"pct_abs_gt_{thr1}",
-                     f"pixels_abs_gt_{thr2}", f"pct_abs_gt_{thr2}"])
-
-# Dictionary for cumulative stats
-agg = {}
-
-# Preload zone names
-zone_names = {}
-with arcpy.da.SearchCursor(zone_fc, [zone_id_field, zone_name_field]) as cur:
-    for r in cur:
-        zone_names[r[0]] = r[1]
-
-# ---------------- MAIN LOOP ----------------
-for zname in sorted(z_rasters):
-    print("Processing:", zname)
-    zpath = os.path.join(z_folder, zname)
-
-    # Extract date from filename (pattern with YYYY_MM_DD)
-    match = re.search(r"(\d{4}_\d{2}_\d{2})", zname)
-    date_str = match.group(1) if match else ""
-
-    zr = Raster(zpath)
-
-    # Binary masks in memory
-    bin_gt2 = Con(Abs(zr) > thr1, 1, 0)
-    bin_gt3 = Con(Abs(zr) > thr2, 1, 0)
-
-    # Count total pixels
-    count_table = "in_memory\\count_table"
-    ZonalStatisticsAsTable(zone_fc, zone_id_field, zr, count_table, "DATA", "MEAN")
-
-    # Count exceedance pixels
-    sum2_table = "in_memory\\sum2_table"
-    sum3_table = "in_memory\\sum3_table"
-    ZonalStatisticsAsTable(zone_fc, zone_id_field, bin_gt2, sum2_table, "DATA", "SUM")
-    ZonalStatisticsAsTable(zone_fc, zone_id_field, bin_gt3, sum3_table, "DATA", "SUM")
-
-    # Helper to read tables into dicts
-    def table_to_dict(table_path, key_field, value_field):
-        d = {}
-        with arcpy.da.SearchCursor(table_path, [key_field, value_field]) as cursor:
-            for row in cursor:
-                d[row[0]] = row[1]
-        return d
-
-    counts = table_to_dict(count_table, zone_id_field, "COUNT")
-    sum2 = table_to_dict(sum2_table, zone_id_field, "SUM")
-    sum3 = table_to_dict(sum3_table, zone_id_field, "SUM")
-
-    # Append per-zone results to CSV
-    with open(csv_per_raster, 'a', newline='', encoding='utf-8') as f:
+# Drought-frequency maps (months with |z| > thr per pixel)
+freq_folder = os.path.join(z_folder, "Drought_Frequency")
+os.makedirs(freq_folder, exist_ok=True)
+
+# Thresholds on |z| (any number); negative and positive anomalies are also reported separately
+thresholds = setting("drought_affected", "thresholds", [2.0, 3.0])
+
+# Per-raster columns
+columns = ["raster_name", "date_yyyy_mm_dd", zone_id_field, zone_name_field, "pixels_zone_total"]
+for thr in thresholds:
+    columns += [f"pixels_abs_gt_{thr}", f"pct_abs_gt_{thr}",
+                f"pixels_lt_neg_{thr}", f"pct_lt_neg_{thr}",
+                f"pixels_gt_pos_{thr}", f"pct_gt_pos_{thr}"]
+
+run_params = {"thresholds": thresholds, "format": out_format, "weighting": zonal_weighting}
+
+
+def pct(part, total):
+    return round(part / total * 100.0, 3) if total > 0 else 0.0
+
+
+def pixels(value):
+    """Pixel count as written: whole pixels, or weighted pixels with coverage weighting."""
+    return round(float(value), 3) if zonal_weighting == "coverage" else int(value)
+
+
+def table_inputs(z_rasters):
+    """The z rasters plus the zone layer: the inputs of both tables."""
+    return [os.path.join(z_folder, z) for z in z_rasters] + [zone_fc, os.path.splitext(zone_fc)[0] + ".dbf"]
+
+
+def write_tables(z_rasters):
+    # Dictionary for cumulative stats
+    agg = {}
+
+    # Preload zones (index raster or coverage table on the z-score grid) and names
+    ref_raster = os.path.join(z_folder, sorted(z_rasters)[0])
+    fields = [zone_id_field, zone_name_field]
+    if zonal_weighting == "coverage":
+        zones = load_coverage(zone_fc, ref_raster, coverage_npz, fields)
+        exceedance = coverage_exceedance
+    else:
+        zones = load_zone_index(zone_fc, ref_raster, zone_index_tif, fields)
+        exceedance = exceedance_counts
+
+    # Per-pixel exceedance history (bit per pixel + months count) on the zone grid
+    with rasterio.open(ref_raster) as src0:
+        ref_meta = src0.meta.copy()
+    history = EverAffectedAccumulator(zones.height, zones.width, thresholds, max_months=len(z_rasters))
+
+    # ---------------- MAIN LOOP ----------------
+    with open_row_writer(out_per_raster, columns, out_format) as writer:
+        for zname in sorted(z_rasters):
+            print("Processing:", zname)
+            zpath = os.path.join(z_folder, zname)
+
+            # Extract date from filename (pattern with YYYY_MM_DD)
+            match = re.search(r"(\d{4}_\d{2}_\d{2})", zname)
+            date_str = match.group(1) if match else ""
+
+            # Valid pixels and negative/positive exceedance counts for all thresholds in one read
+            count, neg, pos = exceedance(zpath, zones, thresholds, accumulator=history)
+
+            for i, attrs in enumerate(zones.table):
+                total_pix = pixels(count[i])
+                if total_pix == 0:
+                    continue
+                zid = attrs[zone_id_field]
+                row = [zname, date_str, zid, attrs[zone_name_field], total_pix]
+                if zid not in agg:
+                    agg[zid] = {"name": attrs[zone_name_field], "total_pixels": 0, "months_counted": 0,
+                                "sum_gt": {thr: 0 for thr in thresholds}}
+                for thr in thresholds:
+                    pix_neg = pixels(neg[thr][i])
+                    pix_pos = pixels(pos[thr][i])
+                    pix_abs = pixels(neg[thr][i] + pos[thr][i])
+                    row += [pix_abs, pct(pix_abs, total_pix), pix_neg, pct(pix_neg, total_pix),
+                            pix_pos, pct(pix_pos, total_pix)]
+                    agg[zid]["sum_gt"][thr] += pix_abs
+                writer.write(row)
+
+                # Update cumulative stats
+                agg[zid]["total_pixels"] += total_pix
+                agg[zid]["months_counted"] += 1
+
+    # ---------------- FREQUENCY MAPS ----------------
+    history.write_frequency(lambda thr: os.path.join(freq_folder, f"months_abs_gt_{thr:g}.tif"), ref_meta)
+
+    # True "ever affected": share of the zone's observed pixels with |z| > thr in at least one month
+    if zonal_weighting == "coverage":
+        ever_valid, ever_hit = history.coverage_summary(zones.weights)
+    else:
+        ever_valid, ever_hit = history.zone_summary(zones.zones, zones.n_zones)
+    zone_pos = {attrs[zone_id_field]: i for i, attrs in enumerate(zones.table)}
+
+    # ---------------- SUMMARY CSV ----------------
+    with open(csv_summary, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        for zid, total_pix in counts.items():
-            pix_gt2 = int(sum2.get(zid, 0) or 0)
-            pix_gt3 = int(sum3.get(zid, 0) or 0)
-            pct2 = (pix_gt2 / total_pix * 100.0) if total_pix and total_pix > 0 else 0.0
-            pct3 = (pix_gt3 / total_pix * 100.0) if total_pix and total_pix > 0 else 0.0
-            writer.writerow([zname, date_str, zid, zone_names.get(zid, ""), int(total_pix),
-                             pix_gt2, round(pct2, 3), pix_gt3, round(pct3, 3)])
-
-            # Update cumulative stats
-            if zid not in agg:
-                agg[zid] = {"name": zone_names.get(zid, ""), "total_pixels": 0,
-                            "sum_gt2": 0, "sum_gt3": 0, "months_counted": 0}
-            agg[zid]["total_pixels"] += int(total_pix)
-            agg[zid]["sum_gt2"] += pix_gt2
-            agg[zid]["sum_gt3"] += pix_gt3
-            agg[zid]["months_counted"] += 1
-
-# ---------------- SUMMARY CSV ----------------
-with open(csv_summary, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow([zone_id_field, zone_name_field, "months_counted",
-                     "avg_pct_gt2_per_month", "avg_pct_gt3_per_month",
-                     "pct_area_ever_gt2", "pct_area_ever_gt3"])
-    for zid, info in agg.items():
-        months = info["months_counted"]
-        avg_pct2 = (info["sum_gt2"] / info["total_pixels"] * 100.0) / months if info["total_pixels"] > 0 else 0.0
-        avg_pct3 = (info["sum_gt3"] / info["total_pixels"] * 100.0) / months if info["total_pixels"] > 0 else 0.0
-        pct_ever2 = (info["sum_gt2"] / info["total_pixels"] * 100.0) if info["total_pixels"] > 0 else 0.0
-        pct_ever3 = (info["sum_gt3"] / info["total_pixels"] * 100.0) if info["total_pixels"] > 0 else 0.0
-        writer.writerow([zid, info["name"], months, round(avg_pct2, 3), round(avg_pct3, 3),
-                         round(pct_ever2, 3), round(pct_ever3, 3)])
-
-print("✅ Done")
-print("Per-raster CSV:", csv_per_raster)
-print("Summary CSV:", csv_summary)
+        writer.writerow([zone_id_field, zone_name_field, "months_counted"]
+                        + [f"avg_pct_gt{thr:g}_per_month" for thr in thresholds]
+                        + [f"pct_area_ever_gt{thr:g}" for thr in thresholds])
+        for zid, info in agg.items():
+            months = info["months_counted"]
+            total = info["total_pixels"]
+            i = zone_pos[zid]
+            avg_pcts = [round((info["sum_gt"][thr] / total * 100.0) / months, 3) if total > 0 else 0.0
+                        for thr in thresholds]
+            ever_pcts = [pct(pixels(ever_hit[thr][i]), pixels(ever_valid[i])) for thr in thresholds]
+            writer.writerow([zid, info["name"], months] + avg_pcts + ever_pcts)
+
+
+# ---------------- STAGE: ONE ITEM, ALL Z RASTERS ----------------
+def plan(manifest):
+    # Skip the whole run when no z raster, zone layer or setting changed since the last one
+    z_rasters = sorted(os.path.basename(p) for p in catalog_files("zscore", z_folder))
+    if len(z_rasters) == 0:
+        raise SystemExit("No zscore rasters found in folder: " + z_folder)
+    inputs = table_inputs(z_rasters)
+    if all(manifest.is_current(p, inputs, run_params) for p in (out_per_raster, csv_summary)):
+        print("Exceedance tables are up to date:", csv_summary)
+        return []
+    return [z_rasters]
+
+
+def process(z_rasters):
+    write_tables(z_rasters)
+    print("✅ Done")
+    print("Per-raster table:", out_per_raster)
+    print("Summary CSV:", csv_summary)
+    print("Frequency maps:", freq_folder)
+    inputs = table_inputs(z_rasters)
+    return [(p, inputs, run_params) for p in (out_per_raster, csv_summary)], None
+
+
+if __name__ == "__main__":
+    run_standalone(plan, process)
@@ -1,123 +1,189 @@
-import arcpy
-from arcpy.sa import *
 import os
-import re
-import numpy as np
 import csv
-
-arcpy.CheckOutExtension("Spatial")
-arcpy.env.overwriteOutput = True
+from ndvi_indices import write_indices
+from raster_stats import StreamingStats
+from raster_catalog import catalog_entries
+from aoi_pixels import shared_aoi, aoi_inputs
+from compute_vci import out_vci_folder, hist_start, hist_end
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # ----------------- CONFIG -----------------
-input_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real"
-z_output_folder = os.path.join(input_folder, "NDVI_Anomalies")        # raw z-score (already created by your workflow)
-vis_folder = os.path.join(input_folder, "NDVI_Anomalies_Vis")            # clipped-for-display rasters
-summary_csv = os.path.join(input_folder, "NDVI_zscore_summary.csv")
+input_folder = setting("anomaly", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real")
+stats_folder = setting("anomaly", "stats_folder", os.path.join(input_folder, "NDVI_Historical_Stats_v2"))   # NDVI_mean_MM / NDVI_std_MM from compute_vci.py
+z_output_folder = setting("anomaly", "z_output_folder", os.path.join(input_folder, "NDVI_Anomalies"))        # raw z-score
+vis_folder = setting("anomaly", "vis_folder", os.path.join(input_folder, "NDVI_Anomalies_Vis"))            # clipped-for-display rasters
+summary_csv = setting("anomaly", "summary_csv", os.path.join(input_folder, "NDVI_zscore_summary.csv"))
+# Exceedance flags per raster (uint8, bits |z| > threshold1 / threshold2 by sign; None = not written)
+flags_folder = setting("anomaly", "flags_folder", os.path.join(input_folder, "NDVI_Exceedance"))
+
+# Fused indices (ndvi_indices.py): the VCI of the target dates ([vci] years
+# outside the baseline) is written from the same NDVI block read as the
+# z-score, so the separate vci stage is not run (pipeline.py)
+fused_vci = setting("anomaly", "fused_vci", True)
 
 os.makedirs(z_output_folder, exist_ok=True)
 os.makedirs(vis_folder, exist_ok=True)
+if flags_folder:
+    os.makedirs(flags_folder, exist_ok=True)
+
+# Stability mask: no z-score where the baseline std is not above this value
+min_std = setting("anomaly", "min_std", 0.1)
+
+# Output nodata
+nodata = setting("anomaly", "nodata", -9999.0)
 
 # Visualization clipping limits
-min_vis = -5.0
-max_vis = 5.0
+min_vis = setting("anomaly", "min_vis", -5.0)
+max_vis = setting("anomaly", "max_vis", 5.0)
 
 # Thresholds for counts
-threshold1 = 2.0
-threshold2 = 3.0
+threshold1 = setting("anomaly", "threshold1", 2.0)
+threshold2 = setting("anomaly", "threshold2", 3.0)
 
-# ---------- Helper: compute stats and produce clipped visualization ----------
-def summarize_and_clip(z_raster_path, vis_out_path):
+# Histogram used for median/percentiles (z range and bin width)
+hist_range = (-10.0, 10.0)
+hist_bin_width = 0.001
+
+# ---------- Helper: summary row from streamed stats ----------
+def summarize_zscore(z_raster_path, stats):
     """
-    Given a z-score raster path, compute stats and save a clipped visualization raster.
-    Returns a dict with summary stats.
+    Build the summary row of a z-score raster from the StreamingStats filled
+    while it was written. Returns None if there are no valid pixels.
     """
-    # Load raster
-    z_r = Raster(z_raster_path)
-
-    # Convert raster to numpy array (preserves NoData as provided)
-    arr = arcpy.RasterToNumPyArray(z_r, nodata_to_value=np.nan)
-
-    # Mask invalid values (nan)
-    valid_mask = ~np.isnan(arr)
-    valid_vals = arr[valid_mask]
-
-    # If no valid pixels, return None
-    if valid_vals.size == 0:
+    if stats.count == 0:
         return None
 
-    # Basic stats
-    min_val = float(np.nanmin(valid_vals))
-    max_val = float(np.nanmax(valid_vals))
-    mean_val = float(np.nanmean(valid_vals))
-    median_val = float(np.nanmedian(valid_vals))
-    p5 = float(np.nanpercentile(valid_vals, 5))
-    p95 = float(np.nanpercentile(valid_vals, 95))
-
-    # Percent of valid pixels with |Z| > thresholds
-    pct_gt_thr1 = 100.0 * np.sum(np.abs(valid_vals) > threshold1) / valid_vals.size
-    pct_gt_thr2 = 100.0 * np.sum(np.abs(valid_vals) > threshold2) / valid_vals.size
-
-    # Create visualization raster: clip to min_vis..max_vis for display
-    # Use Con with Raster objects to preserve geotransform & metadata
-    z_r_astype = z_r  # already Raster
-    clipped = Con(z_r_astype < min_vis, min_vis, Con(z_r_astype > max_vis, max_vis, z_r_astype))
-
-    # Save visualization raster
-    clipped.save(vis_out_path)
-
     out = {
         "raster": os.path.basename(z_raster_path),
-        "min": min_val,
-        "max": max_val,
-        "mean": mean_val,
-        "median": median_val,
-        "p5": p5,
-        "p95": p95,
-        f"pct_abs_gt_{threshold1}": pct_gt_thr1,
-        f"pct_abs_gt_{threshold2}": pct_gt_thr2,
-        "valid_pixels": int(valid_vals.size)
+        "min": stats.min,
+        "max": stats.max,
+        "mean": stats.mean,
+        "median": stats.percentile(50),
+        "p5": stats.percentile(5),
+        "p95": stats.percentile(95),
+        f"pct_abs_gt_{threshold1}": stats.pct_exceed(threshold1),
+        f"pct_abs_gt_{threshold2}": stats.pct_exceed(threshold2),
+        "valid_pixels": int(stats.count)
     }
     return out
 
-# --------------- Main loop ---------------
-pattern = re.compile(r"zscore_real_clipped_NDVI_\d{4}_\d{2}_\d{2}\.tif", re.IGNORECASE)
+# --------------- Rasters ---------------
+anomaly_params = {"min_std": min_std, "vis": [min_vis, max_vis], "nodata": nodata}
 
-summaries = []
 
-arcpy.env.workspace = z_output_folder
-rasters = arcpy.ListRasters("zscore_*.tif") or []
-
-if len(rasters) == 0:
-    # Try fallback: search in input folder
-    arcpy.env.workspace = input_folder
-    rasters = arcpy.ListRasters("zscore_*.tif") or []
-
-if len(rasters) == 0:
-    raise Exception("No zscore rasters found. Check the filename pattern and folder paths.")
-
-for rastname in rasters:
-    z_path = os.path.join(arcpy.env.workspace, rastname)
-    vis_name = f"vis_{rastname}"
-    vis_out = os.path.join(vis_folder, vis_name)
-
-    print(f"Processing summary & visualization for {rastname} ...")
-    info = summarize_and_clip(z_path, vis_out)
+def anomaly_jobs():
+    """
+    (ndvi, mean, std, z, vis, flags, vci) of every NDVI raster whose month has a
+    baseline, in date order; flags is None without flags_folder, vci is
+    (min, max, VCI path) for the fused VCI of a target date, else None.
+    """
+    ndvi_files = catalog_entries("ndvi", input_folder)
+    if len(ndvi_files) == 0:
+        raise Exception("No NDVI rasters found. Check the filename pattern and folder paths.")
+
+    jobs = []
+    for ndvi_path, year, m, day in ndvi_files:
+        rastname = os.path.basename(ndvi_path)
+        month = f"{m:02d}"
+        mean_path = os.path.join(stats_folder, f"NDVI_mean_{month}.tif")
+        std_path = os.path.join(stats_folder, f"NDVI_std_{month}.tif")
+        if not os.path.exists(mean_path) or not os.path.exists(std_path):
+            print("Missing mean/std for month", month, "skip", rastname)
+            continue
+
+        z_name = f"zscore_{rastname}"
+        z_path = os.path.join(z_output_folder, z_name)
+        vis_out = os.path.join(vis_folder, f"vis_{z_name}")
+        flags_out = os.path.join(flags_folder, f"flags_{z_name}") if flags_folder else None
+        vci = None
+        if fused_vci and not hist_start <= year <= hist_end:
+            min_path = os.path.join(stats_folder, f"NDVI_min_{month}.tif")
+            max_path = os.path.join(stats_folder, f"NDVI_max_{month}.tif")
+            if os.path.exists(min_path) and os.path.exists(max_path):
+                vci = (min_path, max_path, os.path.join(out_vci_folder, f"VCI_{year}_{month}_{day:02d}.tif"))
+            else:
+                print("Missing min/max for month", month, "no VCI for", rastname)
+        jobs.append((ndvi_path, mean_path, std_path, z_path, vis_out, flags_out, vci))
+    return jobs
+
+
+def previous_rows():
+    """Rows of the previous summary, reused for rasters that are up to date."""
+    if not os.path.exists(summary_csv):
+        return {}
+    with open(summary_csv, newline='') as csvfile:
+        return {row["raster"]: row for row in csv.DictReader(csvfile)}
+
+
+# --------------- Stage: one item per NDVI raster ---------------
+def plan(manifest):
+    previous = previous_rows()
+    items = []
+    for job in anomaly_jobs():
+        if os.path.basename(job[3]) in previous and \
+                all(manifest.is_current(*record) for record in job_records(job)):
+            continue
+        items.append(job)
+    return items
+
+
+def job_records(job):
+    """
+    (output, inputs, params) of every raster a job writes, the z-score first.
+    Cells outside the AOI mask are nodata in packed mode: the mask is an input.
+    """
+    ndvi_path, mean_path, std_path, z_path, vis_out, flags_out, vci = job
+    mask_inputs = aoi_inputs()
+    inputs = [ndvi_path, mean_path, std_path] + mask_inputs
+    records = [(p, inputs, anomaly_params) for p in (z_path, vis_out, flags_out) if p]
+    if vci:
+        records.append((vci[2], [ndvi_path, vci[0], vci[1]] + mask_inputs, None))
+    return records
+
+
+def process(job):
+    ndvi_path, mean_path, std_path, z_path, vis_out, flags_out, vci = job
+    print(f"Computing z-score & visualization{' & VCI' if vci else ''} for {os.path.basename(ndvi_path)} ...")
+    stats = StreamingStats((threshold1, threshold2), *hist_range, bin_width=hist_bin_width)
+    # One read of the NDVI and baseline blocks for every index
+    write_indices(ndvi_path, mean_path, std_path, z_path, vis_out, nodata, vci=vci, flags_path=flags_out,
+                  min_std=min_std, min_vis=min_vis, max_vis=max_vis, thresholds=(threshold1, threshold2),
+                  stats=stats, aoi=shared_aoi())
+
+    info = summarize_zscore(z_path, stats)
     if info:
-        summaries.append(info)
         print(f"  min {info['min']:.3f}  max {info['max']:.3f}  mean {info['mean']:.3f}  pct>|{threshold1}| {info[f'pct_abs_gt_{threshold1}']:.2f}%")
     else:
         print("  No valid pixels in raster; skipped.")
+    return job_records(job), info
+
+
+def finish(manifest, results):
+    # New rows plus the previous rows of the rasters that were up to date, in date order
+    new_rows = {info["raster"]: info for info in results if info}
+    previous = previous_rows()
+    summaries = []
+    for job in anomaly_jobs():
+        z_name = os.path.basename(job[3])
+        if z_name in new_rows:
+            summaries.append(new_rows[z_name])
+        elif z_name in previous and manifest.is_current(*job_records(job)[0]):
+            summaries.append(previous[z_name])
+
+    # Save summaries to CSV
+    if summaries:
+        keys = list(summaries[0].keys())
+        with open(summary_csv, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, keys)
+            writer.writeheader()
+            for row in summaries:
+                writer.writerow(row)
+        print(f"\nSummary CSV saved to: {summary_csv}")
+    else:
+        print("No summaries to write.")
+
 
-# Save summaries to CSV
-if summaries:
-    keys = list(summaries[0].keys())
-    with open(summary_csv, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, keys)
-        writer.writeheader()
-        for row in summaries:
-            writer.writerow(row)
-    print(f"\nSummary CSV saved to: {summary_csv}")
-else:
-    print("No summaries to write.")
-
-print("\nDone.")
\ No newline at end of file
+if __name__ == "__main__":
+    run_standalone(plan, process, finish)
+    print("\nDone.")
@@ -1,13 +1,16 @@
 import arcpy
 import os
 from arcpy.sa import ExtractByMask
+from raster_output import set_arcpy_output_env
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # Enable Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
 
 # Set workspace and output folder
-input_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF"
-output_folder = os.path.join(input_folder, "Clipped_NDVI")
+input_folder = setting("ndvi_clip", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF")
+output_folder = setting("ndvi_clip", "output_folder", os.path.join(input_folder, "Clipped_NDVI"))
 
 # Create output folder if it doesn't exist
 if not os.path.exists(output_folder):
@@ -16,22 +19,40 @@ if not os.path.exists(output_folder):
 # Set environment settings
 arcpy.env.workspace = input_folder
 arcpy.env.overwriteOutput = True
+set_arcpy_output_env(arcpy)      # tiled, compressed GeoTIFF output (raster_output.py)
 
-# Define the mask layer from the current project
-mask_layer = "AOI_Provinces"
+# Define the mask layer from the current project (outside the project, e.g.
+# from run_pipeline.py, set it to the AOI feature class path)
+mask_layer = setting("ndvi_clip", "mask_layer", "AOI_Provinces")
 
-# Process each .tif file in the folder
-for raster in arcpy.ListRasters("*.tif"):
+
+def plan(manifest):
+    """Names of the .tif rasters that are new or changed."""
+    items = []
+    for raster in arcpy.ListRasters("*.tif"):
+        out_path = os.path.join(output_folder, f"clipped_{raster}")
+        in_path = os.path.join(input_folder, raster)
+        if not manifest.is_current(out_path, [in_path], {"mask": mask_layer}):
+            items.append(raster)
+    return items
+
+
+def process(raster):
     # Build output path
     out_name = f"clipped_{raster}"
     out_path = os.path.join(output_folder, out_name)
+    in_path = os.path.join(input_folder, raster)
 
     # Perform Extract by Mask
-    extracted = ExtractByMask(raster, mask_layer)
+    extracted = ExtractByMask(in_path, mask_layer)
 
     # Save the output
     extracted.save(out_path)
 
     print(f"Extracted: {out_path}")
+    return [(out_path, [in_path], {"mask": mask_layer})], None
+
 
-print("NDVI clipping completed.")
\ No newline at end of file
+if __name__ == "__main__":
+    run_standalone(plan, process)
+    print("NDVI clipping completed.")
@@ -0,0 +1,106 @@
+"""
+NDVI_Monthly_Composite.py
+Renamed MOD13Q1 HDFs (NDVI_YYYY_MM_DD.hdf) -> one real_clipped_NDVI_YYYY_MM_DD.tif
+per month, combining every 16-day composite that overlaps the month
+(modis_periods.py, ndvi_composite.py) with a max-value, mean or day-weighted rule. The HDFs
+are read in place: no monthly_selection copies, no intermediate rasters.
+Replaces NDVI_OneImage_PerMonth.py + NDVI_Preprocess.py.
+Requirements: numpy, gdal (ArcGIS Pro's GDAL reads HDF4)
+Usage: python NDVI_Monthly_Composite.py (or the ndvi_composite stage of run_pipeline.py)
+"""
+
+import os
+from datetime import datetime
+from modis_periods import month_composites
+from ndvi_composite import composite_month
+from ndvi_hdf import ndvi_subdataset, fill_value, valid_range
+from pipeline_config import setting
+from pipeline import run_standalone
+
+# Renamed HDF files (NDVI_name_format.py)
+input_folder = setting("ndvi_composite", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL")
+output_folder = setting("ndvi_composite", "output_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real")
+
+# AOI feature class (shapefile, or geodatabase + layer name)
+aoi_path = setting("ndvi_composite", "aoi_path", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Boundaries\AOI_Provinces.shp")
+aoi_layer = setting("ndvi_composite", "aoi_layer", None)
+
+# Compositing rule:
+#   "max"      -> maximum valid NDVI of the overlapping composites (MVC, as MODIS)
+#   "mean"     -> mean of the valid values
+#   "weighted" -> mean weighted by the days each 16-day period spends in the month
+rule = setting("ndvi_composite", "rule", "max")
+
+# Months covered by fewer days of composites are not written yet (the month
+# at the end of the record, waiting for its next 16-day file)
+min_days = setting("ndvi_composite", "min_days", 16)
+
+# Day of month in the output names (the composite stands for the whole month)
+name_day = setting("ndvi_composite", "name_day", 15)
+
+# Subdataset name and MODIS NDVI scale factor
+subdataset = setting("ndvi_composite", "subdataset", ndvi_subdataset)
+scale_factor = setting("ndvi_composite", "scale_factor", 10000.0)
+nodata = setting("ndvi_composite", "nodata", -9999.0)   # float32 storage only
+
+# "int16": MODIS integers + scale metadata (half the bytes); "float32": NDVI values
+storage = setting("ndvi_composite", "storage", "int16")
+
+# Rows of the AOI window combined at a time
+block_rows = setting("ndvi_composite", "block_rows", 256)
+
+os.makedirs(output_folder, exist_ok=True)
+
+composite_params = {"rule": rule, "subdataset": subdataset, "aoi": [aoi_path, aoi_layer],
+                    "scale": scale_factor, "fill": fill_value, "valid_range": list(valid_range),
+                    "nodata": nodata, "storage": storage}
+
+
+def aoi_inputs():
+    """AOI files whose content the outputs depend on (a geodatabase is tracked by the params only)."""
+    if not os.path.isfile(aoi_path):
+        return []
+    stem = os.path.splitext(aoi_path)[0]
+    return [p for p in (aoi_path, stem + ".shx", stem + ".prj") if os.path.exists(p)]
+
+
+def dated_hdfs():
+    """[(path, start date), ...] of the renamed 16-day HDF files."""
+    files = []
+    for filename in os.listdir(input_folder):
+        if filename.endswith('.hdf') and filename.startswith('NDVI_'):
+            try:
+                start = datetime.strptime(filename[5:-4], '%Y_%m_%d').date()
+            except ValueError as e:
+                print(f"Skipping file {filename}: {e}")
+                continue
+            files.append((os.path.join(input_folder, filename), start))
+    return files
+
+
+def plan(manifest):
+    """(year-month, [(hdf, days in month)], output) of the months that are new or changed."""
+    items = []
+    for (year, month), hdf_days in sorted(month_composites(dated_hdfs()).items()):
+        if sum(days for _, days in hdf_days) < min_days:
+            print(f"{year}-{month:02d}: only {sum(d for _, d in hdf_days)} days of composites, skip")
+            continue
+        out_path = os.path.join(output_folder, f"real_clipped_NDVI_{year}_{month:02d}_{name_day:02d}.tif")
+        inputs = [p for p, _ in hdf_days] + aoi_inputs()
+        if not manifest.is_current(out_path, inputs, composite_params):
+            items.append((f"{year}-{month:02d}", hdf_days, out_path))
+    return items
+
+
+def process(item):
+    ym, hdf_days, out_path = item
+    n_valid = composite_month(hdf_days, aoi_path, out_path, rule=rule, aoi_layer=aoi_layer,
+                              subdataset=subdataset, scale_factor=scale_factor, nodata=nodata,
+                              storage=storage, block_rows=block_rows)
+    print(f"Composite {ym} ({rule} of {len(hdf_days)} files): {out_path} ({n_valid} valid pixels)")
+    return [(out_path, [p for p, _ in hdf_days] + aoi_inputs(), composite_params)], None
+
+
+if __name__ == "__main__":
+    run_standalone(plan, process)
+    print("Monthly NDVI composites completed.")
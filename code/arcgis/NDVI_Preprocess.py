@@ -0,0 +1,70 @@
+"""
+NDVI_Preprocess.py
+Monthly MOD13Q1 HDF -> real_clipped_NDVI_YYYY_MM_DD.tif in one windowed pass
+(ndvi_hdf.py): the NDVI subdataset by name, only the AOI window,
+AOI mask, fill/valid-range handling and scale factor applied in memory.
+Replaces NDVI_ToTIFF.py + NDVI_Clip_GIS.py + NDVI_Real_Convertion.py and
+their two intermediate rasters per date.
+Requirements: numpy, gdal (ArcGIS Pro's GDAL reads HDF4)
+Usage: python NDVI_Preprocess.py (or the ndvi_preprocess stage of run_pipeline.py)
+"""
+
+import os
+from ndvi_hdf import preprocess_ndvi, ndvi_subdataset, fill_value, valid_range
+from pipeline_config import setting
+from pipeline import run_standalone
+
+# Monthly HDF selection (NDVI_OneImage_PerMonth.py)
+input_folder = setting("ndvi_preprocess", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\monthly_selection")
+output_folder = setting("ndvi_preprocess", "output_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real")
+
+# AOI feature class (shapefile, or geodatabase + layer name)
+aoi_path = setting("ndvi_preprocess", "aoi_path", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Boundaries\AOI_Provinces.shp")
+aoi_layer = setting("ndvi_preprocess", "aoi_layer", None)
+
+# Subdataset name and MODIS NDVI scale factor
+subdataset = setting("ndvi_preprocess", "subdataset", ndvi_subdataset)
+scale_factor = setting("ndvi_preprocess", "scale_factor", 10000.0)
+nodata = setting("ndvi_preprocess", "nodata", -9999.0)   # float32 storage only
+
+# "int16": MODIS integers + scale metadata (half the bytes); "float32": NDVI values
+storage = setting("ndvi_preprocess", "storage", "int16")
+
+os.makedirs(output_folder, exist_ok=True)
+
+preprocess_params = {"subdataset": subdataset, "aoi": [aoi_path, aoi_layer], "scale": scale_factor,
+                     "fill": fill_value, "valid_range": list(valid_range), "nodata": nodata,
+                     "storage": storage}
+
+
+def aoi_inputs():
+    """AOI files whose content the outputs depend on (a geodatabase is tracked by the params only)."""
+    if not os.path.isfile(aoi_path):
+        return []
+    stem = os.path.splitext(aoi_path)[0]
+    return [p for p in (aoi_path, stem + ".shx", stem + ".prj") if os.path.exists(p)]
+
+
+def plan(manifest):
+    """(hdf path, output path) of the monthly HDF files that are new or changed."""
+    items = []
+    for filename in sorted(os.listdir(input_folder)):
+        if filename.endswith(".hdf"):
+            hdf_path = os.path.join(input_folder, filename)
+            out_path = os.path.join(output_folder, f"real_clipped_{filename[:-4]}.tif")
+            if not manifest.is_current(out_path, [hdf_path] + aoi_inputs(), preprocess_params):
+                items.append((hdf_path, out_path))
+    return items
+
+
+def process(item):
+    hdf_path, out_path = item
+    n_valid = preprocess_ndvi(hdf_path, aoi_path, out_path, aoi_layer=aoi_layer, subdataset=subdataset,
+                              scale_factor=scale_factor, nodata=nodata, storage=storage)
+    print(f"Saved: {out_path} ({n_valid} valid pixels)")
+    return [(out_path, [hdf_path] + aoi_inputs(), preprocess_params)], None
+
+
+if __name__ == "__main__":
+    run_standalone(plan, process)
+    print("NDVI preprocessing completed.")
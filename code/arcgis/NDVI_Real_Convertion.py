@@ -1,28 +1,52 @@
 import arcpy
 import os
 from arcpy.sa import Raster
+from raster_output import set_arcpy_output_env
+from pipeline_config import setting
+from pipeline import run_standalone
 
 arcpy.CheckOutExtension("Spatial")
 
 # Folder with clipped NDVI rasters (Int16)
-input_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI"
-output_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real"
+input_folder = setting("ndvi_scale", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI")
+output_folder = setting("ndvi_scale", "output_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real")
+
+# MODIS NDVI scale factor
+scale_factor = setting("ndvi_scale", "scale_factor", 10000.0)
 
 if not os.path.exists(output_folder):
     os.makedirs(output_folder)
 
 arcpy.env.workspace = input_folder
 arcpy.env.overwriteOutput = True
+set_arcpy_output_env(arcpy)      # tiled, compressed GeoTIFF output (raster_output.py)
+
+
+def plan(manifest):
+    """Names of the clipped rasters that are new or changed."""
+    items = []
+    for raster in arcpy.ListRasters("*.tif"):
+        out_path = os.path.join(output_folder, f"real_{raster}")
+        in_path = os.path.join(input_folder, raster)
+        if not manifest.is_current(out_path, [in_path], {"scale": scale_factor}):
+            items.append(raster)
+    return items
 
-for raster in arcpy.ListRasters("*.tif"):
+
+def process(raster):
     print(f"Converting {raster}...")
+    in_path = os.path.join(input_folder, raster)
 
-    in_raster = Raster(raster)
-    real_ndvi = in_raster / 10000.0
+    in_raster = Raster(in_path)
+    real_ndvi = in_raster / scale_factor
 
     out_path = os.path.join(output_folder, f"real_{raster}")
     real_ndvi.save(out_path)
 
     print(f"Saved: {out_path}")
+    return [(out_path, [in_path], {"scale": scale_factor})], None
+
 
-print("NDVI conversion completed.")
\ No newline at end of file
+if __name__ == "__main__":
+    run_standalone(plan, process)
+    print("NDVI conversion completed.")
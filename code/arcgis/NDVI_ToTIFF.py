@@ -1,26 +1,49 @@
 import os
+import numpy as np
 from osgeo import gdal
+from raster_output import gdal_creation_options, gdal_finalize
+from pipeline_config import setting
+from pipeline import run_standalone
 
-input_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\monthly_selection"
-output_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF"
+input_folder = setting("ndvi_totiff", "input_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\monthly_selection")
+output_folder = setting("ndvi_totiff", "output_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF")
 
 os.makedirs(output_folder, exist_ok=True)
 
-for filename in os.listdir(input_folder):
-    if filename.endswith(".hdf"):
-        hdf_path = os.path.join(input_folder, filename)
 
-        # Open HDF file
-        hdf_dataset = gdal.Open(hdf_path)
+def plan(manifest):
+    """(hdf path, tif path) of the HDF files not converted yet (or changed)."""
+    items = []
+    for filename in os.listdir(input_folder):
+        if filename.endswith(".hdf"):
+            hdf_path = os.path.join(input_folder, filename)
 
-        # List subdatasets (you'll need to pick the correct one, usually NDVI is first)
-        subdatasets = hdf_dataset.GetSubDatasets()
-        ndvi_subdataset = subdatasets[0][0]  # 0 is usually NDVI for MOD13Q1
+            # Create output path with .tif; skip if already converted from this HDF
+            output_tif = os.path.join(output_folder, filename.replace(".hdf", ".tif"))
+            if not manifest.is_current(output_tif, [hdf_path], {"subdataset": 0}):
+                items.append((hdf_path, output_tif))
+    return items
 
-        # Create output path with .tif
-        output_tif = os.path.join(output_folder, filename.replace(".hdf", ".tif"))
 
-        # Translate to GeoTIFF
-        gdal.Translate(output_tif, ndvi_subdataset)
+def process(item):
+    hdf_path, output_tif = item
 
-        print(f"Converted {filename} to {output_tif}")
+    # Open HDF file
+    hdf_dataset = gdal.Open(hdf_path)
+
+    # List subdatasets (you'll need to pick the correct one, usually NDVI is first)
+    subdatasets = hdf_dataset.GetSubDatasets()
+    ndvi_subdataset = subdatasets[0][0]  # 0 is usually NDVI for MOD13Q1
+
+    # Translate to GeoTIFF (MOD13Q1 NDVI is Int16) with the shared tiled/compressed profile
+    out_ds = gdal.Translate(output_tif, ndvi_subdataset,
+                            creationOptions=gdal_creation_options(np.int16))
+    gdal_finalize(out_ds, resampling="nearest")
+    out_ds = None
+
+    print(f"Converted {os.path.basename(hdf_path)} to {output_tif}")
+    return [(output_tif, [hdf_path], {"subdataset": 0})], None
+
+
+if __name__ == "__main__":
+    run_standalone(plan, process)
@@ -1,25 +1,39 @@
 import os
 from datetime import datetime, timedelta
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # Path where your files are located
-folder_path = 'D:/GIS_Projects/DroughtMonitoring_ArcoSeco/NDVI_Data_2013FEB_2025JUL'
-
-for filename in os.listdir(folder_path):
-    if filename.endswith('.hdf'):
-        parts = filename.split('.')
-        if len(parts) > 1 and parts[1].startswith('A'):
-            julian_str = parts[1][1:]  # remove the 'A'
-            year = int(julian_str[:4])
-            day_of_year = int(julian_str[4:])
-
-            # Convert Julian day to calendar date
-            date = datetime(year, 1, 1) + timedelta(days=day_of_year - 1)
-            date_str = date.strftime('%Y_%m_%d')
-
-            # Construct new filename
-            new_filename = f'NDVI_{date_str}.hdf'
-            old_path = os.path.join(folder_path, filename)
-            new_path = os.path.join(folder_path, new_filename)
-
-            os.rename(old_path, new_path)
-            print(f'Renamed: {filename} -> {new_filename}')
\ No newline at end of file
+folder_path = setting("ndvi_rename", "folder_path", 'D:/GIS_Projects/DroughtMonitoring_ArcoSeco/NDVI_Data_2013FEB_2025JUL')
+
+
+def plan(manifest):
+    """(old path, new path) of every MODIS HDF still named with its Julian date."""
+    items = []
+    for filename in os.listdir(folder_path):
+        if filename.endswith('.hdf'):
+            parts = filename.split('.')
+            if len(parts) > 1 and parts[1].startswith('A'):
+                julian_str = parts[1][1:]  # remove the 'A'
+                year = int(julian_str[:4])
+                day_of_year = int(julian_str[4:])
+
+                # Convert Julian day to calendar date
+                date = datetime(year, 1, 1) + timedelta(days=day_of_year - 1)
+                date_str = date.strftime('%Y_%m_%d')
+
+                # Construct new filename
+                new_filename = f'NDVI_{date_str}.hdf'
+                items.append((os.path.join(folder_path, filename), os.path.join(folder_path, new_filename)))
+    return items
+
+
+def process(item):
+    old_path, new_path = item
+    os.rename(old_path, new_path)
+    print(f'Renamed: {os.path.basename(old_path)} -> {os.path.basename(new_path)}')
+    return [], None
+
+
+if __name__ == "__main__":
+    run_standalone(plan, process)
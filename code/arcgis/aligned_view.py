@@ -0,0 +1,80 @@
+"""
+aligned_view.py
+Virtual alignment layer: any raster (or CHIRPS .tif.gz archive) seen as a
+view on a target grid (the NDVI reference grid, a zone index), reprojected
+and snapped by a rasterio WarpedVRT and masked to the AOI. Nothing is
+written: each read warps only the requested window. Replaces the Resample
+(res_*.tif) + ExtractByMask (clip_*.tif) intermediates of Chirp_Clip_GIS.py.
+Requirements: rasterio, numpy
+Usage: from aligned_view import open_aligned
+"""
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from chirps_archive import archive_path
+from raster_blocks import read_valid
+
+
+class AlignedView:
+    """
+    Read-only view of a raster on a target grid (anything with crs, transform,
+    width and height: a rasterio dataset, zonal_engine.ZoneIndex, datacube.Cube).
+    read() returns float32 with NaN for nodata, for cells outside the source and,
+    when aoi (a rasterio dataset on the grid) is given, for cells that are nodata in aoi.
+    Reads the way rasterio datasets do, so the zonal functions take it as a source.
+    """
+
+    def __init__(self, path, grid, resampling="bilinear", aoi=None):
+        self.src = rasterio.open(archive_path(path))
+        self.name = path
+        self.crs = grid.crs
+        self.transform = grid.transform
+        self.height, self.width = grid.height, grid.width
+        self.nodata = None            # nodata is NaN
+        self.aoi = aoi
+        self.vrt = WarpedVRT(self.src, crs=grid.crs, transform=grid.transform,
+                             width=grid.width, height=grid.height, dtype="float32",
+                             src_nodata=self.src.nodata, nodata=np.nan,
+                             resampling=Resampling[resampling])
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def read(self, indexes=1, window=None, boundless=False, fill_value=None):
+        """Window of the view (float32, NaN = nodata); cells off the grid are NaN."""
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        r0, c0 = int(window.row_off), int(window.col_off)
+        h, w = int(window.height), int(window.width)
+        # Part of the window on the grid (WarpedVRT reads are not boundless)
+        rs, cs = max(r0, 0), max(c0, 0)
+        re_, ce = min(r0 + h, self.height), min(c0 + w, self.width)
+        arr = np.full((h, w), np.nan, dtype=np.float32)
+        if rs < re_ and cs < ce:
+            inner = Window(cs, rs, ce - cs, re_ - rs)
+            block = self.vrt.read(indexes, window=inner)
+            if self.aoi is not None:
+                _, valid = read_valid(self.aoi, inner)
+                block[~valid] = np.nan
+            arr[rs - r0:re_ - r0, cs - c0:ce - c0] = block
+        return arr
+
+    def close(self):
+        self.vrt.close()
+        self.src.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_aligned(path, grid, resampling="bilinear", aoi=None):
+    """AlignedView of path on grid (use as a context manager)."""
+    return AlignedView(path, grid, resampling, aoi)
+
@@ -0,0 +1,181 @@
+"""
+aoi_pixels.py
+Shared AOI validity mask of the NDVI grid and the packed-pixel representation
+built on it. The AOI polygons are rasterized once (cell-centre rule, as
+ExtractByMask) and cached as a mask raster; in packed mode the stages hold
+baselines, SPI parameters and indices as 1-D vectors of the in-AOI cells
+only, read just the AOI bounding window of each raster and scatter back to
+the 2-D grid when writing. Memory and arithmetic shrink with the share of
+the rectangle outside the (irregular) AOI.
+Requirements: rasterio, fiona, numpy
+Usage: from aoi_pixels import shared_aoi, load_aoi_pixels
+"""
+
+import os
+import hashlib
+import numpy as np
+import rasterio
+import fiona
+from rasterio.crs import CRS
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+from raster_blocks import read_scaled, read_valid
+from raster_output import write_meta, finalize, cog_products
+from pipeline_config import setting
+
+# Packed-pixel mode of the baseline, VCI, anomaly and SPI stages (False = 2-D blocks)
+packed_pixels = setting("pipeline", "packed_pixels", False)
+aoi_path = setting("pipeline", "aoi_path", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Boundaries\AOI_Provinces.shp")
+aoi_layer = setting("pipeline", "aoi_layer", None)
+# Raster on the NDVI grid the mask is built on, and the cached mask
+aoi_reference = setting("pipeline", "aoi_reference", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\real_clipped_NDVI_2020_02_15.tif")
+aoi_mask_tif = setting("pipeline", "aoi_mask_tif", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\aoi_mask.tif")
+
+# Files of a shapefile besides the .shp whose edits change the AOI
+shapefile_sidecars = (".shx", ".dbf", ".prj", ".cpg")
+
+
+class AoiPixels:
+    """
+    In-AOI cells of a grid in row-major order. Vectors of length n hold one
+    value per cell; pack / read go from the grid to vectors, unpack / write back.
+    """
+
+    def __init__(self, mask, transform, crs):
+        self.mask = mask
+        self.transform = transform
+        self.crs = crs
+        self.height, self.width = mask.shape
+        self.rows, self.cols = np.nonzero(mask)
+        self.n = len(self.rows)
+        if self.n == 0:
+            raise ValueError("AOI mask has no cells on the grid")
+        # Bounding window of the AOI: the only part of a raster that is read
+        r0, c0 = int(self.rows.min()), int(self.cols.min())
+        self.window = Window(c0, r0, int(self.cols.max()) + 1 - c0, int(self.rows.max()) + 1 - r0)
+        self._flat = (self.rows - r0) * int(self.window.width) + (self.cols - c0)
+
+    @property
+    def fraction(self):
+        """Share of the grid inside the AOI."""
+        return self.n / float(self.height * self.width)
+
+    @property
+    def fingerprint(self):
+        """Short hash of the mask (keys caches of packed vectors)."""
+        return hashlib.sha1(np.packbits(self.mask).tobytes()).hexdigest()[:12]
+
+    def check_grid(self, src):
+        if (src.height, src.width) != (self.height, self.width) or \
+                not src.transform.almost_equals(self.transform):
+            raise ValueError(f"{src.name} is not on the AOI mask grid")
+
+    def pack(self, arr):
+        """Vector(s) of the AOI cells of a (rows, cols) grid or a (..., rows, cols) stack."""
+        return arr[..., self.rows, self.cols]
+
+    def unpack(self, vec, fill, dtype=None):
+        """(rows, cols) grid with vec on the AOI cells and fill elsewhere."""
+        out = np.full((self.height, self.width), fill, dtype=dtype or vec.dtype)
+        out[self.rows, self.cols] = vec
+        return out
+
+    def pack_window(self, arr):
+        """Vector of the AOI cells of an array read at self.window."""
+        return np.take(arr, self._flat)
+
+    def read(self, src, band=1, scaled=True):
+        """AOI cells of a band as float32 (NaN = nodata), from one read of the AOI window."""
+        self.check_grid(src)
+        return self.pack_window(read_scaled(src, self.window, band, scaled))
+
+    def read_valid(self, src, band=1):
+        """AOI cells of a band in storage units and their validity mask."""
+        self.check_grid(src)
+        raw, valid = read_valid(src, self.window, band)
+        return self.pack_window(raw), self.pack_window(valid)
+
+    def write(self, path, vec, meta, nodata):
+        """Scatter vec onto the grid (nodata outside the AOI) and write it with meta (a final product)."""
+        with rasterio.open(path, "w", **meta) as dst:
+            dst.write(self.unpack(vec, nodata, np.dtype(meta["dtype"])), 1)
+        finalize(path, cog=cog_products)
+
+
+def source_mtime(path):
+    """Latest modification of a vector source: a shapefile and its sidecars, or every file of a geodatabase."""
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in os.listdir(path)]
+    else:
+        base = os.path.splitext(path)[0]
+        files = [base + ext for ext in shapefile_sidecars if os.path.exists(base + ext)]
+    return max(os.path.getmtime(f) for f in files + [path])
+
+
+def source_tags(aoi_path, layer):
+    """Tags of the mask raster naming the AOI source it was built from."""
+    return {"aoi_path": os.path.normcase(os.path.abspath(aoi_path)), "aoi_layer": layer or ""}
+
+
+def build_aoi_pixels(aoi_path, ref_path, out_tif, layer=None):
+    """Rasterize the AOI polygons onto the reference grid and cache the mask as out_tif."""
+    with rasterio.open(ref_path) as ref:
+        meta = ref.meta.copy()
+        transform, crs, shape = ref.transform, ref.crs, ref.shape
+
+    shapes = []
+    with fiona.open(aoi_path, layer=layer) as src:
+        src_crs = src.crs_wkt
+        for feat in src:
+            if feat["geometry"] is None:
+                continue
+            geom = feat["geometry"]
+            if crs is not None and src_crs and CRS.from_wkt(src_crs) != crs:
+                geom = transform_geom(src_crs, crs, geom)
+            shapes.append((geom, 1))
+    mask = rasterize(shapes, out_shape=shape, transform=transform, fill=0, dtype="uint8")
+
+    # Written under a temporary name: stage workers may build the mask at the same time
+    tmp_tif = f"{out_tif}.{os.getpid()}.tmp"
+    with rasterio.open(tmp_tif, "w", **write_meta(meta, dtype="uint8", nodata=0)) as dst:
+        dst.write(mask, 1)
+        dst.update_tags(**source_tags(aoi_path, layer))
+    os.replace(tmp_tif, out_tif)
+    return AoiPixels(mask.astype(bool), transform, crs)
+
+
+def load_aoi_pixels(aoi_path, ref_path, cache_tif, layer=None):
+    """
+    Load the cached AOI mask, rebuilding it when missing, older than any file of
+    the AOI source, built from another source or layer, or on another grid.
+    """
+    if os.path.exists(cache_tif) and os.path.getmtime(cache_tif) >= source_mtime(aoi_path):
+        with rasterio.open(cache_tif) as src, rasterio.open(ref_path) as ref:
+            same_source = all(src.tags().get(k) == v for k, v in source_tags(aoi_path, layer).items())
+            if same_source and src.transform == ref.transform and src.shape == ref.shape and src.crs == ref.crs:
+                return AoiPixels(src.read(1).astype(bool), src.transform, src.crs)
+    print("Building AOI mask:", cache_tif)
+    return build_aoi_pixels(aoi_path, ref_path, cache_tif, layer)
+
+
+_shared = None
+
+
+def shared_aoi():
+    """AoiPixels of the configured AOI on the NDVI grid (loaded once per process), None if not packed."""
+    global _shared
+    if not packed_pixels:
+        return None
+    if _shared is None:
+        _shared = load_aoi_pixels(aoi_path, aoi_reference, aoi_mask_tif, aoi_layer)
+    return _shared
+
+
+def aoi_inputs():
+    """
+    Manifest inputs of a packed output: the AOI mask raster, rebuilt first if
+    the AOI changed, so that its content hash redoes the output after an AOI
+    edit. [] if not packed.
+    """
+    return [aoi_mask_tif] if shared_aoi() is not None else []
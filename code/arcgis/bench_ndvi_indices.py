@@ -0,0 +1,120 @@
+"""
+bench_ndvi_indices.py
+Separate VCI (vci_parallel) + z-score/vis (ndvi_anomaly) passes against the
+fused index kernel (ndvi_indices.write_indices, which also writes the
+exceedance flags): bytes decoded, wall time and peak Python-heap memory of
+the target dates of a synthetic scaled Int16 NDVI stack written to a temp
+folder. Also checks that both write the same VCI, z-score and vis rasters.
+Requirements: rasterio, numpy
+Usage: python bench_ndvi_indices.py
+"""
+
+import io
+import os
+import time
+import shutil
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from ndvi_baseline import accumulate_baseline, write_baseline, baseline_paths
+from ndvi_anomaly import write_zscore
+from ndvi_indices import write_indices
+from vci_parallel import compute_vci_parallel
+from bench_ndvi_storage import synthetic_stack, write_ndvi, decoded_bytes
+
+# -------- CONFIG ----------
+height, width = 1024, 1024
+blocksize = 512
+hist_end = 2022
+nodata = -9999.0
+thresholds = (2.0, 3.0)
+
+
+def separate(targets, folder, out):
+    """Current stages: VCI pass, then z-score + vis pass. Returns the paths read."""
+    read = []
+    jobs = []
+    for fp, month in targets:
+        paths = baseline_paths(folder, month)
+        jobs.append((fp, paths["min"], paths["max"], os.path.join(out, "VCI_" + os.path.basename(fp))))
+        read += [fp, paths["min"], paths["max"]]
+    compute_vci_parallel(jobs, nodata, workers=1, blocksize=blocksize)
+    for fp, month in targets:
+        paths = baseline_paths(folder, month)
+        name = os.path.basename(fp)
+        write_zscore(fp, paths["mean"], paths["std"], os.path.join(out, "z_" + name),
+                     os.path.join(out, "vis_" + name), nodata, blocksize=blocksize)
+        read += [fp, paths["mean"], paths["std"]]
+    return read
+
+
+def fused(targets, folder, out):
+    """One pass per date writing VCI, z-score, vis and flags. Returns the paths read."""
+    read = []
+    for fp, month in targets:
+        paths = baseline_paths(folder, month)
+        name = os.path.basename(fp)
+        write_indices(fp, paths["mean"], paths["std"], os.path.join(out, "z_" + name),
+                      os.path.join(out, "vis_" + name), nodata,
+                      vci=(paths["min"], paths["max"], os.path.join(out, "VCI_" + name)),
+                      flags_path=os.path.join(out, "flags_" + name), thresholds=thresholds,
+                      blocksize=blocksize)
+        read += [fp, paths["min"], paths["max"], paths["mean"], paths["std"]]
+    return read
+
+
+def same_rasters(out_a, out_b, names):
+    for name in names:
+        with rasterio.open(os.path.join(out_a, name)) as a, rasterio.open(os.path.join(out_b, name)) as b:
+            if not np.array_equal(a.read(1), b.read(1)):
+                return False
+    return True
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="ndvi_indices_bench_")
+    rng = np.random.default_rng(0)
+    base = dict(driver="GTiff", height=height, width=width, count=1, crs="EPSG:32617",
+                transform=from_origin(500000, 950000, 250, 250))
+    try:
+        folder = os.path.join(tmp, "ndvi")
+        os.makedirs(folder)
+        hist_by_month = {f"{m:02d}": [] for m in range(1, 13)}
+        targets = []
+        for year, month, raw in synthetic_stack(rng):
+            fp = os.path.join(folder, f"real_clipped_NDVI_{year}_{month:02d}_15.tif")
+            write_ndvi(fp, raw, base, "int16")
+            if year <= hist_end:
+                hist_by_month[f"{month:02d}"].append(fp)
+            else:
+                targets.append((fp, f"{month:02d}"))
+        for month, files in hist_by_month.items():
+            write_baseline(accumulate_baseline(files, height, width, blocksize),
+                           baseline_paths(folder, month), base, nodata)
+
+        print(f"Targets: {len(targets)} scaled Int16 NDVI rasters {height}x{width} px, block {blocksize}")
+        print(f"{'passes':<10}{'decoded MB':>12}{'seconds':>9}{'peak MB':>9}")
+        for label, run in (("separate", separate), ("fused", fused)):
+            out = os.path.join(tmp, label)
+            os.makedirs(out)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            with redirect_stdout(io.StringIO()):     # per-file "Saved VCI" lines
+                read = run(targets, folder, out)
+            seconds = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{label:<10}{decoded_bytes(read) / 1e6:>12.1f}{seconds:>9.2f}{peak / 1e6:>9.1f}")
+
+        names = [prefix + os.path.basename(fp) for fp, _ in targets for prefix in ("VCI_", "z_", "vis_")]
+        print("identical VCI / z-score / vis:", same_rasters(os.path.join(tmp, "separate"),
+                                                            os.path.join(tmp, "fused"), names))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+bench_ndvi_storage.py
+Float32 NDVI (NDVI_Real_Convertion.py) against scaled Int16 NDVI (MODIS
+integers + scale metadata, NDVI_Preprocess.py): bytes on disk and decoded,
+and runtime of the baseline, VCI and z-score anomaly stages on a synthetic
+monthly stack 2013-2025 written to a temp folder. Also reports the largest
+VCI / z-score difference between the two storages.
+Requirements: rasterio, numpy
+Usage: python bench_ndvi_storage.py
+"""
+
+import io
+import os
+import time
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from ndvi_baseline import accumulate_baseline, write_baseline, baseline_paths
+from ndvi_anomaly import write_zscore
+from vci_parallel import compute_vci_parallel
+from raster_output import write_meta
+
+# -------- CONFIG ----------
+height, width = 1024, 1024
+blocksize = 512
+years = range(2013, 2026)
+hist_end = 2022
+scale_factor = 10000.0
+fill_value = -3000
+nodata = -9999.0
+
+
+def synthetic_stack(rng):
+    """Smooth NDVI field per month + noise, MODIS integers with a fill border."""
+    y, x = np.mgrid[0:height, 0:width] / 150.0
+    base = 0.5 + 0.25 * np.sin(x) * np.cos(y)
+    for year in years:
+        for month in range(1, 13):
+            ndvi = base + 0.1 * np.sin(month / 2.0) + rng.normal(0, 0.05, (height, width))
+            raw = np.clip(np.round(ndvi * scale_factor), -2000, 10000).astype(np.int16)
+            raw[:, :width // 10] = fill_value
+            yield year, month, raw
+
+
+def write_ndvi(path, raw, base, storage):
+    if storage == "int16":
+        with rasterio.open(path, "w", **write_meta(base, dtype="int16", nodata=fill_value)) as dst:
+            dst.write(raw, 1)
+            dst.scales = (1.0 / scale_factor,)
+    else:
+        arr = np.where(raw == fill_value, nodata, raw / scale_factor).astype(np.float32)
+        with rasterio.open(path, "w", **write_meta(base, dtype="float32", nodata=nodata)) as dst:
+            dst.write(arr, 1)
+
+
+def decoded_bytes(paths):
+    """Bytes of the full-resolution bands of paths (what the stages decode)."""
+    total = 0
+    for p in paths:
+        with rasterio.open(p) as src:
+            total += src.width * src.height * np.dtype(src.dtypes[0]).itemsize
+    return total
+
+
+def run_stages(folder, hist_by_month, targets, base):
+    """Baseline, VCI and anomaly on one storage; returns {stage: (seconds, bytes decoded)}."""
+    out = {}
+    t0 = time.perf_counter()
+    read = []
+    for month, files in hist_by_month.items():
+        acc = accumulate_baseline(files, height, width, blocksize)
+        write_baseline(acc, baseline_paths(folder, month), base, nodata)
+        read += files
+    out["baseline"] = (time.perf_counter() - t0, decoded_bytes(read))
+
+    jobs = []
+    read = []
+    for fp, month in targets:
+        paths = baseline_paths(folder, month)
+        jobs.append((fp, paths["min"], paths["max"], os.path.join(folder, "VCI_" + os.path.basename(fp))))
+        read += [fp, paths["min"], paths["max"]]
+    t0 = time.perf_counter()
+    compute_vci_parallel(jobs, nodata, workers=1, blocksize=blocksize)
+    out["vci"] = (time.perf_counter() - t0, decoded_bytes(read))
+
+    read = []
+    t0 = time.perf_counter()
+    for fp, month in targets:
+        paths = baseline_paths(folder, month)
+        name = os.path.basename(fp)
+        write_zscore(fp, paths["mean"], paths["std"], os.path.join(folder, "z_" + name),
+                     os.path.join(folder, "vis_" + name), nodata, blocksize=blocksize)
+        read += [fp, paths["mean"], paths["std"]]
+    out["anomaly"] = (time.perf_counter() - t0, decoded_bytes(read))
+    return out
+
+
+def max_diff(path_a, path_b):
+    with rasterio.open(path_a) as a, rasterio.open(path_b) as b:
+        x, y = a.read(1), b.read(1)
+    both = (x != nodata) & (y != nodata)
+    if ((x != nodata) != (y != nodata)).any():
+        return float("inf")
+    return float(np.abs(x[both] - y[both]).max()) if both.any() else 0.0
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="ndvi_storage_bench_")
+    rng = np.random.default_rng(0)
+    base = dict(driver="GTiff", height=height, width=width, count=1, crs="EPSG:32617",
+                transform=from_origin(500000, 950000, 250, 250))
+    storages = ("float32", "int16")
+    try:
+        layout = {}
+        for storage in storages:
+            folder = os.path.join(tmp, storage)
+            os.makedirs(folder)
+            layout[storage] = ({f"{m:02d}": [] for m in range(1, 13)}, [])
+        for year, month, raw in synthetic_stack(rng):
+            name = f"real_clipped_NDVI_{year}_{month:02d}_15.tif"
+            for storage in storages:
+                fp = os.path.join(tmp, storage, name)
+                write_ndvi(fp, raw, base, storage)
+                hist_by_month, targets = layout[storage]
+                if year <= hist_end:
+                    hist_by_month[f"{month:02d}"].append(fp)
+                else:
+                    targets.append((fp, f"{month:02d}"))
+
+        n_files = len(years) * 12
+        print(f"Stack: {n_files} files {height}x{width} px, {len(layout['int16'][1])} targets")
+        print(f"{'storage':<9}{'NDVI MB':>9}{'stage':>10}{'decoded MB':>12}{'seconds':>9}")
+        results = {}
+        for storage in storages:
+            folder = os.path.join(tmp, storage)
+            on_disk = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)) / 1e6
+            with redirect_stdout(io.StringIO()):     # per-file "Saved VCI" lines
+                results[storage] = run_stages(folder, *layout[storage], base)
+            for stage, (seconds, nbytes) in results[storage].items():
+                print(f"{storage:<9}{on_disk:>9.1f}{stage:>10}{nbytes / 1e6:>12.1f}{seconds:>9.2f}")
+
+        vci_diff = max(max_diff(os.path.join(tmp, "float32", "VCI_" + os.path.basename(fp)),
+                                os.path.join(tmp, "int16", "VCI_" + os.path.basename(fp)))
+                       for fp, _ in layout["int16"][1])
+        z_diff = max(max_diff(os.path.join(tmp, "float32", "z_" + os.path.basename(fp)),
+                              os.path.join(tmp, "int16", "z_" + os.path.basename(fp)))
+                     for fp, _ in layout["int16"][1])
+        print(f"max |VCI float32 - int16| = {vci_diff:.2e}   max |z float32 - int16| = {z_diff:.2e}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
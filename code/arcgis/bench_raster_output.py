@@ -0,0 +1,101 @@
+"""
+bench_raster_output.py
+Write/read throughput and file size of the shared output profile
+(raster_output.py: 512x512 tiles, DEFLATE + predictor, overviews) against the
+previous outputs (striped + LZW, striped uncompressed) on a synthetic
+z-score-like float32 raster and an Int16 NDVI-like raster.
+Requirements: rasterio, numpy
+Usage: python bench_raster_output.py
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from raster_blocks import iter_windows
+from raster_output import write_meta, finalize
+
+# -------- CONFIG ----------
+height, width = 4096, 4096
+blocksize = 512
+repeats = 3
+nodata = -9999.0
+
+
+def synthetic(dtype, rng):
+    # smooth field + noise + nodata border, like a clipped NDVI / anomaly raster
+    y, x = np.mgrid[0:height, 0:width] / 400.0
+    field = np.sin(x) * np.cos(y) + rng.normal(0, 0.3, (height, width))
+    field[:, :width // 10] = np.nan
+    if np.issubdtype(dtype, np.integer):
+        return np.where(np.isnan(field), -3000, field * 3000).astype(dtype), -3000
+    return np.where(np.isnan(field), nodata, field).astype(dtype), nodata
+
+
+def profiles(base, dtype, nd):
+    return {
+        "striped_none": dict(base, dtype=np.dtype(dtype).name, nodata=nd),
+        "striped_lzw": dict(base, dtype=np.dtype(dtype).name, nodata=nd, compress="lzw"),
+        "tiled_deflate": write_meta(base, dtype=dtype, nodata=nd),
+        "tiled_zstd": write_meta(base, dtype=dtype, nodata=nd, compress_alg="zstd"),
+    }
+
+
+def write_windowed(path, arr, meta):
+    with rasterio.open(path, "w", **meta) as dst:
+        for window in iter_windows(dst, blocksize):
+            dst.write(arr[window.toslices()], 1, window=window)
+
+
+def read_windowed(path):
+    total = 0.0
+    with rasterio.open(path) as src:
+        for window in iter_windows(src, blocksize):
+            total += float(src.read(1, window=window)[0, 0])
+    return total
+
+
+def best_of(func):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="out_bench_")
+    rng = np.random.default_rng(0)
+    base = dict(driver="GTiff", height=height, width=width, count=1, crs="EPSG:32617",
+                transform=from_origin(500000, 950000, 250, 250))
+    mb = height * width / 1e6
+    try:
+        for dtype in (np.float32, np.int16):
+            arr, nd = synthetic(dtype, rng)
+            print(f"\n{np.dtype(dtype).name} {height}x{width}, {blocksize}px windows")
+            print(f"{'profile':<15}{'size MB':>9}{'write MP/s':>12}{'read MP/s':>11}{'ovr s':>8}")
+            for name, meta in profiles(base, dtype, nd).items():
+                path = os.path.join(tmp, f"{name}.tif")
+                try:
+                    t_write = best_of(lambda: write_windowed(path, arr, meta))
+                except rasterio.errors.RasterioIOError as exc:   # e.g. GDAL built without ZSTD
+                    print(f"{name:<15} skipped ({exc})")
+                    continue
+                t_read = best_of(lambda: read_windowed(path))
+                size = os.path.getsize(path) / 1e6      # full resolution only
+                t_ovr = 0.0
+                if name.startswith("tiled"):
+                    t0 = time.perf_counter()
+                    finalize(path)
+                    t_ovr = time.perf_counter() - t0
+                print(f"{name:<15}{size:>9.1f}{mb / t_write:>12.1f}{mb / t_read:>11.1f}{t_ovr:>8.2f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
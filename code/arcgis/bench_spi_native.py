@@ -0,0 +1,68 @@
+"""
+bench_spi_native.py
+Benchmark: SPI fitted after resampling CHIRPS to 250 m (current path) vs SPI
+fitted on the native ~5 km grid and upsampled at the end (spi_mode = "native").
+Uses a synthetic precipitation stack so it runs without the project data.
+Reports wall time of both paths and the difference of per-zone mean SPI.
+Requirements: numpy, scipy
+Usage: python bench_spi_native.py
+"""
+
+import time
+import numpy as np
+from scipy.ndimage import zoom
+from spi_engine import fit_gamma_stack, spi_from_params
+
+# -------- CONFIG ----------
+native_shape = (40, 30)    # ~5 km cells covering the AOI window
+factor = 20                # 5 km -> 250 m
+n_years = 10               # baseline years (2013-2022)
+n_zones = 53               # corregimientos
+seed = 42
+
+rng = np.random.default_rng(seed)
+
+# Smooth spatial fields for gamma shape/scale, then one sample per baseline year
+shape_field = zoom(rng.uniform(1.0, 4.0, (5, 4)), (native_shape[0] / 5, native_shape[1] / 4), order=1)
+scale_field = zoom(rng.uniform(20.0, 80.0, (5, 4)), (native_shape[0] / 5, native_shape[1] / 4), order=1)
+baseline = rng.gamma(shape_field, scale_field, size=(n_years,) + native_shape).astype(np.float32)
+target = rng.gamma(shape_field, scale_field).astype(np.float32)
+
+
+def upsample(arr):
+    return zoom(arr, factor, order=1)
+
+
+# Synthetic zones: nearest of n_zones random seeds on the fine grid
+fine_shape = (native_shape[0] * factor, native_shape[1] * factor)
+seeds = rng.uniform(0, 1, (n_zones, 2)) * fine_shape
+rr, cc = np.mgrid[0:fine_shape[0], 0:fine_shape[1]]
+zones = np.argmin((rr[..., None] - seeds[:, 0]) ** 2 + (cc[..., None] - seeds[:, 1]) ** 2, axis=-1)
+
+
+def zone_means(arr):
+    ok = np.isfinite(arr)
+    sums = np.bincount(zones[ok], weights=arr[ok], minlength=n_zones)
+    counts = np.bincount(zones[ok], minlength=n_zones)
+    return sums / np.maximum(counts, 1)
+
+
+# Current path: resample every month to 250 m, fit per fine pixel
+t0 = time.perf_counter()
+fine_baseline = np.stack([upsample(a) for a in baseline])
+params = fit_gamma_stack(fine_baseline)
+spi_resampled = spi_from_params(upsample(target), *params[:3])
+t_resampled = time.perf_counter() - t0
+
+# Native path: fit on the coarse grid, upsample only the final SPI
+t0 = time.perf_counter()
+params = fit_gamma_stack(baseline)
+spi_native = upsample(spi_from_params(target, *params[:3]))
+t_native = time.perf_counter() - t0
+
+diff = np.abs(zone_means(spi_resampled) - zone_means(spi_native))
+
+print(f"Grid: native {native_shape} -> 250 m {fine_shape}, {n_years} baseline years")
+print(f"Resampled path: {t_resampled:8.3f} s")
+print(f"Native path:    {t_native:8.3f} s  (speedup x{t_resampled / t_native:.1f})")
+print(f"Zonal mean SPI |diff| over {n_zones} zones: mean {diff.mean():.4f}  max {diff.max():.4f}")
@@ -0,0 +1,76 @@
+"""
+bench_vci_parallel.py
+Scaling benchmark of the tiled VCI stage (vci_parallel.py) for 1..N worker
+processes on a synthetic monthly NDVI stack 2013-2025 written to a temp folder.
+Requirements: rasterio, numpy
+Usage: python bench_vci_parallel.py
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from ndvi_baseline import accumulate_baseline, write_baseline, baseline_paths
+from vci_parallel import compute_vci_parallel
+
+# -------- CONFIG ----------
+height, width = 512, 512
+blocksize = 128
+years = range(2013, 2026)
+hist_end = 2022
+nodata = -9999.0
+max_workers = os.cpu_count() or 1
+
+
+def write_raster(path, arr, meta):
+    with rasterio.open(path, "w", **meta) as dst:
+        dst.write(arr, 1)
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="vci_bench_")
+    rng = np.random.default_rng(0)
+    meta = dict(driver="GTiff", height=height, width=width, count=1, dtype="float32",
+                nodata=nodata, crs="EPSG:32617", transform=from_origin(500000, 950000, 250, 250))
+    try:
+        # Synthetic monthly NDVI with a 10% nodata border
+        hist_by_month = {f"{m:02d}": [] for m in range(1, 13)}
+        targets = []
+        for year in years:
+            for month in range(1, 13):
+                arr = rng.uniform(0.1, 0.9, (height, width)).astype("float32")
+                arr[:, : width // 10] = nodata
+                fp = os.path.join(tmp, f"real_clipped_NDVI_{year}_{month:02d}_15.tif")
+                write_raster(fp, arr, meta)
+                if year <= hist_end:
+                    hist_by_month[f"{month:02d}"].append(fp)
+                else:
+                    targets.append((fp, f"{month:02d}"))
+
+        for month, files in hist_by_month.items():
+            acc = accumulate_baseline(files, height, width)
+            write_baseline(acc, baseline_paths(tmp, month), meta, nodata)
+
+        print(f"Stack: {len(years)} years x 12 months, {height}x{width} px, "
+              f"{len(targets)} target files, {blocksize} px tiles")
+        t_serial = None
+        for workers in range(1, max_workers + 1):
+            out_dir = os.path.join(tmp, f"vci_{workers}")
+            os.makedirs(out_dir)
+            jobs = [(fp, baseline_paths(tmp, m)["min"], baseline_paths(tmp, m)["max"],
+                     os.path.join(out_dir, "VCI_" + os.path.basename(fp)[18:]))
+                    for fp, m in targets]
+            t0 = time.perf_counter()
+            compute_vci_parallel(jobs, nodata, workers=workers, blocksize=blocksize)
+            elapsed = time.perf_counter() - t0
+            t_serial = t_serial or elapsed
+            print(f"workers={workers:2d}  {elapsed:7.2f} s  speedup x{t_serial / elapsed:.2f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+build_datacube.py
+Packs the single-date rasters of every variable into one Zarr datacube
+(datacube.py). Re-run after each stage: variables whose files did not change
+are left untouched. The files of each variable come from the raster catalog.
+Requirements: zarr>=3, rasterio, numpy
+Usage: python build_datacube.py
+"""
+
+import os
+from datacube import build_cube
+from raster_catalog import catalog_entries
+from chirps_archive import is_archive
+from pipeline_config import setting
+
+# -------- CONFIG ----------
+datacube_store = setting("datacube", "datacube_store", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Datacube\arco_seco.zarr")
+
+ndvi_folder = setting("datacube", "ndvi_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real")
+zscore_folder = setting("datacube", "zscore_folder", os.path.join(ndvi_folder, "NDVI_Anomalies"))
+vci_folder = setting("datacube", "vci_folder", os.path.join(ndvi_folder, "NDVI_VCI"))
+spi_folder = setting("datacube", "spi_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Clipped_250m\SPI1")
+
+# CHIRPS as the SPI stage reads it (spi_mode as in [spi]): the clip_ rasters of
+# Chirp_Clip_GIS.py in "resampled" mode; the native files (extracted or
+# .tif.gz archives) in "aligned" and "native" mode, which write no clip_ rasters
+spi_mode = setting("datacube", "spi_mode", "aligned")
+chirps_folder = setting("datacube", "chirps_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Clipped_250m")
+native_chirps_folder = setting("datacube", "native_chirps_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Chirps_Extracted")
+
+# variable (raster catalog name) -> folder
+variables = {
+    "ndvi": ndvi_folder,
+    "zscore": zscore_folder,
+    "vci": vci_folder,
+    "chirps": chirps_folder if spi_mode == "resampled" else native_chirps_folder,
+    "spi1": spi_folder,
+}
+
+# Chunks: whole time axis x chunk_yx x chunk_yx pixels
+chunk_yx = setting("datacube", "chunk_yx", 64)
+
+
+def dated_paths(variable, folder):
+    """One file per date of variable in folder (an extracted CHIRPS file rather than its archive)."""
+    by_date = {}
+    for path, year, month, day in catalog_entries(variable, folder):
+        key = (year, month, day or 1)
+        if key not in by_date or is_archive(by_date[key]):
+            by_date[key] = path
+    return [by_date[k] for k in sorted(by_date)]
+
+
+def main():
+    os.makedirs(os.path.dirname(datacube_store), exist_ok=True)
+    for variable, folder in variables.items():
+        paths = dated_paths(variable, folder)
+        if not paths:
+            print(f"No rasters for {variable} in {folder}, skipping.")
+            continue
+        build_cube(datacube_store, variable, paths, chunk_yx=chunk_yx)
+    print("Datacube:", datacube_store)
+
+
+if __name__ == "__main__":
+    main()
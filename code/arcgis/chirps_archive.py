@@ -0,0 +1,56 @@
+"""
+chirps_archive.py
+CHIRPS .tif.gz archives: streamed extraction to a temporary name (renamed
+when complete), a cheap up-to-date test from the gzip trailer (uncompressed
+size) and file times, and reading archives in place with GDAL without
+writing the uncompressed TIFF: GDAL's /vsigzip/ decompresses the archive in
+memory as it is read, and a window read stops decompressing after its last row.
+Requirements: none (standard library); the archive paths are read with gdal
+Usage: from chirps_archive import extract, is_extracted, archive_path
+"""
+
+import os
+import gzip
+import shutil
+import struct
+
+# Copy buffer for extraction
+chunk_bytes = 4 << 20
+
+
+def is_archive(path):
+    return path.lower().endswith(".gz")
+
+
+def gzip_size(gz_path):
+    """Uncompressed size from the gzip trailer (ISIZE, modulo 2**32; single-member archives)."""
+    with open(gz_path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", f.read(4))[0]
+
+
+def is_extracted(gz_path, out_path):
+    """
+    True if out_path is a complete extraction of gz_path: its size matches the
+    gzip trailer and it is not older than the archive. Partial outputs never
+    pass (extract writes to a temporary name).
+    """
+    if not os.path.exists(out_path):
+        return False
+    st = os.stat(out_path)
+    return st.st_size % 2 ** 32 == gzip_size(gz_path) and st.st_mtime_ns >= os.stat(gz_path).st_mtime_ns
+
+
+def extract(gz_path, out_path):
+    """Stream-decompress gz_path to out_path; the file appears only when complete."""
+    tmp_path = out_path + ".part"
+    with gzip.open(gz_path, "rb") as f_in, open(tmp_path, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, chunk_bytes)
+    os.replace(tmp_path, out_path)
+    return os.path.getsize(out_path)
+
+
+def archive_path(path):
+    """GDAL path of a raster or archive: /vsigzip/ for .gz (decompressed as it is read)."""
+    return "/vsigzip/" + path.replace("\\", "/") if is_archive(path) else path
+
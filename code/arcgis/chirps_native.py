@@ -0,0 +1,111 @@
+"""
+chirps_native.py
+Helpers for computing SPI on the native CHIRPS grid (~5 km): read only a
+buffered window around the AOI, then upsample the final SPI onto the NDVI
+reference grid and apply its AOI mask.
+Requirements: numpy, gdal
+Usage: from chirps_native import native_grid, read_native_window, upsample_to_reference
+"""
+
+import numpy as np
+from osgeo import gdal, osr
+
+gdal.UseExceptions()
+
+# Nodata used for the in-memory warp
+warp_nodata = -9999.0
+
+
+def _srs(wkt):
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(wkt)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def _bounds(ds):
+    gt = ds.GetGeoTransform()
+    xs = (gt[0], gt[0] + gt[1] * ds.RasterXSize)
+    ys = (gt[3], gt[3] + gt[5] * ds.RasterYSize)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def native_grid(chirps_path, ref_path, buffer_cells=2):
+    """
+    Window of the CHIRPS raster covering the reference (AOI) extent plus a
+    buffer of native cells, so bilinear upsampling has neighbours at the edges.
+    Returns (xoff, yoff, xsize, ysize), window geotransform, projection.
+    """
+    src = gdal.Open(chirps_path)
+    ref = gdal.Open(ref_path)
+    gt = src.GetGeoTransform()
+    proj = src.GetProjection()
+
+    # Reference corners in the CHIRPS CRS
+    xmin, ymin, xmax, ymax = _bounds(ref)
+    tr = osr.CoordinateTransformation(_srs(ref.GetProjection()), _srs(proj))
+    corners = [tr.TransformPoint(x, y)[:2] for x in (xmin, xmax) for y in (ymin, ymax)]
+    cx = [c[0] for c in corners]
+    cy = [c[1] for c in corners]
+
+    col0 = int(np.floor((min(cx) - gt[0]) / gt[1])) - buffer_cells
+    col1 = int(np.ceil((max(cx) - gt[0]) / gt[1])) + buffer_cells
+    row0 = int(np.floor((max(cy) - gt[3]) / gt[5])) - buffer_cells
+    row1 = int(np.ceil((min(cy) - gt[3]) / gt[5])) + buffer_cells
+    col0, row0 = max(col0, 0), max(row0, 0)
+    col1, row1 = min(col1, src.RasterXSize), min(row1, src.RasterYSize)
+
+    window = (col0, row0, col1 - col0, row1 - row0)
+    win_gt = (gt[0] + col0 * gt[1], gt[1], gt[2], gt[3] + row0 * gt[5], gt[4], gt[5])
+    return window, win_gt, proj
+
+
+def read_native_window(path, window):
+    """Read a window of a native CHIRPS raster as float32 with NaN for nodata."""
+    ds = gdal.Open(path)
+    band = ds.GetRasterBand(1)
+    arr = band.ReadAsArray(*window).astype(np.float32)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        arr[arr == nodata] = np.nan
+    arr[arr < 0] = np.nan  # CHIRPS flags ocean/missing with negative values
+    return arr
+
+
+def upsample_to_reference(arr, gt, proj, ref_path, resample_alg="bilinear"):
+    """
+    Warp a native-grid array onto the reference raster grid and set pixels
+    outside the reference AOI (reference nodata) to NaN.
+    Returns (array, geotransform, projection) of the reference grid.
+    """
+    ref = gdal.Open(ref_path)
+    mem = gdal.GetDriverByName("MEM")
+
+    src = mem.Create("", arr.shape[1], arr.shape[0], 1, gdal.GDT_Float32)
+    src.SetGeoTransform(gt)
+    src.SetProjection(proj)
+    src_band = src.GetRasterBand(1)
+    src_band.SetNoDataValue(warp_nodata)
+    src_band.WriteArray(np.where(np.isnan(arr), warp_nodata, arr).astype(np.float32))
+
+    dst = mem.Create("", ref.RasterXSize, ref.RasterYSize, 1, gdal.GDT_Float32)
+    dst.SetGeoTransform(ref.GetGeoTransform())
+    dst.SetProjection(ref.GetProjection())
+    dst_band = dst.GetRasterBand(1)
+    dst_band.SetNoDataValue(warp_nodata)
+    dst_band.Fill(warp_nodata)
+
+    gdal.Warp(dst, src, resampleAlg=resample_alg, srcNodata=warp_nodata, dstNodata=warp_nodata)
+
+    out = dst_band.ReadAsArray().astype(np.float32)
+    out[out == warp_nodata] = np.nan
+
+    # AOI mask taken from the reference raster
+    ref_band = ref.GetRasterBand(1)
+    ref_arr = ref_band.ReadAsArray().astype(np.float32)
+    ref_nodata = ref_band.GetNoDataValue()
+    outside = np.isnan(ref_arr)
+    if ref_nodata is not None:
+        outside |= ref_arr == np.float32(ref_nodata)
+    out[outside] = np.nan
+    return out, ref.GetGeoTransform(), ref.GetProjection()
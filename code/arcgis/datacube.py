@@ -0,0 +1,142 @@
+"""
+datacube.py
+Chunked (time, y, x) Zarr datacube for the monthly rasters (NDVI, z-score
+anomaly, VCI, SPI-1). The single-date GeoTIFFs of one variable (all on one
+grid) are packed once into a float32 array with NaN as nodata (scaled Int16
+NDVI is stored in physical units). A chunk spans
+the whole time axis and chunk_yx x chunk_yx pixels, so the full history of a
+pixel is one chunk read, and a spatial window reads only the chunks under it.
+Requirements: zarr>=3, rasterio, numpy
+Usage: from datacube import build_cube, open_cube
+"""
+
+import re
+import numpy as np
+import rasterio
+import zarr
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from raster_blocks import iter_windows, read_scaled
+from spi_params import files_signature, grid_fingerprint
+from chirps_archive import archive_path
+
+# Bump when the array layout or the attributes change
+cube_version = 1
+
+date_pattern = re.compile(r"(\d{4})[_.](\d{2})(?:[_.](\d{2}))?")
+
+
+def date_from_name(name):
+    """'YYYY-MM-DD' from a file name with YYYY_MM[_DD] or YYYY.MM (day 01 if absent)."""
+    m = date_pattern.search(name)
+    if not m:
+        return None
+    return f"{m.group(1)}-{m.group(2)}-{m.group(3) or '01'}"
+
+
+class Cube:
+    """One variable of the datacube: dates, grid and windowed (time, y, x) reads."""
+
+    def __init__(self, array):
+        attrs = array.attrs
+        self.array = array
+        self.dates = list(attrs["dates"])
+        self.transform = Affine(*attrs["transform"])
+        self.crs = CRS.from_wkt(attrs["crs"]) if attrs["crs"] else None
+        self.n_times, self.height, self.width = array.shape
+        self.chunk_yx = array.chunks[1]
+
+    @property
+    def fingerprint(self):
+        """Grid fingerprint of the cube, as raster_catalog.raster_info gives for its rasters."""
+        return grid_fingerprint(self.transform.to_gdal(), self.crs.to_wkt() if self.crs else "",
+                                (self.height, self.width))
+
+    def time_indices(self, month=None, start_year=None, end_year=None):
+        """Indices of the dates in a calendar month (1-12) and/or a year range."""
+        out = []
+        for i, d in enumerate(self.dates):
+            year, mm = int(d[:4]), int(d[5:7])
+            if month is not None and mm != month:
+                continue
+            if start_year is not None and year < start_year:
+                continue
+            if end_year is not None and year > end_year:
+                continue
+            out.append(i)
+        return out
+
+    def index_of(self, year, month):
+        """Index of the (first) date in a year-month, or None."""
+        key = f"{year:04d}-{month:02d}"
+        for i, d in enumerate(self.dates):
+            if d.startswith(key):
+                return i
+        return None
+
+    def windows(self):
+        """Chunk-aligned windows covering the grid."""
+        return iter_windows(self, self.chunk_yx)
+
+    def read(self, window=None, times=None):
+        """(time, rows, cols) float32 block; times is a list of indices (None = all)."""
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        rows, cols = window.toslices()
+        if times is None:
+            return self.array[:, rows, cols]
+        return self.array.oindex[list(times), rows, cols]
+
+
+def open_cube(store, variable):
+    """Open one variable of a datacube store."""
+    root = zarr.open_group(store, mode="r")
+    return Cube(root[variable])
+
+
+def build_cube(store, variable, paths, chunk_yx=64, time_chunk=None):
+    """
+    Pack single-date rasters (same grid; .tif.gz archives are read in place)
+    into store/variable, ordered by date.
+    The cube is left as is when it already holds exactly these files (name,
+    size, mtime). Memory: one band of n_times x chunk_yx rows x width float32.
+    """
+    dated = sorted((date_from_name(p.replace("\\", "/").split("/")[-1]), p) for p in paths)
+    dated = [(d, p) for d, p in dated if d is not None]
+    if not dated:
+        raise ValueError(f"No dated rasters for {variable}")
+    signature = files_signature([p for _, p in dated])
+
+    root = zarr.open_group(store, mode="a")
+    if variable in root:
+        attrs = root[variable].attrs
+        if attrs.get("version") == cube_version and attrs.get("signature") == signature:
+            print(f"Datacube {variable} is up to date ({len(dated)} dates)")
+            return Cube(root[variable])
+
+    with rasterio.open(archive_path(dated[0][1])) as ref:
+        transform, crs, height, width = ref.transform, ref.crs, ref.height, ref.width
+    n_times = len(dated)
+    array = root.create_array(variable, shape=(n_times, height, width),
+                              chunks=(time_chunk or n_times, chunk_yx, chunk_yx),
+                              dtype="float32", fill_value=np.nan, overwrite=True)
+
+    srcs = [rasterio.open(archive_path(p)) for _, p in dated]
+    try:
+        for src in srcs:
+            if src.transform != transform or src.shape != (height, width):
+                raise ValueError(f"{src.name} is not on the grid of {dated[0][1]}")
+        for top in range(0, height, chunk_yx):
+            window = Window(0, top, width, min(chunk_yx, height - top))
+            band = np.stack([read_scaled(src, window) for src in srcs])
+            array[:, top:top + band.shape[1], :] = band
+    finally:
+        for src in srcs:
+            src.close()
+
+    # Written last: an interrupted build has no signature and is rebuilt
+    array.attrs.update(version=cube_version, signature=signature, dates=[d for d, _ in dated],
+                       transform=list(transform)[:6], crs=crs.to_wkt() if crs else "")
+    print(f"Datacube {variable}: {n_times} dates, {height}x{width}")
+    return Cube(array)
@@ -0,0 +1,89 @@
+"""
+drought_frequency.py
+Streaming "area ever affected" and drought-frequency accumulator. For every
+threshold one bit per pixel (np.packbits) is OR-ed across all months, and a
+uint8/uint16 grid counts the months each pixel exceeded it, so the whole
+archive needs memory proportional to a single raster.
+Requirements: rasterio, numpy
+Usage: from drought_frequency import EverAffectedAccumulator
+"""
+
+import numpy as np
+import rasterio
+from raster_output import write_meta, finalize, cog_products
+
+
+class EverAffectedAccumulator:
+    """
+    Per-pixel |z| > thr history for a list of thresholds.
+    Blocks must start on a column that is a multiple of 8 (any iter_windows
+    block size that is a multiple of 8 works).
+    """
+
+    def __init__(self, height, width, thresholds, max_months=255):
+        self.height, self.width = height, width
+        self.thresholds = list(thresholds)
+        n_bytes = (width + 7) // 8
+        count_dtype = np.uint8 if max_months <= 255 else np.uint16
+        self.ever = {thr: np.zeros((height, n_bytes), dtype=np.uint8) for thr in self.thresholds}
+        self.ever_valid = np.zeros((height, n_bytes), dtype=np.uint8)
+        self.months = {thr: np.zeros((height, width), dtype=count_dtype) for thr in self.thresholds}
+
+    def update(self, z, window):
+        """Add one block of z-scores (NaN = nodata) located at a rasterio window."""
+        r0, c0 = int(window.row_off), int(window.col_off)
+        if c0 % 8:
+            raise ValueError("block column offset must be a multiple of 8")
+        h, w = z.shape
+        rows = slice(r0, r0 + h)
+        packed_cols = slice(c0 // 8, c0 // 8 + (w + 7) // 8)
+
+        valid = np.isfinite(z)
+        self.ever_valid[rows, packed_cols] |= np.packbits(valid, axis=1)
+        abs_z = np.abs(np.where(valid, z, 0.0))
+        for thr in self.thresholds:
+            hit = abs_z > thr
+            self.ever[thr][rows, packed_cols] |= np.packbits(hit, axis=1)
+            self.months[thr][rows, c0:c0 + w] += hit
+
+    def ever_mask(self, thr):
+        return np.unpackbits(self.ever[thr], axis=1, count=self.width).astype(bool)
+
+    def valid_mask(self):
+        return np.unpackbits(self.ever_valid, axis=1, count=self.width).astype(bool)
+
+    def zone_summary(self, zones, n_zones):
+        """
+        Per-zone pixels ever observed and pixels ever above each threshold,
+        for a zone-ID grid of the same shape (0 = outside).
+        Returns (valid_pixels, {thr: ever_pixels}), arrays of length n_zones.
+        """
+        valid = self.valid_mask()
+        in_zone = valid & (zones > 0)
+        valid_pixels = np.bincount(zones[in_zone], minlength=n_zones + 1)[1:]
+        ever = {}
+        for thr in self.thresholds:
+            hit = self.ever_mask(thr) & in_zone
+            ever[thr] = np.bincount(zones[hit], minlength=n_zones + 1)[1:]
+        return valid_pixels, ever
+
+    def coverage_summary(self, weights):
+        """
+        zone_summary with every pixel weighted by a sparse (zone x pixel)
+        coverage matrix of the same grid (zonal_coverage.CoverageTable.weights).
+        """
+        valid = self.valid_mask().ravel()
+        valid_pixels = weights @ valid.astype(np.float64)
+        ever = {thr: weights @ (self.ever_mask(thr).ravel() & valid).astype(np.float64)
+                for thr in self.thresholds}
+        return valid_pixels, ever
+
+    def write_frequency(self, path_for_thr, meta):
+        """Write the months-above-threshold grid of every threshold (0 outside observed pixels)."""
+        dtype = self.months[self.thresholds[0]].dtype.name if self.thresholds else "uint8"
+        meta_local = write_meta(meta, dtype=dtype)
+        meta_local["nodata"] = None
+        for thr in self.thresholds:
+            with rasterio.open(path_for_thr(thr), "w", **meta_local) as dst:
+                dst.write(self.months[thr], 1)
+            finalize(path_for_thr(thr), resampling="nearest", cog=cog_products)
@@ -0,0 +1,49 @@
+"""
+modis_periods.py
+Calendar of the MOD13Q1 16-day composites: the days of each compositing
+period that fall inside a month, and the composites touching every month.
+Pure date logic (no GDAL), shared by the monthly composite stage.
+Requirements: none (standard library)
+Usage: from modis_periods import month_composites, overlap_days
+"""
+
+from datetime import date, timedelta
+
+# MOD13Q1 compositing period (the file date is its first day); the last
+# period of a year (DOY 353) is cut short on December 31, the next one
+# starts on January 1
+period_days = 16
+
+
+def month_bounds(year, month):
+    first = date(year, month, 1)
+    following = date(year + month // 12, month % 12 + 1, 1)
+    return first, following
+
+
+def period_end(start):
+    """Day after the last day of the 16-day period starting at `start`."""
+    return min(start + timedelta(days=period_days), date(start.year + 1, 1, 1))
+
+
+def overlap_days(start, year, month):
+    """Days of the 16-day period starting at `start` inside year-month."""
+    first, following = month_bounds(year, month)
+    return max((min(period_end(start), following) - max(start, first)).days, 0)
+
+
+def month_composites(dated_files):
+    """
+    {(year, month): [(path, overlap days), ...]} from [(path, start date), ...]:
+    every month a 16-day period touches, with the days it covers.
+    """
+    months = {}
+    for path, start in sorted(dated_files, key=lambda x: x[1]):
+        last = period_end(start) - timedelta(days=1)
+        y, m = start.year, start.month
+        while (y, m) <= (last.year, last.month):
+            days = overlap_days(start, y, m)
+            if days:
+                months.setdefault((y, m), []).append((path, days))
+            y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
@@ -0,0 +1,59 @@
+"""
+ndvi_anomaly.py
+Block-windowed NDVI z-score anomaly: z = (NDVI - mean_month) / std_month,
+masked where the baseline std is too small to be stable, written together
+with the clipped visualization raster in the same pass. Scaled Int16 NDVI is
+converted to float per block (raster_blocks.read_scaled). With an
+aoi_pixels.AoiPixels the rasters are read as packed vectors of the AOI cells.
+Requirements: rasterio, numpy
+Usage: from ndvi_anomaly import write_zscore
+"""
+
+import numpy as np
+import rasterio
+from raster_blocks import iter_windows, read_scaled
+from raster_output import write_meta, finalize, cog_products
+
+
+def zscore_block(ndvi, mean, std, nodata, min_std):
+    """z-score of one block; returns (z, valid) with nodata outside valid."""
+    valid = (np.isfinite(ndvi) & np.isfinite(mean) & (ndvi != nodata) & (mean != nodata)
+             & (std != nodata) & (std > min_std))
+    z = np.full(ndvi.shape, nodata, dtype=np.float32)
+    np.divide(ndvi - mean, std, out=z, where=valid)
+    return z, valid
+
+
+def write_zscore(ndvi_path, mean_path, std_path, z_path, vis_path, nodata,
+                 min_std=0.1, min_vis=-5.0, max_vis=5.0, blocksize=512, stats=None, aoi=None):
+    """
+    Write the z-score raster and its [min_vis, max_vis] clipped copy in one pass.
+    If stats (a raster_stats.StreamingStats) is given, valid z values of every
+    block are added to it, so the summary needs no second read.
+    aoi (aoi_pixels.AoiPixels): compute on the packed AOI cells instead of blocks.
+    """
+    with rasterio.open(ndvi_path) as src, rasterio.open(mean_path) as src_mean, \
+            rasterio.open(std_path) as src_std:
+        meta = write_meta(src.meta, dtype="float32", nodata=np.float32(nodata))
+        if aoi is not None:
+            ndvi, mean, std = (aoi.read(s) for s in (src, src_mean, src_std))
+            z, valid = zscore_block(ndvi, mean, std, nodata, min_std)
+            if stats is not None:
+                stats.update(z[valid])
+            aoi.write(z_path, z, meta, nodata)
+            aoi.write(vis_path, np.where(valid, np.clip(z, min_vis, max_vis), nodata).astype("float32"),
+                      meta, nodata)
+            return
+        with rasterio.open(z_path, "w", **meta) as dst_z, rasterio.open(vis_path, "w", **meta) as dst_vis:
+            for window in iter_windows(src, blocksize):
+                ndvi = read_scaled(src, window)
+                mean = read_scaled(src_mean, window)
+                std = read_scaled(src_std, window)
+                z, valid = zscore_block(ndvi, mean, std, nodata, min_std)
+                dst_z.write(z, 1, window=window)
+                if stats is not None:
+                    stats.update(z[valid])
+                vis = np.where(valid, np.clip(z, min_vis, max_vis), nodata).astype("float32")
+                dst_vis.write(vis, 1, window=window)
+    finalize(z_path, cog=cog_products)
+    finalize(vis_path, cog=cog_products)
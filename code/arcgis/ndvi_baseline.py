@@ -0,0 +1,178 @@
+"""
+ndvi_baseline.py
+Single-pass NDVI baseline: every historical raster is read exactly once and
+updates per-pixel min, max, count, mean and M2 (Welford) grids together.
+Writes the min/max grids used by VCI and the mean/std grids used by the
+z-score anomaly.
+The baseline can also be accumulated from a datacube.Cube, one chunk-aligned
+window of the whole history at a time.
+Scaled Int16 NDVI: min/max are tracked and written in storage units (Int16
+with the same scale/offset metadata); only mean/std use scaled values.
+With an aoi_pixels.AoiPixels the grids are 1-D vectors of the in-AOI cells,
+scattered back to the raster grid when written.
+Requirements: rasterio, numpy
+Usage: from ndvi_baseline import accumulate_baseline, write_baseline, baseline_paths
+"""
+
+import os
+import numpy as np
+import rasterio
+from raster_blocks import iter_windows, read_scaled, read_valid
+from raster_output import write_meta, finalize
+
+# Products written for every month, in file-name order NDVI_<stat>_<MM>.tif
+baseline_stats = ("min", "max", "mean", "std", "count")
+
+
+class BaselineAccumulator:
+    """
+    Running per-pixel min, max, count, mean and M2 for one calendar month.
+    Fed either float blocks (update) or raw integer blocks (update_raw), not both.
+    shape is (height, width), or (n,) for packed AOI vectors (updated without window).
+    """
+
+    def __init__(self, *shape):
+        self.shape = shape
+        self.min = None
+        self.max = None
+        self.raw_scaling = None      # (dtype, scale, offset, nodata) of raw updates
+        self.count = np.zeros(shape, dtype=np.uint16)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+
+    def update(self, arr, window=None):
+        """Add one block (float32, NaN = nodata) at the given rasterio window."""
+        if self.raw_scaling is not None:
+            raise ValueError("baseline mixes float and scaled integer rasters")
+        if self.min is None:
+            self.min = np.full(self.shape, np.inf, dtype=np.float32)
+            self.max = np.full(self.shape, -np.inf, dtype=np.float32)
+        sl = window.toslices() if window is not None else Ellipsis
+        valid = ~np.isnan(arr)
+
+        # fmin/fmax ignore NaN, so nodata never replaces a value
+        np.fmin(self.min[sl], arr, out=self.min[sl])
+        np.fmax(self.max[sl], arr, out=self.max[sl])
+        self._update_moments(arr, valid, sl)
+
+    def update_raw(self, raw, valid, scale=1.0, offset=0.0, nodata=None, window=None):
+        """Add one integer block in storage units; min/max stay integer, mean/M2 use raw * scale + offset."""
+        if nodata is None:
+            nodata = np.iinfo(raw.dtype).min    # only written where no sample was seen
+        scaling = (raw.dtype.name, scale, offset, nodata)
+        if self.raw_scaling is None:
+            if self.min is not None:
+                raise ValueError("baseline mixes float and scaled integer rasters")
+            info = np.iinfo(raw.dtype)
+            self.min = np.full(self.shape, info.max, dtype=raw.dtype)
+            self.max = np.full(self.shape, info.min, dtype=raw.dtype)
+            self.raw_scaling = scaling
+        elif scaling != self.raw_scaling:
+            raise ValueError(f"baseline rasters differ in dtype/scale/offset/nodata: {scaling} vs {self.raw_scaling}")
+        sl = window.toslices() if window is not None else Ellipsis
+
+        np.minimum(self.min[sl], raw, out=self.min[sl], where=valid)
+        np.maximum(self.max[sl], raw, out=self.max[sl], where=valid)
+        arr = raw.astype(np.float32) * np.float32(scale) + np.float32(offset)
+        self._update_moments(arr, valid, sl)
+
+    def _update_moments(self, arr, valid, sl):
+        count = self.count[sl]
+        mean = self.mean[sl]
+        m2 = self.m2[sl]
+        count += valid
+        delta = np.where(valid, arr - mean, 0.0)
+        mean += np.divide(delta, count, out=np.zeros_like(delta), where=valid)
+        m2 += delta * np.where(valid, arr - mean, 0.0)
+
+    def products(self, nodata, ddof=0):
+        """
+        Return {stat: grid} with nodata where no valid sample was seen: float32,
+        except min/max of raw updates (storage dtype, nodata of the inputs).
+        """
+        empty = self.count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = self.m2 / (self.count.astype(np.float64) - ddof)
+        var[self.count <= ddof] = np.nan
+        out = {
+            "min": self.min.copy(),
+            "max": self.max.copy(),
+            "mean": self.mean.astype(np.float32),
+            "std": np.sqrt(var).astype(np.float32),
+            "count": self.count.astype(np.float32),
+        }
+        for stat, grid in out.items():
+            if grid.dtype.kind != "f":
+                grid[empty] = self.raw_scaling[3]
+            elif stat != "count":
+                grid[empty | np.isnan(grid)] = nodata
+        return out
+
+
+def baseline_paths(stats_folder, month):
+    """Output path per statistic for a month ('01'..'12')."""
+    return {stat: os.path.join(stats_folder, f"NDVI_{stat}_{month}.tif") for stat in baseline_stats}
+
+
+def accumulate_baseline(files, height, width, blocksize=512, aoi=None):
+    """
+    Read each file once (block by block) into a BaselineAccumulator. Integer
+    rasters (scaled Int16 NDVI) stay in storage units for min/max.
+    With aoi (aoi_pixels.AoiPixels), only the AOI cells, packed.
+    """
+    if aoi is not None:
+        return _accumulate_packed(files, aoi)
+    acc = BaselineAccumulator(height, width)
+    for fp in files:
+        with rasterio.open(fp) as src:
+            integer = np.dtype(src.dtypes[0]).kind in "iu"
+            for window in iter_windows(src, blocksize):
+                if integer:
+                    raw, valid = read_valid(src, window)
+                    acc.update_raw(raw, valid, src.scales[0], src.offsets[0], src.nodata, window)
+                else:
+                    acc.update(read_scaled(src, window), window)
+    return acc
+
+
+def _accumulate_packed(files, aoi):
+    acc = BaselineAccumulator(aoi.n)
+    for fp in files:
+        with rasterio.open(fp) as src:
+            if np.dtype(src.dtypes[0]).kind in "iu":
+                raw, valid = aoi.read_valid(src)
+                acc.update_raw(raw, valid, src.scales[0], src.offsets[0], src.nodata)
+            else:
+                acc.update(aoi.read(src))
+    return acc
+
+
+def accumulate_baseline_cube(cube, times):
+    """Accumulate the cube dates at indices times, one chunk read per window."""
+    acc = BaselineAccumulator(cube.height, cube.width)
+    for window in cube.windows():
+        for layer in cube.read(window, times):
+            acc.update(layer, window)
+    return acc
+
+
+def write_baseline(acc, paths, meta, nodata, ddof=0, aoi=None):
+    """
+    Write every baseline product of an accumulator to its path (nodata: of the
+    float products). aoi: the AoiPixels of a packed accumulator.
+    """
+    meta_float = write_meta(meta, dtype="float32", nodata=np.float32(nodata))
+    for stat, grid in acc.products(nodata, ddof).items():
+        if aoi is not None:
+            fill = 0 if stat == "count" else nodata if grid.dtype.kind == "f" else acc.raw_scaling[3]
+            grid = aoi.unpack(grid, fill)
+        if grid.dtype.kind == "f":
+            with rasterio.open(paths[stat], "w", **meta_float) as dst:
+                dst.write(grid, 1)
+        else:
+            dtype, scale, offset, raw_nodata = acc.raw_scaling
+            with rasterio.open(paths[stat], "w", **write_meta(meta, dtype=dtype, nodata=raw_nodata)) as dst:
+                dst.write(grid, 1)
+                dst.scales = (scale,)
+                dst.offsets = (offset,)
+        finalize(paths[stat])
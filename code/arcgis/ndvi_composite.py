@@ -0,0 +1,112 @@
+"""
+ndvi_composite.py
+Monthly NDVI composites from every MOD13Q1 16-day composite that overlaps
+the month, instead of copying the one image closest to the 15th. The HDF
+files are read in place, only the AOI window and in row bands, and combined
+with a max-value (MVC), mean or day-weighted mean rule (weights = days of
+the 16-day period inside the month). Written as the final NDVI product
+(Int16 + scale, or float32), like ndvi_hdf.preprocess_ndvi.
+Requirements: numpy, gdal (ArcGIS Pro's GDAL reads HDF4)
+Usage: from ndvi_composite import composite_month
+"""
+
+import numpy as np
+from osgeo import gdal
+from ndvi_hdf import (find_subdataset, open_aoi, aoi_window, aoi_mask, ndvi_subdataset,
+                      fill_value, valid_range)
+from raster_output import gdal_creation_options, gdal_finalize
+
+gdal.UseExceptions()
+
+rules = ("max", "mean", "weighted")
+
+
+class CompositeAccumulator:
+    """Combines raw MODIS NDVI blocks (int16) of several composites under one rule."""
+
+    def __init__(self, rule, shape):
+        if rule not in rules:
+            raise ValueError(f"Unknown composite rule '{rule}' (use one of {rules})")
+        self.rule = rule
+        if rule == "max":
+            self.best = np.full(shape, np.iinfo(np.int32).min, dtype=np.int32)
+        else:
+            self.total = np.zeros(shape, dtype=np.float64)
+            self.weight = np.zeros(shape, dtype=np.float64)
+
+    def add(self, raw, valid, days):
+        if self.rule == "max":
+            np.maximum(self.best, raw, out=self.best, where=valid)
+        else:
+            w = days if self.rule == "weighted" else 1.0
+            self.total += np.where(valid, raw.astype(np.float64) * w, 0.0)
+            self.weight += valid * w
+
+    def result(self):
+        """(raw composite rounded to int16 with the fill value, valid mask)."""
+        if self.rule == "max":
+            valid = self.best > np.iinfo(np.int32).min
+            raw = np.where(valid, self.best, fill_value)
+        else:
+            valid = self.weight > 0
+            raw = np.full(self.total.shape, fill_value, dtype=np.float64)
+            np.divide(self.total, self.weight, out=raw, where=valid)
+            np.rint(raw, out=raw)
+        return raw.astype(np.int16), valid
+
+
+def composite_month(hdf_days, aoi_path, out_path, rule="max", aoi_layer=None, subdataset=ndvi_subdataset,
+                    scale_factor=10000.0, nodata=-9999.0, storage="int16", block_rows=256):
+    """
+    Write the monthly composite of [(hdf path, overlap days), ...] on the AOI
+    window: nodata outside the AOI and where no composite has a valid value.
+    The HDFs must share one MODIS grid. Returns the number of valid pixels.
+    """
+    srcs = [gdal.Open(find_subdataset(p, subdataset)) for p, _ in hdf_days]
+    ref = srcs[0]
+    for (path, _), src in zip(hdf_days, srcs):
+        if src.GetGeoTransform() != ref.GetGeoTransform() or \
+                (src.RasterXSize, src.RasterYSize) != (ref.RasterXSize, ref.RasterYSize):
+            raise ValueError(f"{path} is not on the grid of {hdf_days[0][0]} (different MODIS tile?)")
+    aoi_src, layer = open_aoi(aoi_path, aoi_layer)
+    window, win_gt = aoi_window(ref, layer)
+    proj = ref.GetProjection()
+    in_aoi = aoi_mask(layer, window, win_gt, proj)
+    fills = [src.GetRasterBand(1).GetNoDataValue() for src in srcs]
+
+    dtype = np.int16 if storage == "int16" else np.float32
+    gdal_type = gdal.GDT_Int16 if storage == "int16" else gdal.GDT_Float32
+    out = gdal.GetDriverByName("GTiff").Create(out_path, window[2], window[3], 1, gdal_type,
+                                               options=gdal_creation_options(dtype))
+    out.SetGeoTransform(win_gt)
+    out.SetProjection(proj)
+    out_band = out.GetRasterBand(1)
+    out_band.SetNoDataValue(fill_value if storage == "int16" else nodata)
+    if storage == "int16":
+        out_band.SetScale(1.0 / scale_factor)
+        out_band.SetOffset(0.0)
+
+    col0, row0, ncols, nrows = window
+    n_valid = 0
+    for r in range(0, nrows, block_rows):
+        h = min(block_rows, nrows - r)
+        acc = CompositeAccumulator(rule, (h, ncols))
+        for (_, days), src, fill in zip(hdf_days, srcs, fills):
+            raw = src.GetRasterBand(1).ReadAsArray(col0, row0 + r, ncols, h)
+            valid = in_aoi[r:r + h] & (raw != (fill_value if fill is None else fill))
+            valid &= (raw >= valid_range[0]) & (raw <= valid_range[1])
+            acc.add(raw, valid, days)
+        raw, valid = acc.result()
+        if storage == "int16":
+            block = raw
+        else:
+            block = np.full(raw.shape, nodata, dtype=np.float32)
+            np.divide(raw, scale_factor, out=block, where=valid, casting="unsafe")
+        out_band.WriteArray(block, 0, r)
+        n_valid += int(valid.sum())
+
+    gdal_finalize(out)
+    out = None
+    srcs = None
+    aoi_src = None
+    return n_valid
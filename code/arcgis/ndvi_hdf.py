@@ -0,0 +1,128 @@
+"""
+ndvi_hdf.py
+Fused MOD13Q1 NDVI preprocessing: open the NDVI subdataset of the HDF by
+name, read only the window covering the AOI, mask pixels outside the AOI,
+fill values and values outside the valid range, and write the final NDVI
+raster in one pass (replaces the TIFF, clipped and real_clipped
+intermediates of NDVI_ToTIFF / NDVI_Clip_GIS / NDVI_Real_Convertion).
+Default storage is the MODIS Int16 with scale = 1 / scale_factor in the
+band metadata (half the size of float32); readers scale per block
+(raster_blocks.read_scaled). storage="float32" writes NDVI values.
+Requirements: numpy, gdal (ArcGIS Pro's GDAL reads HDF4)
+Usage: from ndvi_hdf import preprocess_ndvi
+"""
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+from raster_output import gdal_creation_options, gdal_finalize
+
+gdal.UseExceptions()
+
+# MOD13Q1 NDVI subdataset and its encoding (MODIS VI user guide)
+ndvi_subdataset = "250m 16 days NDVI"
+fill_value = -3000
+valid_range = (-2000, 10000)
+
+
+def _srs(wkt):
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(wkt)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def find_subdataset(hdf_path, name=ndvi_subdataset):
+    """GDAL name of the subdataset called `name` (e.g. '250m 16 days NDVI'), not its position."""
+    ds = gdal.Open(hdf_path)
+    subdatasets = [sd for sd, _ in ds.GetSubDatasets()]
+    for sd in subdatasets:
+        if sd.rsplit(":", 1)[-1].strip('"') == name:
+            return sd
+    raise ValueError(f"No subdataset '{name}' in {hdf_path}; found: {subdatasets}")
+
+
+def open_aoi(aoi_path, aoi_layer=None):
+    """OGR data source and layer of the AOI (layer by name for a geodatabase, else the first)."""
+    src = ogr.Open(aoi_path)
+    if src is None:
+        raise FileNotFoundError(f"Cannot open AOI: {aoi_path}")
+    layer = src.GetLayerByName(aoi_layer) if aoi_layer else src.GetLayer(0)
+    if layer is None:
+        raise ValueError(f"No layer '{aoi_layer}' in {aoi_path}")
+    return src, layer
+
+
+def aoi_window(ds, layer):
+    """
+    Pixel window (xoff, yoff, xsize, ysize) of the raster covering the AOI
+    extent (reprojected to the raster CRS), and its geotransform.
+    """
+    gt = ds.GetGeoTransform()
+    xmin, xmax, ymin, ymax = layer.GetExtent()
+    ct = osr.CoordinateTransformation(_srs(layer.GetSpatialRef().ExportToWkt()), _srs(ds.GetProjection()))
+    # Densified edges: the sinusoidal MODIS grid bends straight AOI edges
+    xmin, ymin, xmax, ymax = ct.TransformBounds(xmin, ymin, xmax, ymax, 21)
+
+    col0 = max(int(np.floor((xmin - gt[0]) / gt[1])), 0)
+    col1 = min(int(np.ceil((xmax - gt[0]) / gt[1])), ds.RasterXSize)
+    row0 = max(int(np.floor((ymax - gt[3]) / gt[5])), 0)
+    row1 = min(int(np.ceil((ymin - gt[3]) / gt[5])), ds.RasterYSize)
+    if col1 <= col0 or row1 <= row0:
+        raise ValueError("AOI does not overlap the raster")
+
+    window = (col0, row0, col1 - col0, row1 - row0)
+    win_gt = (gt[0] + col0 * gt[1], gt[1], gt[2], gt[3] + row0 * gt[5], gt[4], gt[5])
+    return window, win_gt
+
+
+def aoi_mask(layer, window, win_gt, proj):
+    """Boolean mask of the window pixels whose centre is inside the AOI (as ExtractByMask)."""
+    mem = gdal.GetDriverByName("MEM").Create("", window[2], window[3], 1, gdal.GDT_Byte)
+    mem.SetGeoTransform(win_gt)
+    mem.SetProjection(proj)
+    gdal.RasterizeLayer(mem, [1], layer, burn_values=[1])
+    return mem.GetRasterBand(1).ReadAsArray().astype(bool)
+
+
+def preprocess_ndvi(hdf_path, aoi_path, out_path, aoi_layer=None, subdataset=ndvi_subdataset,
+                    scale_factor=10000.0, nodata=-9999.0, storage="int16"):
+    """
+    Write the AOI window of the NDVI subdataset, nodata outside the AOI, on
+    fill values and outside the valid range. storage "int16": raw values with
+    scale 1 / scale_factor and the fill value as nodata; "float32": raw /
+    scale_factor with nodata. Returns the number of valid pixels.
+    """
+    src = gdal.Open(find_subdataset(hdf_path, subdataset))
+    band = src.GetRasterBand(1)
+    aoi_src, layer = open_aoi(aoi_path, aoi_layer)
+    window, win_gt = aoi_window(src, layer)
+    proj = src.GetProjection()
+
+    raw = band.ReadAsArray(*window)
+    fill = band.GetNoDataValue()
+    valid = aoi_mask(layer, window, win_gt, proj)
+    valid &= raw != (fill_value if fill is None else fill)
+    valid &= (raw >= valid_range[0]) & (raw <= valid_range[1])
+
+    if storage == "int16":
+        ndvi = np.where(valid, raw, fill_value).astype(np.int16)
+        nodata = fill_value
+    else:
+        ndvi = np.full(raw.shape, nodata, dtype=np.float32)
+        np.divide(raw, scale_factor, out=ndvi, where=valid, casting="unsafe")
+
+    gdal_type = gdal.GDT_Int16 if storage == "int16" else gdal.GDT_Float32
+    out = gdal.GetDriverByName("GTiff").Create(out_path, window[2], window[3], 1, gdal_type,
+                                               options=gdal_creation_options(ndvi.dtype))
+    out.SetGeoTransform(win_gt)
+    out.SetProjection(proj)
+    out_band = out.GetRasterBand(1)
+    out_band.SetNoDataValue(nodata)
+    if storage == "int16":
+        out_band.SetScale(1.0 / scale_factor)
+        out_band.SetOffset(0.0)
+    out_band.WriteArray(ndvi)
+    gdal_finalize(out)
+    out = None
+    aoi_src = None
+    return int(valid.sum())
@@ -0,0 +1,197 @@
+"""
+ndvi_indices.py
+Fused NDVI index kernel: one read of an NDVI block and of its month's
+baseline (min/max/mean/std) gives the VCI, the z-score anomaly, its clipped
+visualization and per-threshold exceedance flags together. The arithmetic
+runs as NumPy ufuncs into buffers allocated once per window size, so a block
+makes no temporaries; the separate VCI (vci_parallel) and z-score
+(ndvi_anomaly) passes read the NDVI raster once each. Same values as those
+passes: VCI from raw values when NDVI and min/max share their scaling.
+Exceedance flags (uint8, 255 = nodata): bit 2k set where z < -thresholds[k],
+bit 2k+1 where z > thresholds[k] (at most 4 thresholds).
+Requirements: rasterio, numpy
+Usage: from ndvi_indices import write_indices
+"""
+
+import numpy as np
+import rasterio
+from raster_blocks import iter_windows, read_scaled, read_valid, is_scaled, same_scaling
+from raster_output import write_meta, finalize, cog_products
+
+flags_nodata = 255
+
+
+class IndexKernel:
+    """Index buffers of one window size; run() fills views of them for smaller (edge) blocks."""
+
+    def __init__(self, shape, nodata, min_std=0.1, min_vis=-5.0, max_vis=5.0, thresholds=()):
+        if len(thresholds) > 4:
+            raise ValueError("at most 4 exceedance thresholds fit in the uint8 flags")
+        self.nodata = np.float32(nodata)
+        self.min_std = min_std
+        self.vis_range = (min_vis, max_vis)
+        self.thresholds = thresholds
+        self._f32 = {k: np.empty(shape, dtype=np.float32) for k in ("ndvi", "a", "denom", "vci", "z", "vis")}
+        self._u32 = {k: np.empty(shape, dtype=np.uint32) for k in ("keep", "fill")}
+        self._bool = {k: np.empty(shape, dtype=bool) for k in ("valid_vci", "valid_z", "m")}
+        self._u8 = {k: np.empty(shape, dtype=np.uint8) for k in ("flags", "bit")}
+
+    def _views(self, shape):
+        sl = tuple(slice(0, n) for n in shape)
+        return tuple({k: v[sl] for k, v in bufs.items()} for bufs in (self._f32, self._u32, self._bool, self._u8))
+
+    def _valid(self, out, m, *arrays):
+        """out &= every array finite and not nodata."""
+        for arr in arrays:
+            np.isfinite(arr, out=m)
+            out &= m
+            np.not_equal(arr, self.nodata, out=m)
+            out &= m
+
+    @staticmethod
+    def _select_masks(valid, keep, fill, fill_value):
+        """
+        Bit masks of a branchless where(valid, x, fill_value) on float32 bits:
+        keep = all ones on valid cells, fill = the fill bits elsewhere.
+        """
+        np.copyto(keep, valid, casting="unsafe")
+        np.negative(keep, out=keep)
+        np.invert(keep, out=fill)
+        fill &= np.float32(fill_value).view(np.uint32)
+
+    @staticmethod
+    def _select(x, keep, fill):
+        bits = x.view(np.uint32)
+        bits &= keep
+        bits |= fill
+
+    def run(self, raw, valid, scale, offset, mean, std, vmin=None, vmax=None, vci_raw=False):
+        """
+        raw/valid: NDVI block in storage units and its validity (read_valid);
+        scale/offset: its scaling (None = float values as stored); mean/std:
+        float32 baseline blocks (NaN = nodata); vmin/vmax: min/max blocks in raw
+        units (vci_raw) or physical units, None for no VCI.
+        Returns {"vci", "z", "vis", "flags", "valid_z"}: views of the buffers,
+        overwritten by the next run().
+        The indices are computed on every cell and the nodata cells replaced
+        afterwards by bit masks: masked ufuncs (where=) branch per cell and
+        cost several times the arithmetic on scattered nodata.
+        """
+        f, u32, b, u8 = self._views(raw.shape)
+        ndvi, m, keep, fill = f["ndvi"], b["m"], u32["keep"], u32["fill"]
+
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            # NDVI in physical units (as read_scaled, without the NaN: valid says where)
+            np.copyto(ndvi, raw, casting="unsafe")
+            if scale is not None:
+                np.multiply(ndvi, np.float32(scale), out=ndvi)
+                np.add(ndvi, np.float32(offset), out=ndvi)
+
+            out = {"valid_z": b["valid_z"]}
+            if vmin is not None:
+                # VCI = 100 * (NDVI - min) / (max - min), as vci_parallel.vci_block
+                a = ndvi
+                if vci_raw:
+                    a = f["a"]
+                    np.copyto(a, raw, casting="unsafe")
+                valid_vci, denom, vci = b["valid_vci"], f["denom"], f["vci"]
+                np.subtract(vmax, vmin, out=denom)
+                np.copyto(valid_vci, valid)
+                self._valid(valid_vci, m, a, vmin, vmax)
+                np.greater(denom, 0, out=m)
+                valid_vci &= m
+                np.subtract(a, vmin, out=vci)
+                np.multiply(vci, 100.0, out=vci)
+                np.divide(vci, denom, out=vci)
+                self._select_masks(valid_vci, keep, fill, self.nodata)
+                self._select(vci, keep, fill)
+                out["vci"] = vci
+
+            # z = (NDVI - mean) / std where std > min_std, as ndvi_anomaly.zscore_block
+            valid_z, z, vis = b["valid_z"], f["z"], f["vis"]
+            np.copyto(valid_z, valid)
+            self._valid(valid_z, m, ndvi, mean)
+            np.not_equal(std, self.nodata, out=m)
+            valid_z &= m
+            np.greater(std, self.min_std, out=m)
+            valid_z &= m
+            np.subtract(ndvi, mean, out=z)
+            np.divide(z, std, out=z)
+            self._select_masks(valid_z, keep, fill, self.nodata)
+            self._select(z, keep, fill)
+
+            # Clipped copy for display
+            np.clip(z, *self.vis_range, out=vis)
+            self._select(vis, keep, fill)
+
+            # Exceedance flags: one bit per threshold side, 255 on nodata cells
+            flags, bit = u8["flags"], u8["bit"]
+            np.logical_not(valid_z, out=m)
+            np.negative(m.view(np.uint8), out=flags)
+            for k, thr in enumerate(self.thresholds):
+                for side, compare, limit in ((0, np.less, -thr), (1, np.greater, thr)):
+                    compare(z, limit, out=m)
+                    np.left_shift(m.view(np.uint8), np.uint8(2 * k + side), out=bit)
+                    flags |= bit
+
+        out.update(z=z, vis=vis, flags=flags)
+        return out
+
+
+def write_indices(ndvi_path, mean_path, std_path, z_path, vis_path, nodata, vci=None, flags_path=None,
+                  min_std=0.1, min_vis=-5.0, max_vis=5.0, thresholds=(), blocksize=512, stats=None, aoi=None):
+    """
+    One pass over an NDVI raster writing its z-score, clipped z-score and,
+    when given, its VCI (vci = (min_path, max_path, out_path)) and exceedance
+    flags (flags_path). stats (raster_stats.StreamingStats) gets the valid z
+    values of every block. aoi (aoi_pixels.AoiPixels): the AOI cells as one
+    packed block instead of windows.
+    """
+    paths = [ndvi_path, mean_path, std_path] + (list(vci[:2]) if vci else [])
+    srcs = [rasterio.open(p) for p in paths]
+    src = srcs[0]
+    meta = write_meta(src.meta, dtype="float32", nodata=np.float32(nodata))
+    flags_meta = write_meta(src.meta, dtype="uint8", nodata=flags_nodata)
+    # Scale and offset cancel in the VCI when NDVI and min/max share them
+    vci_raw = bool(vci) and same_scaling(src, *srcs[3:])
+    scale, offset = (src.scales[0], src.offsets[0]) if is_scaled(src) else (None, None)
+    outputs = [(z_path, "z", meta), (vis_path, "vis", meta)]
+    if vci:
+        outputs.append((vci[2], "vci", meta))
+    if flags_path:
+        outputs.append((flags_path, "flags", flags_meta))
+
+    try:
+        if aoi is not None:
+            kernel = IndexKernel((aoi.n,), nodata, min_std, min_vis, max_vis, thresholds)
+            raw, valid = aoi.read_valid(src)
+            mean, std = aoi.read(srcs[1]), aoi.read(srcs[2])
+            vmin_vmax = [aoi.read(s, scaled=not vci_raw) for s in srcs[3:]]
+            res = kernel.run(raw, valid, scale, offset, mean, std, *vmin_vmax, vci_raw=vci_raw)
+            if stats is not None:
+                stats.update(res["z"][res["valid_z"]])
+            for path, key, out_meta in outputs:
+                aoi.write(path, res[key], out_meta, out_meta["nodata"])
+            return
+
+        kernel = IndexKernel((min(blocksize, src.height), min(blocksize, src.width)),
+                             nodata, min_std, min_vis, max_vis, thresholds)
+        dsts = [(rasterio.open(path, "w", **out_meta), key) for path, key, out_meta in outputs]
+        try:
+            for window in iter_windows(src, blocksize):
+                raw, valid = read_valid(src, window)
+                mean, std = read_scaled(srcs[1], window), read_scaled(srcs[2], window)
+                vmin_vmax = [read_scaled(s, window, scaled=not vci_raw) for s in srcs[3:]]
+                res = kernel.run(raw, valid, scale, offset, mean, std, *vmin_vmax, vci_raw=vci_raw)
+                if stats is not None:
+                    stats.update(res["z"][res["valid_z"]])
+                for dst, key in dsts:
+                    dst.write(res[key], 1, window=window)
+        finally:
+            for dst, _ in dsts:
+                dst.close()
+        for path, _, _ in outputs:
+            finalize(path, cog=cog_products)
+    finally:
+        for s in srcs:
+            s.close()
@@ -0,0 +1,197 @@
+"""
+pipeline.py
+Stage graph and scheduler of the drought pipeline. Every stage script exposes
+plan(manifest) -> work items still to do (one per date / month / file),
+process(item) -> (records, result) and optionally finish(manifest, results).
+The scheduler starts a stage as soon as the stages it depends on are done,
+so the NDVI and CHIRPS branches run at the same time, and fans the items of
+every stage out over one shared process pool. Workers only compute; this
+process alone updates the manifest (pipeline_manifest.py).
+Requirements: the stage scripts' requirements
+Usage: from pipeline import run_dag, run_standalone
+"""
+
+import time
+import threading
+import importlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pipeline_config import setting
+from pipeline_manifest import open_manifest
+
+Stage = namedtuple("Stage", "module deps plan process finish")
+
+# Stage name -> script module, upstream stages and its functions
+stages = {
+    "chirps_extract": Stage("Chirp_Extraction", [], "plan", "process", None),
+    "chirps_clip": Stage("Chirp_Clip_GIS", ["chirps_extract"], "plan", "process", None),
+    "spi": Stage("spi_calculation", ["chirps_clip"], "plan", "process", None),
+    "ndvi_rename": Stage("NDVI_name_format", [], "plan", "process", None),
+    "ndvi_select": Stage("NDVI_OneImage_PerMonth", ["ndvi_rename"], "plan", "process", None),
+    "ndvi_preprocess": Stage("NDVI_Preprocess", ["ndvi_select"], "plan", "process", None),
+    "ndvi_baseline": Stage("compute_vci", ["ndvi_preprocess"], "plan_baseline", "process_baseline", None),
+    "vci": Stage("compute_vci", ["ndvi_baseline"], "plan_vci", "process_vci", None),
+    "anomaly": Stage("NDVI_Anomaly_Calculation2", ["ndvi_baseline"], "plan", "process", "finish"),
+    "zonal_merge": Stage("zonalstats_csvmerge", ["spi", "vci", "anomaly"], "plan", "process", None),
+    "drought_affected": Stage("DroughtAffected_Percentage", ["anomaly"], "plan", "process", None),
+}
+
+# "composite": every 16-day HDF overlapping a month -> monthly NDVI (NDVI_Monthly_Composite.py)
+# "fused": HDF closest to the 15th -> final NDVI in one pass (NDVI_Preprocess.py)
+# "arcpy": the original TIFF -> ExtractByMask -> scale chain, with its intermediates
+ndvi_route = setting("pipeline", "ndvi_route", "composite")
+# Stage writing the final NDVI rasters of the route (the reference grid among them)
+ndvi_stage = "ndvi_preprocess"
+if ndvi_route == "composite":
+    del stages["ndvi_select"], stages["ndvi_preprocess"]
+    stages["ndvi_composite"] = Stage("NDVI_Monthly_Composite", ["ndvi_rename"], "plan", "process", None)
+    ndvi_stage = "ndvi_composite"
+elif ndvi_route == "arcpy":
+    del stages["ndvi_preprocess"]
+    stages.update({
+        "ndvi_totiff": Stage("NDVI_ToTIFF", ["ndvi_select"], "plan", "process", None),
+        "ndvi_clip": Stage("NDVI_Clip_GIS", ["ndvi_totiff"], "plan", "process", None),
+        "ndvi_scale": Stage("NDVI_Real_Convertion", ["ndvi_clip"], "plan", "process", None),
+    })
+    ndvi_stage = "ndvi_scale"
+stages["ndvi_baseline"] = stages["ndvi_baseline"]._replace(deps=[ndvi_stage])
+
+# Fused indices: the anomaly stage also writes the VCI from the same NDVI read
+if setting("anomaly", "fused_vci", True):
+    del stages["vci"]
+    stages["zonal_merge"] = stages["zonal_merge"]._replace(deps=["spi", "anomaly"])
+
+# SPI on the aligned or native CHIRPS grid reads the extracted (or archived)
+# CHIRPS directly: no Chirp_Clip_GIS.py rasters. Its grid and AOI mask come
+# from the NDVI reference raster, so it waits for the stage writing it
+if setting("spi", "spi_mode", "aligned") != "resampled":
+    del stages["chirps_clip"]
+    stages["spi"] = stages["spi"]._replace(deps=["chirps_extract", ndvi_stage])
+
+
+def upstream(names):
+    """The given stages plus every stage they depend on."""
+    out = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in out:
+            out.add(name)
+            todo.extend(stages[name].deps)
+    return out
+
+
+def stage_order(selected=None):
+    """Stage names in a dependency-respecting order (all stages if selected is None)."""
+    selected = set(stages if selected is None else selected)
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dep in stages[name].deps:
+            if dep in selected:
+                visit(dep)
+        order.append(name)
+
+    for name in stages:
+        if name in selected:
+            visit(name)
+    return order
+
+
+def _record_all(manifest, records):
+    for output, inputs, params in records:
+        manifest.record(output, inputs, params)
+
+
+def run_standalone(plan, process, finish=None, workers=1):
+    """Run one stage on its own (python <script>.py), items over `workers` processes."""
+    with open_manifest() as manifest:
+        items = plan(manifest)
+        results = []
+        if workers == 1 or len(items) <= 1:
+            outputs = map(process, items)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            outputs = pool.map(process, items)
+        try:
+            for records, result in outputs:
+                _record_all(manifest, records)
+                results.append(result)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if finish is not None:
+            finish(manifest, results)
+    return results
+
+
+def run_dag(selected=None, workers=None):
+    """
+    Run the selected stages (default: all) and their order constraints.
+    Returns {stage: (status, n_items, seconds)}; status is "done", "failed"
+    or "skipped" (an upstream stage failed).
+    """
+    order = stage_order(selected)
+    workers = workers or setting("pipeline", "workers", None)
+    lock = threading.Lock()
+    finished = {name: threading.Event() for name in order}
+    report = {}
+
+    with open_manifest() as manifest:
+        pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+
+        def run_stage(name):
+            stage = stages[name]
+            try:
+                for dep in stage.deps:
+                    if dep in finished:
+                        finished[dep].wait()
+                        if report[dep][0] != "done":
+                            report[name] = ("skipped", 0, 0.0)
+                            return
+                t0 = time.perf_counter()
+                module = importlib.import_module(stage.module)
+                with lock:
+                    items = getattr(module, stage.plan)(manifest)
+                print(f"[{name}] {len(items)} item(s) to process")
+                process = getattr(module, stage.process)
+                if pool is None:
+                    outputs = map(process, items)
+                else:
+                    outputs = (f.result() for f in [pool.submit(process, item) for item in items])
+                results = []
+                for records, result in outputs:
+                    with lock:
+                        _record_all(manifest, records)
+                    results.append(result)
+                if stage.finish:
+                    with lock:
+                        getattr(module, stage.finish)(manifest, results)
+                report[name] = ("done", len(items), time.perf_counter() - t0)
+                print(f"[{name}] done in {report[name][2]:.1f} s")
+            except (Exception, SystemExit) as exc:
+                # Stage plans exit with a message when they have no inputs
+                # (e.g. compute_vci "No NDVI files found"): a failed stage too
+                report[name] = ("failed", 0, 0.0)
+                print(f"[{name}] FAILED: {exc!r}")
+            finally:
+                finished[name].set()
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(order) or 1) as threads:
+                list(threads.map(run_stage, order))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return {name: report[name] for name in order}
+
+
+def print_report(report, wall_seconds):
+    """Per-stage status, item count and time; stages overlap, so they sum to more than the wall time."""
+    print(f"\n{'stage':<18}{'status':<9}{'items':>7}{'seconds':>10}")
+    for name, (status, n_items, seconds) in report.items():
+        print(f"{name:<18}{status:<9}{n_items:>7}{seconds:>10.1f}")
+    print(f"{'wall time':<34}{wall_seconds:>10.1f}")
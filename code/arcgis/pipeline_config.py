@@ -0,0 +1,50 @@
+"""
+pipeline_config.py
+Settings of the stage scripts from one INI file. Section = stage name (as in
+pipeline.py), key = the CONFIG variable of the script; keys that are not set
+keep the default written in the script. Values are read as Python literals
+when they parse as one (numbers, lists, None, True) and as plain strings
+otherwise, so Windows paths need no quoting. ${section:key} references
+another value (e.g. ${paths:root}).
+The file is pipeline.ini next to the scripts, or the path in ARCOSECO_CONFIG.
+Requirements: none (standard library)
+Usage: from pipeline_config import setting
+"""
+
+import os
+import ast
+import configparser
+
+config_env = "ARCOSECO_CONFIG"
+
+_parser = None
+
+
+def config_path():
+    return os.environ.get(config_env) or os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.ini")
+
+
+def _load():
+    global _parser
+    if _parser is None:
+        _parser = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
+        _parser.optionxform = str      # keys are case-sensitive variable names
+        path = config_path()
+        if os.path.exists(path):
+            _parser.read(path, encoding="utf-8")
+    return _parser
+
+
+def _value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def setting(section, key, default):
+    """Value of key in section of the config file, or default when not set."""
+    parser = _load()
+    if parser.has_section(section) and parser.has_option(section, key):
+        return _value(parser.get(section, key))
+    return default
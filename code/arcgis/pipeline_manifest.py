@@ -0,0 +1,108 @@
+"""
+pipeline_manifest.py
+Dependency manifest for incremental runs. Every product is recorded with the
+content hashes of its inputs and the parameters it was made with; a stage
+recomputes an output only when it is missing, an input was added, removed or
+changed, or a parameter changed. Hashes are cached by file size and mtime, so
+unchanged files are not re-read.
+Requirements: none (standard library)
+Usage: from pipeline_manifest import open_manifest
+"""
+
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from pipeline_config import setting
+
+# Shared by all stages
+manifest_path = setting("pipeline", "manifest_path",
+                        r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\pipeline_manifest.json")
+
+# Bump when the entry format changes (older manifests are then ignored)
+manifest_version = 1
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _params_key(params):
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+class Manifest:
+    """Products (output -> inputs, params) and the file hash cache, stored as JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        self.hashes = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == manifest_version:
+                self.outputs = data["outputs"]
+                self.hashes = data["hashes"]
+
+    def file_hash(self, path):
+        """sha1 of the file content, cached by (size, mtime)."""
+        st = os.stat(path)
+        key = _key(path)
+        cached = self.hashes.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        self.hashes[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def is_current(self, output, inputs, params=None):
+        """
+        True if output exists and was recorded as made from exactly these inputs
+        (same content) and params. Outputs without an entry (e.g. written before
+        the manifest existed, or interrupted) are not current.
+        """
+        entry = self.outputs.get(_key(output))
+        if entry is None or not os.path.exists(output):
+            return False
+        # Rewritten since it was recorded (by hand or an interrupted run)
+        st = os.stat(output)
+        if entry["output"] != [st.st_size, st.st_mtime_ns]:
+            return False
+        if entry["params"] != _params_key(params):
+            return False
+        if set(entry["inputs"]) != {_key(p) for p in inputs}:
+            return False
+        for p in inputs:
+            if not os.path.exists(p) or self.file_hash(p) != entry["inputs"][_key(p)]:
+                return False
+        return True
+
+    def record(self, output, inputs, params=None):
+        """Record that output was made from inputs and params (call after writing it)."""
+        st = os.stat(output)
+        self.outputs[_key(output)] = {
+            "output": [st.st_size, st.st_mtime_ns],
+            "inputs": {_key(p): self.file_hash(p) for p in inputs},
+            "params": _params_key(params),
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": manifest_version, "outputs": self.outputs, "hashes": self.hashes}, f)
+        os.replace(tmp_path, self.path)
+
+
+@contextmanager
+def open_manifest(path=None):
+    """Load the manifest and save it on exit, also after an error (finished outputs stay recorded)."""
+    manifest = Manifest(path or manifest_path)
+    try:
+        yield manifest
+    finally:
+        manifest.save()
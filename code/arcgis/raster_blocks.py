@@ -0,0 +1,59 @@
+"""
+raster_blocks.py
+Block (window) iteration and block reading shared by the rasterio-based
+stages. NDVI may be stored as scaled Int16 (raw * scale + offset, GDAL
+scale/offset metadata); read_scaled applies the scaling per block, only for
+the blocks that are read as physical values.
+Requirements: rasterio, numpy
+Usage: from raster_blocks import iter_windows, read_scaled, read_valid, same_scaling
+"""
+
+import numpy as np
+from rasterio.windows import Window
+
+
+def iter_windows(src, blocksize=512):
+    """Yield blocksize x blocksize windows covering a dataset (anything with width/height)."""
+    for top in range(0, src.height, blocksize):
+        h = min(blocksize, src.height - top)
+        for left in range(0, src.width, blocksize):
+            w = min(blocksize, src.width - left)
+            yield Window(left, top, w, h)
+
+
+def is_scaled(src, band=1):
+    """True if the band carries a scale or offset other than 1 / 0."""
+    return src.scales[band - 1] != 1.0 or src.offsets[band - 1] != 0.0
+
+
+def same_scaling(*srcs):
+    """True if all datasets share dtype, scale and offset (their raw values are directly comparable)."""
+    first = srcs[0]
+    return all(s.dtypes[0] == first.dtypes[0] and s.scales[0] == first.scales[0]
+               and s.offsets[0] == first.offsets[0] for s in srcs[1:])
+
+
+def read_valid(src, window=None, band=1):
+    """Raw block in its storage dtype and its validity mask (not nodata)."""
+    raw = src.read(band, window=window)
+    if src.nodata is None:
+        return raw, np.ones(raw.shape, dtype=bool)
+    valid = raw != src.nodata
+    if raw.dtype.kind == "f":
+        valid &= ~np.isnan(raw)
+    return raw, valid
+
+
+def read_scaled(src, window=None, band=1, scaled=True):
+    """
+    Block as float32 in physical units (raw * scale + offset), NaN where nodata.
+    scaled=False keeps raw units, for ratios of rasters with the same scaling.
+    Float rasters without scale metadata are returned as stored.
+    """
+    raw, valid = read_valid(src, window, band)
+    arr = raw.astype("float32")
+    if scaled and is_scaled(src, band):
+        arr *= np.float32(src.scales[band - 1])
+        arr += np.float32(src.offsets[band - 1])
+    arr[~valid] = np.nan
+    return arr
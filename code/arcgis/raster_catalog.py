@@ -0,0 +1,184 @@
+"""
+raster_catalog.py
+Persistent SQLite catalog of the raster products: path, variable, date,
+grid fingerprint, nodata, dtype, size, mtime and content hash. A folder is
+listed again only when its modification time changed (a file was added,
+removed or renamed), and only new or rewritten files are opened and hashed,
+so stages get indexed date / variable lookups and baseline/target splits
+without walking folders of thousands of files on every run.
+Requirements: rasterio (standard library sqlite3)
+Usage: from raster_catalog import catalog_files, catalog_lookup, open_catalog
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+import rasterio
+from chirps_archive import archive_path
+from pipeline_config import setting
+from spi_params import grid_fingerprint
+
+catalog_path = setting("pipeline", "catalog_path",
+                       r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\raster_catalog.sqlite")
+
+# Bump when the tables change (the catalog is then rebuilt)
+catalog_version = 1
+
+# File names of every product: variable -> regex with year, month (, day) groups
+name_patterns = {
+    "ndvi": r"real_clipped_NDVI_(?P<year>\d{4})_(?P<month>\d{2})_(?P<day>\d{2})\.tif",
+    "zscore": r"zscore_real_clipped_NDVI_(?P<year>\d{4})_(?P<month>\d{2})_(?P<day>\d{2})\.tif",
+    "vci": r"VCI_(?P<year>\d{4})_(?P<month>\d{2})_(?P<day>\d{2})\.tif",
+    "chirps": r"(?:clip_)?chirps-v2\.0\.(?P<year>\d{4})\.(?P<month>\d{2})\.tif(?:\.gz)?",
+    "spi1": r"SPI1_(?P<year>\d{4})_(?P<month>\d{2})\.tif",
+}
+
+_schema = """
+CREATE TABLE IF NOT EXISTS rasters (
+    path TEXT PRIMARY KEY, variable TEXT, folder TEXT, name TEXT,
+    year INTEGER, month INTEGER, day INTEGER,
+    size INTEGER, mtime_ns INTEGER, grid TEXT, nodata REAL, dtype TEXT, hash TEXT);
+CREATE INDEX IF NOT EXISTS rasters_date ON rasters (variable, folder, year, month, day);
+CREATE TABLE IF NOT EXISTS folders (
+    variable TEXT, folder TEXT, mtime_ns INTEGER, PRIMARY KEY (variable, folder));
+"""
+
+
+def _folder_key(folder):
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def raster_info(path):
+    """(grid fingerprint, nodata, dtype) of a raster or .tif.gz archive."""
+    with rasterio.open(archive_path(path)) as src:
+        grid = grid_fingerprint(src.transform.to_gdal(), src.crs.to_wkt() if src.crs else "", src.shape)
+        return grid, src.nodata, src.dtypes[0]
+
+
+class Catalog:
+    """Raster products in one SQLite file; sync() a folder before querying it."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != catalog_version:
+            self.db.executescript("DROP TABLE IF EXISTS rasters; DROP TABLE IF EXISTS folders;")
+            self.db.execute(f"PRAGMA user_version = {catalog_version}")
+        self.db.executescript(_schema)
+
+    def sync(self, variable, folder):
+        """
+        Bring the entries of variable in folder up to date. Returns the number of
+        files (re)indexed; 0 without listing the folder if its mtime is unchanged.
+        A file rewritten in place does not change the folder mtime: use
+        refresh() for it (the pipeline manifest still checks content hashes).
+        """
+        key = _folder_key(folder)
+        folder_mtime = os.stat(folder).st_mtime_ns if os.path.isdir(folder) else None
+        row = self.db.execute("SELECT mtime_ns FROM folders WHERE variable = ? AND folder = ?",
+                              (variable, key)).fetchone()
+        if row is not None and row[0] == folder_mtime:
+            return 0
+
+        pattern = re.compile(name_patterns[variable] + "$", re.IGNORECASE)
+        known = {path: (size, mtime) for path, size, mtime in self.db.execute(
+            "SELECT path, size, mtime_ns FROM rasters WHERE variable = ? AND folder = ?", (variable, key))}
+        seen = set()
+        n_indexed = 0
+        with self.db:
+            for entry in (os.scandir(folder) if folder_mtime is not None else []):
+                m = pattern.match(entry.name)
+                if not m or not entry.is_file():
+                    continue
+                st = entry.stat()
+                seen.add(entry.path)
+                if known.get(entry.path) == (st.st_size, st.st_mtime_ns):
+                    continue
+                self._index(variable, key, entry.path, m, st)
+                n_indexed += 1
+            gone = [(p,) for p in known if p not in seen]
+            self.db.executemany("DELETE FROM rasters WHERE path = ?", gone)
+            self.db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)", (variable, key, folder_mtime))
+        return n_indexed
+
+    def refresh(self, variable, folder, path):
+        """Re-index one file written in place (no folder listing)."""
+        m = re.compile(name_patterns[variable] + "$", re.IGNORECASE).match(os.path.basename(path))
+        if m:
+            with self.db:
+                self._index(variable, _folder_key(folder), path, m, os.stat(path))
+
+    def _index(self, variable, key, path, m, st):
+        grid, nodata, dtype = raster_info(path)
+        day = m.groupdict().get("day")
+        self.db.execute("INSERT OR REPLACE INTO rasters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, variable, key, os.path.basename(path), int(m.group("year")),
+                         int(m.group("month")), int(day) if day else None, st.st_size, st.st_mtime_ns,
+                         grid, nodata, dtype, _sha1(path)))
+
+    def files(self, variable, folder, month=None, start_year=None, end_year=None):
+        """Paths of variable in folder ordered by date, optionally one calendar month / a year range."""
+        sql = "SELECT path FROM rasters WHERE variable = ? AND folder = ?"
+        args = [variable, _folder_key(folder)]
+        for clause, value in (("month = ?", month), ("year >= ?", start_year), ("year <= ?", end_year)):
+            if value is not None:
+                sql += " AND " + clause
+                args.append(value)
+        return [r[0] for r in self.db.execute(sql + " ORDER BY year, month, day, name", args)]
+
+    def lookup(self, variable, folder, year, month):
+        """Path of variable for a year-month (first by day), or None."""
+        row = self.db.execute("SELECT path FROM rasters WHERE variable = ? AND folder = ? AND year = ? "
+                              "AND month = ? ORDER BY day, name LIMIT 1",
+                              (variable, _folder_key(folder), year, month)).fetchone()
+        return row[0] if row else None
+
+    def entries(self, variable, folder):
+        """Every column of the entries of variable in folder, as dicts ordered by date."""
+        cur = self.db.execute("SELECT * FROM rasters WHERE variable = ? AND folder = ? "
+                              "ORDER BY year, month, day, name", (variable, _folder_key(folder)))
+        names = [d[0] for d in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def close(self):
+        self.db.close()
+
+
+@contextmanager
+def open_catalog(path=None):
+    catalog = Catalog(path or catalog_path)
+    try:
+        yield catalog
+    finally:
+        catalog.close()
+
+
+def catalog_files(variable, folder, **query):
+    """Sync folder, then its dated files of variable (see Catalog.files for the query)."""
+    with open_catalog() as catalog:
+        catalog.sync(variable, folder)
+        return catalog.files(variable, folder, **query)
+
+
+def catalog_lookup(variable, folder, year, month):
+    """Sync folder, then the file of variable for year-month (None if missing)."""
+    with open_catalog() as catalog:
+        catalog.sync(variable, folder)
+        return catalog.lookup(variable, folder, year, month)
+
+
+def catalog_entries(variable, folder):
+    """Sync folder, then the (path, year, month, day) of every file of variable in date order."""
+    with open_catalog() as catalog:
+        catalog.sync(variable, folder)
+        return [(e["path"], e["year"], e["month"], e["day"]) for e in catalog.entries(variable, folder)]
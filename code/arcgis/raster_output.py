@@ -0,0 +1,137 @@
+"""
+raster_output.py
+Shared GeoTIFF output profile for every stage: 512x512 tiles, DEFLATE (or
+ZSTD) with the predictor matching the data type (2 = integers, 3 = floats)
+and internal overviews. Tiles match the raster_blocks window size, so the
+windowed reads of the next stage touch whole tiles only.
+Final products (SPI, z-score, VCI, flags, frequency maps) are then rewritten
+as cloud-optimized GeoTIFFs (overviews ahead of the full-resolution tiles).
+Profiles are provided for rasterio (write_meta / finalize), GDAL
+(gdal_creation_options / gdal_finalize / gdal_cog) and ArcPy (set_arcpy_output_env).
+Requirements: numpy; rasterio, GDAL or ArcPy for the respective helpers
+Usage: from raster_output import write_meta, finalize
+"""
+
+import os
+import numpy as np
+try:
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+except ImportError:     # ArcGIS Pro / GDAL-only environments use the gdal_ and arcpy helpers
+    rasterio = None
+
+# ---------------- PROFILE ----------------
+tile_size = 512
+compress = "deflate"            # "deflate" (readable everywhere) or "zstd" (GDAL >= 2.3)
+compress_level = 6
+overview_factors = (2, 4, 8, 16)
+overview_resampling = "average"
+# COG layout for final products (one extra copy of each); intermediates
+# (baselines, masks, preprocessed NDVI) keep the plain tiled layout
+cog_products = True
+
+
+def predictor_for(dtype):
+    """TIFF predictor for a data type: 3 (floating point) for floats, 2 (horizontal) otherwise."""
+    return 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+
+
+def write_meta(meta, dtype=None, nodata=None, count=1, compress_alg=None):
+    """
+    Copy of a rasterio meta/profile with the shared output profile applied.
+    dtype / nodata override the source values when given.
+    """
+    out = dict(meta)
+    if dtype is not None:
+        out["dtype"] = np.dtype(dtype).name
+    if nodata is not None:
+        out["nodata"] = nodata
+    out.update(driver="GTiff", count=count, **creation_options(out["dtype"], compress_alg))
+    return out
+
+
+def creation_options(dtype, compress_alg=None):
+    """rasterio GTiff creation options of the shared profile for a numpy dtype."""
+    alg = (compress_alg or compress).lower()
+    opts = dict(tiled=True, blockxsize=tile_size, blockysize=tile_size, compress=alg,
+                predictor=predictor_for(dtype), interleave="band", bigtiff="IF_SAFER")
+    opts["zstd_level" if alg == "zstd" else "zlevel"] = compress_level
+    return opts
+
+
+def overview_levels(height, width):
+    """Overview factors worth building: down to about half a tile on the long side."""
+    return [f for f in overview_factors if max(height, width) / f >= tile_size / 2]
+
+
+def finalize(path, overviews=True, resampling=None, cog=False):
+    """
+    Add internal overviews to a raster written with write_meta. With cog=True the
+    file is rewritten with the overviews ahead of the full-resolution tiles
+    (cloud-optimized layout, one extra copy).
+    """
+    if overviews:
+        with rasterio.open(path, "r+") as dst:
+            factors = overview_levels(dst.height, dst.width)
+            if factors:
+                dst.build_overviews(factors, Resampling[resampling or overview_resampling])
+                dst.update_tags(ns="rio_overview", resampling=resampling or overview_resampling)
+    if cog:
+        tmp_path = path + ".cog.tmp"
+        with rasterio.open(path) as src:
+            dtype = src.dtypes[0]
+        rasterio.shutil.copy(path, tmp_path, driver="GTiff", copy_src_overviews=True,
+                             **creation_options(dtype))
+        os.replace(tmp_path, path)
+
+
+def write_array(path, arr, meta, nodata=None, overviews=True, cog=False):
+    """Write a single-band array with the shared profile and finalize it."""
+    with rasterio.open(path, "w", **write_meta(meta, dtype=arr.dtype, nodata=nodata)) as dst:
+        dst.write(arr, 1)
+    finalize(path, overviews, cog=cog)
+
+
+# ---------------- GDAL ----------------
+def gdal_creation_options(dtype, compress_alg=None):
+    """GTiff creation options (list of KEY=VALUE) of the shared profile for a numpy dtype."""
+    alg = (compress_alg or compress).upper()
+    opts = ["TILED=YES", f"BLOCKXSIZE={tile_size}", f"BLOCKYSIZE={tile_size}",
+            f"COMPRESS={alg}", f"PREDICTOR={predictor_for(dtype)}", "BIGTIFF=IF_SAFER"]
+    opts.append(f"ZSTD_LEVEL={compress_level}" if alg == "ZSTD" else f"ZLEVEL={compress_level}")
+    return opts
+
+
+def gdal_finalize(ds, overviews=True, resampling=None):
+    """Build internal overviews on an open, writable GDAL dataset."""
+    if not overviews:
+        return
+    factors = overview_levels(ds.RasterYSize, ds.RasterXSize)
+    if factors:
+        ds.BuildOverviews((resampling or overview_resampling).upper(), factors)
+
+
+def gdal_cog(path, dtype):
+    """Rewrite a closed GTiff written with the GDAL helpers in the cloud-optimized layout."""
+    from osgeo import gdal
+    tmp_path = path + ".cog.tmp"
+    src = gdal.Open(path)
+    dst = gdal.GetDriverByName("GTiff").CreateCopy(
+        tmp_path, src, options=gdal_creation_options(dtype) + ["COPY_SRC_OVERVIEWS=YES"])
+    dst = None
+    src = None
+    os.replace(tmp_path, path)
+
+
+# ---------------- ARCPY ----------------
+def set_arcpy_output_env(arcpy):
+    """
+    Apply the closest ArcPy equivalent of the profile to arcpy.env: tiled,
+    LZ77 (deflate) compressed GeoTIFF output with pyramids and statistics.
+    ArcPy exposes no TIFF predictor setting.
+    """
+    arcpy.env.compression = "LZ77"
+    arcpy.env.tileSize = f"{tile_size} {tile_size}"
+    arcpy.env.pyramid = "PYRAMIDS -1 BILINEAR LZ77 75 NO_SKIP"
+    arcpy.env.rasterStatistics = "STATISTICS 1 1"
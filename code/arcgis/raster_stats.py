@@ -0,0 +1,73 @@
+"""
+raster_stats.py
+Streaming per-raster summary statistics: exact min/max/mean, |value| threshold
+exceedance counts and a fixed-bin histogram from which median/percentiles are
+read. Blocks are added one at a time, so memory does not grow with the raster.
+Requirements: numpy
+Usage: from raster_stats import StreamingStats
+"""
+
+import numpy as np
+
+
+class StreamingStats:
+    """
+    Accumulates valid values block by block.
+    Percentiles come from a histogram of bin_width over [hist_min, hist_max];
+    values outside the range are counted in under/overflow bins, and the exact
+    min/max bound the result.
+    """
+
+    def __init__(self, thresholds=(), hist_min=-10.0, hist_max=10.0, bin_width=0.001):
+        self.thresholds = tuple(thresholds)
+        self.hist_min = float(hist_min)
+        self.bin_width = float(bin_width)
+        self.n_bins = int(round((hist_max - hist_min) / bin_width))
+        # bins: [underflow, n_bins regular bins, overflow]
+        self.hist = np.zeros(self.n_bins + 2, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.exceed = {thr: 0 for thr in self.thresholds}
+
+    def update(self, values):
+        """Add a 1-D array of valid (finite) values."""
+        if values.size == 0:
+            return
+        values = values.astype(np.float64, copy=False)
+        self.count += values.size
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        idx = np.floor((values - self.hist_min) / self.bin_width)
+        idx = np.clip(idx, -1, self.n_bins).astype(np.int64) + 1
+        self.hist += np.bincount(idx, minlength=self.n_bins + 2)
+
+        abs_vals = np.abs(values)
+        for thr in self.thresholds:
+            self.exceed[thr] += int(np.count_nonzero(abs_vals > thr))
+
+    def percentile(self, q):
+        """Approximate q-th percentile (0-100), linear within the histogram bin."""
+        if self.count == 0:
+            return np.nan
+        rank = q / 100.0 * self.count
+        cum = np.cumsum(self.hist)
+        b = int(np.searchsorted(cum, rank, side="left"))
+        if b == 0:
+            return self.min
+        if b == self.n_bins + 1:
+            return self.max
+        before = cum[b - 1]
+        frac = (rank - before) / self.hist[b] if self.hist[b] else 0.0
+        value = self.hist_min + (b - 1 + frac) * self.bin_width
+        return float(min(max(value, self.min), self.max))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    def pct_exceed(self, thr):
+        return 100.0 * self.exceed[thr] / self.count if self.count else 0.0
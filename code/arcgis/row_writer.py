@@ -0,0 +1,72 @@
+"""
+row_writer.py
+Streaming table writer: rows are written through one open CSV file, or
+buffered into Parquet row groups (requires pyarrow), instead of reopening the
+output once per raster.
+Requirements: pyarrow (only for Parquet)
+Usage: from row_writer import open_row_writer
+"""
+
+import csv
+
+
+class CsvRowWriter:
+    def __init__(self, path, columns):
+        self.f = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(columns)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetRowWriter:
+    def __init__(self, path, columns, batch_rows=50000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.columns = list(columns)
+        self.batch_rows = batch_rows
+        self.rows = []
+        self.writer = None
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self.rows:
+            return
+        table = self.pa.table({c: [r[i] for r in self.rows] for i, c in enumerate(self.columns)})
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_row_writer(path, columns, fmt="csv"):
+    """Open a streaming writer ("csv" or "parquet"); use as a context manager."""
+    writer = ParquetRowWriter(path, columns) if fmt == "parquet" else CsvRowWriter(path, columns)
+    return _Closing(writer)
+
+
+class _Closing:
+    def __init__(self, writer):
+        self.writer = writer
+
+    def __enter__(self):
+        return self.writer
+
+    def __exit__(self, *exc):
+        self.writer.close()
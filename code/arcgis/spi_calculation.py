@@ -1,24 +1,77 @@
-import arcpy
 import os
-import re
 import numpy as np
+import rasterio
 from osgeo import gdal
-from scipy.stats import gamma, norm
+from rasterio.windows import Window
+from spi_engine import fit_gamma_stack, fit_gamma_banded, open_stack_memmap, spi_from_params, spi_limit
+from spi_params import grid_fingerprint, load_or_fit, store_version
+from chirps_native import native_grid, read_native_window, upsample_to_reference
+from chirps_archive import archive_path, is_archive
+from aligned_view import open_aligned
+from raster_output import gdal_creation_options, gdal_finalize, gdal_cog, cog_products
+from datacube import open_cube
+from raster_catalog import catalog_entries, raster_info
+from aoi_pixels import shared_aoi, aoi_inputs
+from pipeline_config import setting
+from pipeline import run_standalone
 
 # ---------------- CONFIG ----------------
-chirps_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Clipped_250m"
-out_folder = os.path.join(chirps_folder, "SPI1")
+chirps_folder = setting("spi", "chirps_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Clipped_250m")
+out_folder = setting("spi", "out_folder", os.path.join(chirps_folder, "SPI1"))
 os.makedirs(out_folder, exist_ok=True)
 
-# Raster format: clip_chirps-v2.0.2013.02
-pattern = r"(\d{4})\.(\d{2})"
+# Fitted gamma parameters are cached here (refitted only when baseline files change)
+params_folder = os.path.join(out_folder, "gamma_params")
 
-baseline_start = 2013
-baseline_end   = 2022
+# SPI mode:
+#   "aligned"   -> fit on the CHIRPS files in native_chirps_folder seen through a
+#                  virtual warp onto the NDVI reference grid, masked to its AOI
+#                  (aligned_view.py): same grid as "resampled", no Resampled_250m
+#                  / Clipped_250m rasters (Chirp_Clip_GIS.py not needed)
+#   "resampled" -> fit on the 250 m clipped CHIRPS written by Chirp_Clip_GIS.py
+#   "native"    -> fit on the ~5 km CHIRPS grid (buffered AOI window) and only
+#                  upsample the final SPI onto the NDVI reference grid
+# In "aligned" and "native" mode native_chirps_folder may hold the .tif.gz
+# archives themselves (Chirp_Extraction.py extract_mode "stream"): they are
+# read through /vsigzip/, without extracted copies on disk
+spi_mode = setting("spi", "spi_mode", "aligned")
+native_chirps_folder = setting("spi", "native_chirps_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Chirps_Extracted")
+reference_raster = setting("spi", "reference_raster", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\real_clipped_NDVI_2020_02_15.tif")
+native_buffer_cells = setting("spi", "native_buffer_cells", 2)
+native_nodata = -9999.0
+
+input_folder = chirps_folder if spi_mode == "resampled" else native_chirps_folder
+
+# Optional datacube (build_datacube.py) holding the input_folder rasters as
+# variable "chirps": the baseline stack of a month is then read from it in
+# one chunked read instead of opening every year's file (None = use the files).
+# Resampled and native mode only; the cube must be on the grid of the files
+# this mode reads (built with the same spi_mode)
+datacube_store = setting("spi", "datacube_store", None)
+
+# Raster format: clip_chirps-v2.0.2013.02 (native: chirps-v2.0.2013.02),
+# indexed by the raster catalog as variable "chirps"
+
+baseline_start = setting("spi", "baseline_start", 2013)
+baseline_end   = setting("spi", "baseline_end", 2022)
+
+# Baseline fitting memory:
+#   "memory" -> the baseline stack of a month is held in RAM
+#   "memmap" -> written once to a memory-mapped file in memmap_folder and
+#               fitted in row bands of about fit_memory_mb (large AOIs)
+fit_mode = setting("spi", "fit_mode", "memory")
+memmap_folder = setting("spi", "memmap_folder", os.path.join(out_folder, "baseline_memmap"))
+fit_memory_mb = setting("spi", "fit_memory_mb", 512)
+
+# [pipeline] packed_pixels, aligned mode only (the other grids are not the
+# NDVI grid): precipitation, gamma parameters and SPI as 1-D vectors of the
+# AOI cells (aoi_pixels.py), scattered onto the grid when an SPI is written
+def packed_aoi():
+    return shared_aoi() if spi_mode == "aligned" else None
 
 # ---------------- HELPER: Read raster to array ----------------
 def read_raster_as_array(path):
-    ds = gdal.Open(path)
+    ds = gdal.Open(archive_path(path))
     arr = ds.ReadAsArray().astype(np.float32)
     nodata = ds.GetRasterBand(1).GetNoDataValue()
     if nodata is not None:
@@ -27,88 +80,189 @@ def read_raster_as_array(path):
     proj = ds.GetProjection()
     return arr, gt, proj, nodata
 
+# ---------------- HELPER: Read input aligned to the reference grid ----------------
+def read_aligned(path):
+    aoi = packed_aoi()
+    with rasterio.open(reference_raster) as ref, open_aligned(path, ref, aoi=ref) as view:
+        if aoi is not None:
+            # Only the AOI window is warped; the AOI cells are packed
+            aoi.check_grid(ref)
+            arr = aoi.pack_window(view.read(window=aoi.window))
+        else:
+            arr = view.read()
+        gt, proj = ref.transform.to_gdal(), ref.crs.to_wkt()
+    arr[arr < 0] = np.nan  # CHIRPS flags ocean/missing with negative values
+    return arr, gt, proj, native_nodata
+
+# ---------------- HELPER: Read input for the selected SPI mode ----------------
+def read_input(path):
+    if spi_mode == "aligned":
+        return read_aligned(path)
+    if spi_mode == "native":
+        path = archive_path(path)
+        window, gt, proj = native_grid(path, reference_raster, native_buffer_cells)
+        return read_native_window(path, window), gt, proj, native_nodata
+    return read_raster_as_array(path)
+
+# ---------------- HELPER: Grid fingerprint without reading pixels ----------------
+def raster_fingerprint(path):
+    if spi_mode == "aligned":
+        aoi = packed_aoi()
+        with rasterio.open(reference_raster) as ref:
+            if aoi is not None:
+                # Packed parameter vectors: keyed by the AOI mask as well
+                return grid_fingerprint(ref.transform.to_gdal(), ref.crs.to_wkt() + aoi.fingerprint, (aoi.n,))
+            return grid_fingerprint(ref.transform.to_gdal(), ref.crs.to_wkt(), ref.shape)
+    path = archive_path(path)
+    if spi_mode == "native":
+        window, gt, proj = native_grid(path, reference_raster, native_buffer_cells)
+        return grid_fingerprint(gt, proj, (window[3], window[2]))
+    ds = gdal.Open(path)
+    fp = grid_fingerprint(ds.GetGeoTransform(), ds.GetProjection(), (ds.RasterYSize, ds.RasterXSize))
+    ds = None
+    return fp
+
+# ---------------- HELPER: Fit baseline stack for one month ----------------
+def fit_baseline(paths, month):
+    # The "chirps" cube holds files as they are on disk, so not in aligned mode
+    if datacube_store and spi_mode != "aligned":
+        cube = open_cube(datacube_store, "chirps")
+        if cube.fingerprint != raster_info(paths[0])[0]:
+            raise ValueError(f"Datacube {datacube_store} 'chirps' is not on the grid of {paths[0]}: "
+                             f"rebuild it (build_datacube.py) for spi_mode '{spi_mode}'")
+        window = None
+        if spi_mode == "native":
+            window = Window(*native_grid(archive_path(paths[0]), reference_raster, native_buffer_cells)[0])
+        times = cube.time_indices(month=month, start_year=baseline_start, end_year=baseline_end)
+        stack = cube.read(window, times)
+        stack[stack < 0] = np.nan  # CHIRPS flags ocean/missing with negative values
+        return fit_gamma_stack(stack)
+    if fit_mode == "memmap":
+        os.makedirs(memmap_folder, exist_ok=True)
+        stack_path = os.path.join(memmap_folder, f"baseline_m{month:02d}.npy")
+        stack = None
+        try:
+            for i, bp in enumerate(paths):
+                arr, gt, proj, nodata = read_input(bp)
+                if stack is None:
+                    # Packed vectors are stored as one row
+                    stack = open_stack_memmap(stack_path, len(paths), *np.atleast_2d(arr).shape)
+                stack[i] = arr
+            stack.flush()
+            return tuple(p.reshape(arr.shape) for p in fit_gamma_banded(stack, fit_memory_mb))
+        finally:
+            del stack
+            if os.path.exists(stack_path):
+                os.remove(stack_path)
+
+    # Filled in place: a list + np.stack would hold the stack twice
+    baseline_stack = None  # shape: (years, rows, cols)
+    for i, bp in enumerate(paths):
+        arr, gt, proj, nodata = read_input(bp)
+        if baseline_stack is None:
+            baseline_stack = np.empty((len(paths),) + arr.shape, dtype=np.float32)
+        baseline_stack[i] = arr
+    return fit_gamma_stack(baseline_stack)
+
 # ---------------- HELPER: Save array to raster ----------------
 def save_array_as_raster(arr, gt, proj, out_path, nodata):
     driver = gdal.GetDriverByName("GTiff")
-    out_ds = driver.Create(out_path, arr.shape[1], arr.shape[0], 1, gdal.GDT_Float32)
+    out_ds = driver.Create(out_path, arr.shape[1], arr.shape[0], 1, gdal.GDT_Float32,
+                           options=gdal_creation_options(np.float32))
     out_ds.SetGeoTransform(gt)
     out_ds.SetProjection(proj)
     band = out_ds.GetRasterBand(1)
-    band.WriteArray(arr)
     if nodata is not None:
+        arr = np.where(np.isnan(arr), nodata, arr)
         band.SetNoDataValue(nodata)
+    band.WriteArray(arr)
     band.FlushCache()
+    gdal_finalize(out_ds)
     out_ds = None
+    if cog_products:
+        gdal_cog(out_path, np.float32)
 
 # ---------------- ORGANIZE FILES ----------------
-files = [f for f in os.listdir(chirps_folder) if f.endswith(".tif")]
-files_info = []
-for f in files:
-    m = re.search(pattern, f)
-    if m:
-        year = int(m.group(1))
-        month = int(m.group(2))
-        files_info.append((f, year, month))
-
-files_info.sort(key=lambda x: (x[1], x[2]))  # sort by year, month
-
-# Group rasters by month (all years)
-by_month = {m: [] for m in range(1, 13)}
-for fname, year, month in files_info:
-    by_month[month].append((fname, year))
-
-# ---------------- CALCULATE SPI-1 ----------------
-for month in range(1, 13):
-    # Get baseline rasters for this month
-    baseline_files = [fname for fname, year in by_month[month] if baseline_start <= year <= baseline_end]
-
-    # Read all baseline arrays into stack
-    baseline_arrays = []
-    for bf in baseline_files:
-        arr, gt, proj, nodata = read_raster_as_array(os.path.join(chirps_folder, bf))
-        baseline_arrays.append(arr)
-    baseline_stack = np.stack(baseline_arrays, axis=0)  # shape: (years, rows, cols)
-
-    # Fit gamma parameters per pixel
-    shape_arr = np.full(baseline_stack.shape[1:], np.nan, dtype=np.float32)
-    scale_arr = np.full_like(shape_arr, np.nan)
-    for r in range(baseline_stack.shape[1]):
-        for c in range(baseline_stack.shape[2]):
-            series = baseline_stack[:, r, c]
-            if np.all(np.isnan(series)) or np.nanmean(series) <= 0:
-                continue
-            try:
-                # Fit gamma distribution to positive precipitation values
-                series_nonan = series[~np.isnan(series)]
-                if len(series_nonan) >= 5:
-                    fit_alpha, fit_loc, fit_beta = gamma.fit(series_nonan, floc=0)
-                    shape_arr[r, c] = fit_alpha
-                    scale_arr[r, c] = fit_beta
-            except Exception:
-                continue
+def files_by_month():
+    """{month: [(file name, year), ...]} of the input rasters, sorted by year."""
+    # Catalog entries come sorted by year, month
+    by_month = {m: [] for m in range(1, 13)}
+    for path, year, month, _ in catalog_entries("chirps", input_folder):
+        if spi_mode != "resampled" or not is_archive(path):
+            by_month[month].append((os.path.basename(path), year))
+    return by_month
+
+# Parameters every SPI raster depends on (besides its month's baseline files);
+# the parameter store version and the SPI bound, so a change of the fitting
+# or the scoring rescores them
+spi_run_params = {"mode": spi_mode, "baseline": [baseline_start, baseline_end], "params_version": store_version,
+                  "spi_limit": spi_limit,
+                  "reference": reference_raster if spi_mode != "resampled" else None}
+
+# ---------------- PLAN: MONTHS WITH SPI TO (RE)CALCULATE ----------------
+def plan(manifest):
+    """One item per calendar month: (month, baseline paths, [(file, year, out path, inputs)])."""
+    by_month = files_by_month()
+    items = []
+    for month in range(1, 13):
+        # Get baseline rasters for this month
+        baseline_files = [fname for fname, year in by_month[month] if baseline_start <= year <= baseline_end]
+        if not baseline_files:
+            print(f"No baseline rasters for month {month:02d}, skipping.")
+            continue
+
+        baseline_paths = [os.path.join(input_folder, bf) for bf in baseline_files]
+        # Aligned / native mode: the reference raster (grid, AOI mask) is an input
+        # too, and so is the packed AOI mask (aligned mode)
+        reference_inputs = [reference_raster] if spi_mode != "resampled" else []
+        if packed_aoi() is not None:
+            reference_inputs += aoi_inputs()
+
+        # Only years whose SPI is missing or whose inputs / baseline changed
+        todo = []
+        for fname, year in by_month[month]:
+            out_path = os.path.join(out_folder, f"SPI1_{year:04d}_{month:02d}.tif")
+            inputs = [os.path.join(input_folder, fname)] + baseline_paths + reference_inputs
+            if not manifest.is_current(out_path, inputs, spi_run_params):
+                todo.append((fname, year, out_path, inputs))
+        if todo:
+            items.append((month, baseline_paths, todo))
+        else:
+            print(f"SPI for month {month:02d} is up to date.")
+    return items
+
+# ---------------- CALCULATE SPI-1 FOR ONE MONTH ----------------
+def process(item):
+    month, baseline_paths, todo = item
+
+    # Mixed gamma parameters for all pixels: cached per baseline window, grid and month
+    shape_arr, scale_arr, p_zero_arr, n_valid_arr = load_or_fit(
+        params_folder, baseline_start, baseline_end, raster_fingerprint(baseline_paths[0]),
+        month, baseline_paths, lambda: fit_baseline(baseline_paths, month))
 
     # Now calculate SPI for each year of this month
-    for fname, year in by_month[month]:
+    records = []
+    for fname, year, out_path, inputs in todo:
         # Read precip array
-        arr, gt, proj, nodata = read_raster_as_array(os.path.join(chirps_folder, fname))
-        spi_arr = np.full_like(arr, np.nan)
-
-        # Calculate SPI pixel by pixel
-        for r in range(arr.shape[0]):
-            for c in range(arr.shape[1]):
-                if np.isnan(arr[r, c]) or np.isnan(shape_arr[r, c]):
-                    continue
-                try:
-                    cdf = gamma.cdf(arr[r, c], shape_arr[r, c], scale=scale_arr[r, c])
-                    # Convert to normal deviate (mean=0, std=1)
-                    spi_arr[r, c] = norm.ppf(cdf)
-                except Exception:
-                    continue
+        arr, gt, proj, nodata = read_input(os.path.join(input_folder, fname))
+
+        # Gamma CDF -> normal deviate (mean=0, std=1) for the whole grid
+        spi_arr = spi_from_params(arr, shape_arr, scale_arr, p_zero_arr)
+
+        # Packed: scatter onto the grid; native mode: bring the final SPI onto
+        # the NDVI grid and AOI mask
+        if packed_aoi() is not None:
+            spi_arr = packed_aoi().unpack(spi_arr, np.nan)
+        elif spi_mode == "native":
+            spi_arr, gt, proj = upsample_to_reference(spi_arr, gt, proj, reference_raster)
 
         # Save output raster
-        out_name = f"SPI1_{year:04d}_{month:02d}.tif"
-        out_path = os.path.join(out_folder, out_name)
         save_array_as_raster(spi_arr, gt, proj, out_path, nodata)
+        records.append((out_path, inputs, spi_run_params))
         print("Saved:", out_path)
+    return records, None
+
 
-print("Done calculating SPI-1")
+if __name__ == "__main__":
+    run_standalone(plan, process)
+    print("Done calculating SPI-1")
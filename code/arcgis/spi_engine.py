@@ -0,0 +1,118 @@
+"""
+spi_engine.py
+Vectorized SPI-1 engine: fits a mixed gamma distribution for every pixel of a
+baseline stack at once and standardizes precipitation as array operations.
+Large stacks can be kept out of core in a memory-mapped .npy file and fitted
+in row bands that fit a memory budget.
+Requirements: numpy, scipy
+Usage: from spi_engine import fit_gamma_stack, fit_gamma_banded, spi_from_params
+"""
+
+import numpy as np
+from scipy.special import digamma, polygamma, gammainc, ndtri
+
+# Minimum number of positive (non-zero) baseline values needed to fit a pixel
+min_samples = 5
+
+# Newton steps applied after Thom's approximation (3 is enough for float32 output)
+newton_iterations = 3
+
+# Peak working memory of fit_gamma_stack per stack value, in bytes (measured
+# about 16: float32 copy, masks and float64 temporaries; rounded up)
+fit_bytes_per_value = 20
+
+# SPI is bounded to +/- spi_limit (as the climate_indices package): a
+# probability of 0 or 1, e.g. zero precipitation on a pixel with no dry month
+# in its baseline, would otherwise give an infinite normal deviate
+spi_limit = 3.09
+
+
+def fit_gamma_stack(stack, min_samples=min_samples, newton_iterations=newton_iterations):
+    """
+    Fit gamma shape/scale (loc=0) per pixel for a (years, rows, cols) stack.
+    NaN marks missing values. Zero precipitation is handled as a mixed
+    distribution: the gamma is fitted to the positive values only and the
+    probability of zero is returned separately.
+    Returns (shape, scale, p_zero, n_valid); shape/scale are NaN where the
+    pixel could not be fitted.
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    valid = ~np.isnan(stack)
+    positive = valid & (stack > 0)
+
+    n_valid = valid.sum(axis=0)
+    n_pos = positive.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Sufficient statistics of the positive values (log(1) = 0 fills the rest)
+        total = np.where(positive, stack, 0.0).sum(axis=0, dtype=np.float64)
+        log_total = np.log(np.where(positive, stack, 1.0), dtype=np.float64).sum(axis=0)
+        mean = total / n_pos
+        s = np.log(mean) - log_total / n_pos
+
+        # Thom's approximation of the maximum likelihood shape
+        shape = (1.0 + np.sqrt(1.0 + 4.0 * s / 3.0)) / (4.0 * s)
+
+        # Newton refinement of log(a) - digamma(a) = s (same equation scipy solves)
+        for _ in range(newton_iterations):
+            f = np.log(shape) - digamma(shape) - s
+            df = 1.0 / shape - polygamma(1, shape)
+            step = shape - f / df
+            shape = np.where(step > 0, step, shape / 2.0)
+
+        scale = mean / shape
+        p_zero = (n_valid - n_pos) / n_valid
+
+    fitted = (n_pos >= min_samples) & (s > 0) & np.isfinite(shape) & np.isfinite(scale)
+    shape = np.where(fitted, shape, np.nan).astype(np.float32)
+    scale = np.where(fitted, scale, np.nan).astype(np.float32)
+    p_zero = np.where(fitted, p_zero, np.nan).astype(np.float32)
+    return shape, scale, p_zero, n_valid.astype(np.uint16)
+
+
+def open_stack_memmap(path, n_layers, rows, cols):
+    """Create a (layers, rows, cols) float32 .npy memory map, NaN-filled, at path."""
+    stack = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n_layers, rows, cols))
+    stack[:] = np.nan
+    return stack
+
+
+def band_rows(n_layers, cols, memory_mb):
+    """Rows per band so that fitting one band stays within memory_mb."""
+    return max(1, int(memory_mb * 2 ** 20 // (n_layers * cols * fit_bytes_per_value)))
+
+
+def fit_gamma_banded(stack, memory_mb=512, min_samples=min_samples, newton_iterations=newton_iterations):
+    """
+    fit_gamma_stack over row bands of a (years, rows, cols) stack (e.g. a memmap),
+    so only one band is in memory at a time. Same results as fitting at once.
+    memory_mb bounds the working memory of a band; the output grids come on top.
+    """
+    n_layers, rows, cols = stack.shape
+    shape = np.empty((rows, cols), dtype=np.float32)
+    scale = np.empty((rows, cols), dtype=np.float32)
+    p_zero = np.empty((rows, cols), dtype=np.float32)
+    n_valid = np.empty((rows, cols), dtype=np.uint16)
+    step = band_rows(n_layers, cols, memory_mb)
+    for top in range(0, rows, step):
+        sl = slice(top, min(top + step, rows))
+        shape[sl], scale[sl], p_zero[sl], n_valid[sl] = fit_gamma_stack(
+            stack[:, sl, :], min_samples, newton_iterations)
+    return shape, scale, p_zero, n_valid
+
+
+def spi_from_params(precip, shape, scale, p_zero):
+    """
+    Standardize precipitation with fitted mixed gamma parameters.
+    precip may be a single (rows, cols) grid or a (n, rows, cols) stack of target
+    months; the parameter grids broadcast over the leading axis.
+    Returns float32 SPI, bounded to +/- spi_limit, with NaN where the input or
+    the fit is missing.
+    """
+    precip = np.asarray(precip, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = np.where(precip > 0, precip, 0.0) / scale
+        cdf = p_zero + (1.0 - p_zero) * gammainc(shape, x)
+        spi = np.clip(ndtri(cdf), -spi_limit, spi_limit)
+    spi[np.isnan(precip) | (precip < 0)] = np.nan
+    return spi.astype(np.float32)
@@ -0,0 +1,75 @@
+"""
+spi_params.py
+On-disk store for fitted SPI gamma parameters, so the baseline is fitted once
+and new months are scored against cached grids.
+Entries are keyed by baseline window, grid fingerprint and month, and are
+invalidated when the baseline files (name, size, mtime) change.
+Requirements: numpy
+Usage: from spi_params import grid_fingerprint, load_or_fit
+"""
+
+import os
+import hashlib
+import numpy as np
+
+# Bump when the fitting method or the stored arrays change
+store_version = 1
+
+
+def grid_fingerprint(gt, proj, shape):
+    """Short hash identifying a raster grid (geotransform, projection, rows/cols)."""
+    key = repr((tuple(round(v, 9) for v in gt), proj, tuple(shape)))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def files_signature(paths):
+    """Hash of the baseline inputs; changes when a file is added, removed or rewritten."""
+    h = hashlib.sha1()
+    for p in sorted(paths):
+        st = os.stat(p)
+        h.update(f"{os.path.basename(p)}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def param_path(store_folder, baseline_start, baseline_end, fingerprint, month):
+    return os.path.join(store_folder,
+                        f"gamma_{baseline_start}_{baseline_end}_{fingerprint}_m{month:02d}.npz")
+
+
+def load_params(path, signature):
+    """Return (shape, scale, p_zero, n_valid) or None if missing or stale."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as npz:
+            if int(npz["version"]) != store_version or str(npz["signature"]) != signature:
+                return None
+            return npz["shape"], npz["scale"], npz["p_zero"], npz["n_valid"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_params(path, signature, shape, scale, p_zero, n_valid):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, version=store_version, signature=signature,
+                        shape=shape, scale=scale, p_zero=p_zero, n_valid=n_valid)
+    os.replace(tmp_path, path)
+
+
+def load_or_fit(store_folder, baseline_start, baseline_end, fingerprint, month,
+                baseline_paths, fit_func):
+    """
+    Return cached parameters for this baseline/grid/month, or call fit_func()
+    (which must return (shape, scale, p_zero, n_valid)) and store the result.
+    """
+    path = param_path(store_folder, baseline_start, baseline_end, fingerprint, month)
+    signature = files_signature(baseline_paths)
+    params = load_params(path, signature)
+    if params is not None:
+        print(f"Using cached gamma parameters: {path}")
+        return params
+    params = fit_func()
+    save_params(path, signature, *params)
+    print(f"Stored gamma parameters: {path}")
+    return params
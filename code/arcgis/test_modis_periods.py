@@ -0,0 +1,35 @@
+"""
+test_modis_periods.py
+Month assignment of the MOD13Q1 16-day composites: every day of the record
+is counted in exactly one month, and the last composite of a year (DOY 353,
+cut short on December 31) does not reach into January.
+Requirements: pytest
+Usage: python -m pytest test_modis_periods.py
+"""
+
+import calendar
+from datetime import date, timedelta
+from modis_periods import month_composites, overlap_days
+
+
+def mod13q1_dates(year):
+    """Start dates of a year's 16-day composites (DOY 1, 17, ..., 353)."""
+    return [date(year, 1, 1) + timedelta(days=doy - 1) for doy in range(1, 366, 16)]
+
+
+def test_last_composite_of_the_year_stops_on_december_31():
+    for year, day in ((2020, 18), (2021, 19)):      # DOY 353 of a leap / common year
+        start = date(year, 12, day)
+        assert mod13q1_dates(year)[-1] == start
+        assert overlap_days(start, year, 12) == 31 - day + 1
+        assert overlap_days(start, year + 1, 1) == 0
+        assert list(month_composites([("d353", start)])) == [(year, 12)]
+
+
+def test_every_day_counted_once():
+    dated = [(f"{d:%Y_%m_%d}", d) for year in (2019, 2020, 2021) for d in mod13q1_dates(year)]
+    months = month_composites(dated)
+    for (year, month), hdf_days in months.items():
+        assert sum(days for _, days in hdf_days) == calendar.monthrange(year, month)[1]
+        assert all(name[:4] == str(year) for name, _ in hdf_days)
+    assert len(months) == 36
@@ -0,0 +1,83 @@
+"""
+test_zonal_engine.py
+exceedance_counts on rasters that share the zone grid's cell size and
+snapping but not its extent: counts and the drought-frequency accumulator
+must line up with the zone grid (an offset, larger raster against the same
+values written on the zone grid itself).
+Requirements: numpy, rasterio, pytest
+Usage: python -m pytest test_zonal_engine.py
+"""
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+from zonal_engine import ZoneIndex, exceedance_counts
+from drought_frequency import EverAffectedAccumulator
+
+crs = CRS.from_epsg(32617)
+cell = 250.0
+x0, y0 = 500000.0, 1000000.0
+thresholds = [1.0, 2.0]
+
+
+def zone_index(height=40, width=48):
+    """Three zones in horizontal stripes, row 0 outside every zone."""
+    zones = np.zeros((height, width), dtype=np.uint16)
+    zones[1:14], zones[14:27], zones[27:] = 1, 2, 3
+    table = [{"Corregimie": f"Zona {i}"} for i in (1, 2, 3)]
+    return ZoneIndex(zones, from_origin(x0, y0, cell, cell), crs, table)
+
+
+def write_raster(path, z, row_off, col_off):
+    """z (float32, NaN = nodata) with its origin row_off / col_off cells off the zone grid's."""
+    meta = dict(driver="GTiff", height=z.shape[0], width=z.shape[1], count=1, dtype="float32",
+                crs=crs, transform=from_origin(x0 + col_off * cell, y0 - row_off * cell, cell, cell),
+                nodata=np.nan)
+    with rasterio.open(path, "w", **meta) as dst:
+        dst.write(z.astype("float32"), 1)
+
+
+def run(path, zindex):
+    acc = EverAffectedAccumulator(zindex.height, zindex.width, thresholds)
+    count, neg, pos = exceedance_counts(str(path), zindex, thresholds, blocksize=16, accumulator=acc)
+    return count, neg, pos, acc
+
+
+def test_offset_larger_raster_matches_zone_grid(tmp_path):
+    zindex = zone_index()
+    rng = np.random.default_rng(0)
+    z = rng.normal(0.0, 1.5, (zindex.height, zindex.width))
+    z[5:9, 10:20] = np.nan
+
+    write_raster(tmp_path / "same.tif", z, 0, 0)
+    # 5 rows / 11 columns of extra cells above and to the left, more below and right
+    big = rng.normal(0.0, 1.5, (zindex.height + 13, zindex.width + 30))
+    big[5:5 + zindex.height, 11:11 + zindex.width] = z
+    write_raster(tmp_path / "big.tif", big, -5, -11)
+
+    ref = run(tmp_path / "same.tif", zindex)
+    out = run(tmp_path / "big.tif", zindex)
+    np.testing.assert_array_equal(out[0], ref[0])
+    for thr in thresholds:
+        np.testing.assert_array_equal(out[1][thr], ref[1][thr])
+        np.testing.assert_array_equal(out[2][thr], ref[2][thr])
+        np.testing.assert_array_equal(out[3].months[thr], ref[3].months[thr])
+    assert ref[0].sum() == (np.isfinite(z) & (zindex.zones > 0)).sum()
+    # every 16 x 16 block holds zone pixels, so the accumulator saw the whole grid
+    np.testing.assert_array_equal(out[3].valid_mask(), np.isfinite(z))
+
+
+def test_raster_covering_part_of_the_zones(tmp_path):
+    zindex = zone_index()
+    z = np.full((20, 24), 2.5)
+    write_raster(tmp_path / "part.tif", z, 10, 8)
+
+    count, neg, pos, acc = run(tmp_path / "part.tif", zindex)
+    inside = np.zeros((zindex.height, zindex.width), dtype=bool)
+    inside[10:30, 8:32] = True
+    expected = np.bincount(zindex.zones[inside], minlength=4)[1:]
+    np.testing.assert_array_equal(count, expected)
+    np.testing.assert_array_equal(pos[2.0], expected)
+    assert (neg[1.0] == 0).all()
+    np.testing.assert_array_equal(acc.months[2.0] > 0, inside)
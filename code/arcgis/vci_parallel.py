@@ -0,0 +1,157 @@
+"""
+vci_parallel.py
+Tiled parallel VCI: (target file, window) tiles are spread over a process
+pool. Each worker keeps the dataset handles of the job it is working on
+(closed when it moves to another job and when the call ends); results come
+back to the parent process, which is the only writer.
+compute_vci_cube computes the VCI of datacube dates, reading each window of
+all target dates in one chunk read.
+VCI is a ratio of NDVI differences, so when the NDVI and min/max rasters share
+their scaling (scaled Int16) it is computed from the raw values, unscaled.
+compute_vci_packed works on the in-AOI cells only (aoi_pixels.AoiPixels).
+Requirements: rasterio, numpy
+Usage: from vci_parallel import compute_vci_parallel, compute_vci_cube, compute_vci_packed
+"""
+
+import numpy as np
+import rasterio
+from concurrent.futures import ProcessPoolExecutor
+from raster_blocks import iter_windows, read_scaled, same_scaling
+from raster_output import write_meta, finalize, cog_products
+
+# Open datasets of the current job in this process, keyed by path
+_handles = {}
+
+
+def _dataset(path):
+    ds = _handles.get(path)
+    if ds is None:
+        ds = rasterio.open(path)
+        _handles[path] = ds
+    return ds
+
+
+def _release(keep=()):
+    """Close the cached datasets except the paths in keep (no file stays locked after a job)."""
+    for path in [p for p in _handles if p not in keep]:
+        _handles.pop(path).close()
+
+
+def vci_block(a, b, c, nodata):
+    """VCI = 100 * (NDVI - min) / (max - min) with one validity mask per block."""
+    denom = c - b
+    valid = (np.isfinite(a) & np.isfinite(b) & np.isfinite(c)
+             & (a != nodata) & (b != nodata) & (c != nodata) & (denom > 0))
+    vci = np.full(a.shape, nodata, dtype=np.float32)
+    np.divide(100.0 * (a - b), denom, out=vci, where=valid)
+    return vci
+
+
+def _vci_tile(task):
+    job_id, ndvi_path, min_path, max_path, window, nodata = task
+    paths = (ndvi_path, min_path, max_path)
+    _release(keep=paths)
+    srcs = [_dataset(p) for p in paths]
+    # Scale and offset cancel in (NDVI - min) / (max - min)
+    scaled = not same_scaling(*srcs)
+    a, b, c = (read_scaled(src, window, scaled=scaled) for src in srcs)
+    return job_id, window, vci_block(a, b, c, nodata)
+
+
+def compute_vci_parallel(jobs, nodata, workers=None, blocksize=512):
+    """
+    jobs: list of (ndvi_path, min_path, max_path, out_path).
+    workers: process count (None = all cores, 1 = run in this process).
+    Tiles are returned in submission order, so each output is completed and
+    closed before the next one is opened.
+    """
+    tasks = []
+    metas = []
+    remaining = []
+    for job_id, (ndvi_path, min_path, max_path, out_path) in enumerate(jobs):
+        with rasterio.open(ndvi_path) as src:
+            meta = write_meta(src.meta, dtype="float32", nodata=np.float32(nodata))
+            windows = list(iter_windows(src, blocksize))
+        metas.append(meta)
+        remaining.append(len(windows))
+        tasks.extend((job_id, ndvi_path, min_path, max_path, w, nodata) for w in windows)
+
+    if workers == 1:
+        pool = None
+        results = map(_vci_tile, tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_vci_tile, tasks, chunksize=4)
+
+    writers = {}
+    try:
+        for job_id, window, block in results:
+            dst = writers.get(job_id)
+            if dst is None:
+                dst = rasterio.open(jobs[job_id][3], "w", **metas[job_id])
+                writers[job_id] = dst
+            dst.write(block, 1, window=window)
+            remaining[job_id] -= 1
+            if remaining[job_id] == 0:
+                if pool is None:
+                    _release()
+                writers.pop(job_id).close()
+                finalize(jobs[job_id][3], cog=cog_products)
+                print("Saved VCI:", jobs[job_id][3])
+    finally:
+        for dst in writers.values():
+            dst.close()
+        # Worker processes (and their handles) end with the pool
+        if pool is not None:
+            pool.shutdown()
+        else:
+            _release()
+
+
+def compute_vci_packed(jobs, nodata, aoi):
+    """
+    jobs as in compute_vci_parallel, on the AOI cells (aoi_pixels.AoiPixels):
+    one read of the AOI window per raster, VCI of 1-D vectors, scattered back
+    onto the grid when written.
+    """
+    for ndvi_path, min_path, max_path, out_path in jobs:
+        with rasterio.open(ndvi_path) as src, rasterio.open(min_path) as src_min, \
+                rasterio.open(max_path) as src_max:
+            scaled = not same_scaling(src, src_min, src_max)
+            a, b, c = (aoi.read(s, scaled=scaled) for s in (src, src_min, src_max))
+            meta = write_meta(src.meta, dtype="float32", nodata=np.float32(nodata))
+        aoi.write(out_path, vci_block(a, b, c, nodata), meta, nodata)
+        print("Saved VCI:", out_path)
+
+
+def compute_vci_cube(cube, jobs, nodata):
+    """
+    jobs: list of (time_index, min_path, max_path, out_path) for a datacube.Cube
+    of NDVI. Serial: each window is one cube read for every target date, and
+    the min/max grids of a month are read once per window.
+    """
+    if not jobs:
+        return
+    times = [job[0] for job in jobs]
+    meta = write_meta(dict(driver="GTiff", height=cube.height, width=cube.width, count=1,
+                           crs=cube.crs, transform=cube.transform),
+                      dtype="float32", nodata=np.float32(nodata))
+    baselines = {}
+    dsts = []
+    try:
+        for _, min_path, max_path, out_path in jobs:
+            for p in (min_path, max_path):
+                if p not in baselines:
+                    baselines[p] = rasterio.open(p)
+            dsts.append(rasterio.open(out_path, "w", **meta))
+        for window in cube.windows():
+            block = cube.read(window, times)
+            grids = {p: read_scaled(ds, window) for p, ds in baselines.items()}
+            for k, (_, min_path, max_path, _) in enumerate(jobs):
+                dsts[k].write(vci_block(block[k], grids[min_path], grids[max_path], nodata), 1, window=window)
+    finally:
+        for ds in dsts + list(baselines.values()):
+            ds.close()
+    for job in jobs:
+        finalize(job[3], cog=cog_products)
+        print("Saved VCI:", job[3])
@@ -0,0 +1,377 @@
+"""
+zonal_engine.py
+Native zonal statistics: the corregimiento polygons are rasterized once onto
+the NDVI snap grid (cell-centre rule, as ArcGIS ZonalStatisticsAsTable) and
+cached as a zone-ID index raster. Per-zone statistics of any raster on that
+grid are then computed with np.bincount in a single windowed read. Rasters
+on another grid (e.g. native CHIRPS) are read through an aligned_view warp of
+each window onto the zone grid, with no resampled copy on disk.
+Requirements: rasterio, fiona, numpy
+Usage: from zonal_engine import load_zone_index, zonal_stats, zonal_rows
+"""
+
+import os
+import json
+import numpy as np
+import rasterio
+import fiona
+from rasterio.crs import CRS
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+from raster_blocks import iter_windows
+from raster_output import write_meta
+from aligned_view import open_aligned
+
+# Feature-ID fields that are not attributes of the layer: the implicit FID of a
+# shapefile and, read through OGR, the OBJECTID of a geodatabase feature class
+feature_id_fields = ("OBJECTID", "FID")
+
+# Layout of the cached zone tables (.json); older caches are rebuilt
+zone_cache_version = 2
+
+
+class ZoneIndex:
+    """Zone-ID grid (0 = outside every zone, 1..n = zones) plus the zone attributes."""
+
+    def __init__(self, zones, transform, crs, table):
+        self.zones = zones
+        self.transform = transform
+        self.crs = crs
+        self.table = table            # list of attribute dicts, table[i] is zone i + 1
+        self.n_zones = len(table)
+        self.cell_area = abs(transform.a * transform.e)
+        self.height, self.width = zones.shape
+
+    def block(self, src, window):
+        """Zone IDs under a window of src (src must be on the same grid, any extent)."""
+        row_off, col_off = grid_offset(src, self.transform)
+        r0 = int(window.row_off) + row_off
+        c0 = int(window.col_off) + col_off
+        h, w = int(window.height), int(window.width)
+        out = np.zeros((h, w), dtype=self.zones.dtype)
+        rs, cs = max(r0, 0), max(c0, 0)
+        re_, ce = min(r0 + h, self.zones.shape[0]), min(c0 + w, self.zones.shape[1])
+        if rs < re_ and cs < ce:
+            out[rs - r0:re_ - r0, cs - c0:ce - c0] = self.zones[rs:re_, cs:ce]
+        return out
+
+    def src_window(self, src, window):
+        """Window of src covering a window of the zone grid (may fall outside src)."""
+        return aligned_window(src, self.transform, window)
+
+
+def grid_offset(src, transform):
+    """(row, col) of src's origin on the grid defined by transform; same cell size required."""
+    t = src.transform
+    if not (np.isclose(t.a, transform.a) and np.isclose(t.e, transform.e) and t.b == 0 and t.d == 0):
+        raise ValueError(f"{src.name} is not on the zone index grid (different cell size)")
+    col = (t.c - transform.c) / transform.a
+    row = (t.f - transform.f) / transform.e
+    if not (np.isclose(col, round(col), atol=1e-3) and np.isclose(row, round(row), atol=1e-3)):
+        raise ValueError(f"{src.name} is not snapped to the zone index grid")
+    return int(round(row)), int(round(col))
+
+
+def open_zone_source(path, zindex, resampling="bilinear"):
+    """
+    The raster itself if it is on the zone grid (any extent), else an aligned
+    view of it on that grid: rasters of another cell size (e.g. SPI written at
+    250 m against the ~231.66 m MODIS grid) or CRS are resampled on read, as
+    ArcGIS did through the snap raster. zindex: ZoneIndex or CoverageTable.
+    """
+    src = rasterio.open(path)
+    try:
+        if src.crs == zindex.crs:
+            grid_offset(src, zindex.transform)
+            return src
+    except ValueError:
+        pass
+    src.close()
+    return open_aligned(path, zindex, resampling)
+
+
+def aligned_window(src, transform, window):
+    """Window of src covering a window of the grid defined by transform."""
+    row_off, col_off = grid_offset(src, transform)
+    return Window(int(window.col_off) - col_off, int(window.row_off) - row_off,
+                  int(window.width), int(window.height))
+
+
+def zone_attributes(feat, fields, driver=None):
+    """
+    Attributes of a zone feature. OBJECTID / FID are its feature ID when not
+    attributes: FID as OGR numbers it (0-based in a shapefile), OBJECTID
+    1-based as in the geodatabase the ArcGIS tables were made from (the
+    shapefile feature ID + 1, assuming the export kept the feature order).
+    """
+    props = feat["properties"]
+    attrs = {}
+    for f in fields:
+        if f in props:
+            attrs[f] = props[f]
+        elif f == "OBJECTID" and driver == "ESRI Shapefile":
+            attrs[f] = int(feat.id) + 1
+        elif f in feature_id_fields:
+            attrs[f] = int(feat.id)
+        else:
+            raise KeyError(f"Zone layer has no field '{f}'")
+    return attrs
+
+
+def read_zones(zones_path, fields, crs=None, layer=None):
+    """
+    Zones of a layer as (attributes, [geometries]) in order of first appearance.
+    Features with the same value of the zone field (fields[0]) are one zone, as
+    ZonalStatisticsAsTable merges them (multipart or duplicated corregimientos);
+    the other fields are taken from the first of them. Without fields every
+    feature is a zone. Geometries are reprojected to crs.
+    """
+    zones = {}
+    with fiona.open(zones_path, layer=layer) as src:
+        src_crs = src.crs_wkt
+        reproject = crs is not None and src_crs and CRS.from_wkt(src_crs) != crs
+        for feat in src:
+            if feat["geometry"] is None:
+                continue
+            geom = feat["geometry"]
+            if reproject:
+                geom = transform_geom(src_crs, crs, geom)
+            attrs = zone_attributes(feat, fields, src.driver)
+            key = attrs[fields[0]] if fields else feat.id
+            if key not in zones:
+                zones[key] = (attrs, [])
+            zones[key][1].append(geom)
+    return list(zones.values())
+
+
+def cached_table(info, fields):
+    """Zone table of a cached .json, or None if it has another layout or zone field."""
+    if not isinstance(info, dict) or info.get("version") != zone_cache_version:
+        return None
+    table = info["table"]
+    if info["fields"][:1] != list(fields[:1]) or not table or not all(k in table[0] for k in fields):
+        return None
+    return table
+
+
+def build_zone_index(zones_path, ref_path, out_tif, fields, layer=None):
+    """Rasterize the zone polygons onto the reference grid and cache them as out_tif (+ .json)."""
+    with rasterio.open(ref_path) as ref:
+        meta = ref.meta.copy()
+        shape = (ref.height, ref.width)
+        transform, crs = ref.transform, ref.crs
+
+    table = []
+    shapes = []
+    for attrs, geoms in read_zones(zones_path, fields, crs, layer):
+        table.append(attrs)
+        shapes += [(geom, len(table)) for geom in geoms]
+
+    dtype = "uint16" if len(table) < 65535 else "uint32"
+    zones = rasterize(shapes, out_shape=shape, transform=transform, fill=0, dtype=dtype)
+
+    with rasterio.open(out_tif, "w", **write_meta(meta, dtype=dtype, nodata=0)) as dst:
+        dst.write(zones, 1)
+    with open(os.path.splitext(out_tif)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({"version": zone_cache_version, "fields": list(fields), "table": table},
+                  f, ensure_ascii=False, indent=1)
+    return ZoneIndex(zones, transform, crs, table)
+
+
+def load_zone_index(zones_path, ref_path, cache_tif, fields, layer=None):
+    """Load the cached zone index, rebuilding it when missing, stale or on another grid."""
+    cache_json = os.path.splitext(cache_tif)[0] + ".json"
+    if os.path.exists(cache_tif) and os.path.exists(cache_json) \
+            and os.path.getmtime(cache_tif) >= os.path.getmtime(zones_path):
+        with rasterio.open(cache_tif) as src, rasterio.open(ref_path) as ref:
+            same_grid = (src.transform == ref.transform and src.shape == ref.shape and src.crs == ref.crs)
+            if same_grid:
+                zones = src.read(1)
+                with open(cache_json, encoding="utf-8") as f:
+                    table = cached_table(json.load(f), fields)
+                if table is not None:
+                    return ZoneIndex(zones, src.transform, src.crs, table)
+    print("Building zone index:", cache_tif)
+    return build_zone_index(zones_path, ref_path, cache_tif, fields, layer)
+
+
+def zonal_stats(raster_path, zindex, abs_thresholds=(), blocksize=512):
+    """
+    Per-zone statistics of one raster in a single windowed read.
+    Returns {name: array of length n_zones} with ArcGIS column names
+    COUNT, AREA, MIN, MAX, SUM, MEAN, plus ABS_GT_<thr> counts of |value| > thr.
+    """
+    n = zindex.n_zones + 1
+    count = np.zeros(n, dtype=np.int64)
+    total = np.zeros(n, dtype=np.float64)
+    vmin = np.full(n, np.inf)
+    vmax = np.full(n, -np.inf)
+    exceed = {thr: np.zeros(n, dtype=np.int64) for thr in abs_thresholds}
+
+    with open_zone_source(raster_path, zindex) as src:
+        nodata = src.nodata
+        for window in iter_windows(src, blocksize):
+            zid = zindex.block(src, window)
+            vals = src.read(1, window=window).astype("float64")
+            valid = (zid > 0) & np.isfinite(vals)
+            if nodata is not None:
+                valid &= vals != nodata
+            zid = zid[valid]
+            vals = vals[valid]
+            if zid.size == 0:
+                continue
+            count += np.bincount(zid, minlength=n)
+            total += np.bincount(zid, weights=vals, minlength=n)
+            np.minimum.at(vmin, zid, vals)
+            np.maximum.at(vmax, zid, vals)
+            abs_vals = np.abs(vals)
+            for thr in abs_thresholds:
+                exceed[thr] += np.bincount(zid[abs_vals > thr], minlength=n)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    out = {
+        "COUNT": count[1:],
+        "AREA": count[1:] * zindex.cell_area,
+        "MIN": np.where(count > 0, vmin, np.nan)[1:],
+        "MAX": np.where(count > 0, vmax, np.nan)[1:],
+        "SUM": total[1:],
+        "MEAN": mean[1:],
+    }
+    for thr in abs_thresholds:
+        out[f"ABS_GT_{thr}"] = exceed[thr][1:]
+    return out
+
+
+def exceedance_counts(raster_path, zindex, thresholds, blocksize=512, accumulator=None):
+    """
+    Per-zone counts of negative and positive anomalies beyond any list of
+    thresholds in one read. Every valid pixel is binned once by
+    (zone, sign, number of thresholds its |value| exceeds), so the cost does not
+    grow with the number of thresholds.
+    Returns (count, neg, pos): count is the valid pixel count per zone, neg[thr]
+    counts value < -thr and pos[thr] counts value > thr (arrays of length n_zones).
+    Windows walk the zone grid (the raster may have another extent or be warped
+    onto it). If accumulator (e.g. drought_frequency.EverAffectedAccumulator of
+    the zone grid's shape) is given, it is updated with every block read, at
+    the block's zone-grid window, at no extra I/O.
+    """
+    thr = np.sort(np.asarray(thresholds, dtype=np.float64))
+    n_bins = thr.size + 1
+    n = zindex.n_zones + 1
+    hist = np.zeros(n * 2 * n_bins, dtype=np.int64)
+
+    with open_zone_source(raster_path, zindex) as src:
+        for window in iter_windows(zindex, blocksize):
+            zid = zindex.zones[window.toslices()]
+            in_zone = zid > 0
+            if not in_zone.any():
+                continue
+            vals = read_aligned(src, zindex.src_window(src, window))
+            if accumulator is not None:
+                accumulator.update(vals, window)
+            valid = in_zone & np.isfinite(vals)
+            vals = vals[valid]
+            # bin k = how many thresholds |value| is strictly above
+            level = np.searchsorted(thr, np.abs(vals), side="left")
+            code = (zid[valid].astype(np.int64) * 2 + (vals > 0)) * n_bins + level
+            hist += np.bincount(code, minlength=hist.size)
+
+    hist = hist.reshape(n, 2, n_bins)[1:]
+    # above[:, s, k] = pixels of sign s with |value| > thr[k]
+    above = np.cumsum(hist[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+    count = hist.sum(axis=(1, 2))
+    neg = {float(t): above[:, 0, k] for k, t in enumerate(thr)}
+    pos = {float(t): above[:, 1, k] for k, t in enumerate(thr)}
+    return count, neg, pos
+
+
+def read_aligned(src, window):
+    """Read a window as float64 with NaN for nodata and for cells outside the raster."""
+    inside = (window.col_off >= 0 and window.row_off >= 0
+              and window.col_off + window.width <= src.width
+              and window.row_off + window.height <= src.height)
+    fill = src.nodata if src.nodata is not None else np.nan
+    vals = src.read(1, window=window, boundless=not inside, fill_value=fill).astype("float64")
+    if src.nodata is not None:
+        vals[vals == src.nodata] = np.nan
+    return vals
+
+
+def zonal_means_multi(paths, zindex, blocksize=512):
+    """
+    Per-zone means of several rasters in one windowed co-read.
+    paths: {name: raster path}; rasters sharing the zone grid's cell size and
+    snapping may differ in extent, others are warped onto the zone grid per window. Windows walk the zone grid and blocks
+    with no zone pixels are not read at all.
+    Returns ({name: mean array}, {name: count array}), both of length n_zones.
+    """
+    n = zindex.n_zones + 1
+    sums = {k: np.zeros(n, dtype=np.float64) for k in paths}
+    counts = {k: np.zeros(n, dtype=np.int64) for k in paths}
+    srcs = {k: open_zone_source(p, zindex) for k, p in paths.items()}
+    try:
+        for window in iter_windows(zindex, blocksize):
+            zid_block = zindex.zones[window.toslices()]
+            in_zone = zid_block > 0
+            if not in_zone.any():
+                continue
+            for k, src in srcs.items():
+                vals = read_aligned(src, zindex.src_window(src, window))
+                valid = in_zone & np.isfinite(vals)
+                zid = zid_block[valid]
+                counts[k] += np.bincount(zid, minlength=n)
+                sums[k] += np.bincount(zid, weights=vals[valid], minlength=n)
+    finally:
+        for src in srcs.values():
+            src.close()
+
+    means = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for k in paths:
+            means[k] = (sums[k] / counts[k])[1:]
+    return means, {k: c[1:] for k, c in counts.items()}
+
+
+def zonal_means_cube(cube, zindex, times):
+    """
+    Per-zone means of several dates of a datacube.Cube on the zone grid, in one
+    pass over the cube: every chunk-aligned window is read once for all dates.
+    Returns (means, counts), arrays of shape (len(times), n_zones).
+    """
+    if cube.transform != zindex.transform or (cube.height, cube.width) != (zindex.height, zindex.width):
+        raise ValueError("datacube is not on the zone index grid")
+    n = zindex.n_zones + 1
+    n_t = len(times)
+    sums = np.zeros(n_t * n, dtype=np.float64)
+    counts = np.zeros(n_t * n, dtype=np.int64)
+    for window in cube.windows():
+        zid_block = zindex.zones[window.toslices()]
+        if not (zid_block > 0).any():
+            continue
+        vals = cube.read(window, times)
+        valid = (zid_block > 0) & np.isfinite(vals)
+        t_idx = np.nonzero(valid)[0]
+        # code = date * n + zone, one bincount for every date
+        code = t_idx * n + np.broadcast_to(zid_block, vals.shape)[valid]
+        counts += np.bincount(code, minlength=n_t * n)
+        sums += np.bincount(code, weights=vals[valid], minlength=n_t * n)
+    sums = sums.reshape(n_t, n)[:, 1:]
+    counts = counts.reshape(n_t, n)[:, 1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts, counts
+
+
+def zonal_rows(stats, zindex, columns=("COUNT", "AREA", "MEAN")):
+    """Rows (dicts) like a ZonalStatisticsAsTable output: zones without data are omitted."""
+    rows = []
+    for i, attrs in enumerate(zindex.table):
+        if stats["COUNT"][i] == 0:
+            continue
+        row = dict(attrs)
+        row["ZONE_CODE"] = i + 1
+        for col in columns:
+            row[col] = stats[col][i].item()
+        rows.append(row)
+    return rows
@@ -1,93 +1,212 @@
-import arcpy
 import os
+import csv
+from functools import partial
 import pandas as pd
-import glob
-import re
+from zonal_engine import load_zone_index, zonal_stats, zonal_rows, zonal_means_multi, zonal_means_cube
+from datacube import open_cube
+from raster_catalog import catalog_lookup
+from pipeline_config import setting
+from pipeline import run_standalone
+from zonal_coverage import load_coverage, coverage_means_multi
 
 # ---------------- CONFIG ----------------
 # Paths
-zones_shp = "AOI_Corregimientos"
-zone_field = "Corregimie"  # Change if your shapefile uses a different field name
+zones_shp = setting("zonal_merge", "zones_shp", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Boundaries\AOI_Corregimientos.shp")  # AOI_Corregimientos exported from the project
+zone_field = setting("zonal_merge", "zone_field", "Corregimie")  # Change if your shapefile uses a different field name
 
-ndvi_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\NDVI_Anomalies"
-vci_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\NDVI_VCI"
-spi_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Clipped_250m\SPI1"
+# Raster on the NDVI snap grid; zones are rasterized once onto it and cached
+snap_raster = setting("zonal_merge", "snap_raster", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\real_clipped_NDVI_2020_02_15.tif")
 
-out_tables_folder = r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Zonal_Stats"
-final_csv = os.path.join(out_tables_folder, "NDVI_VCI_SPI1_Merged.csv")
+ndvi_folder = setting("zonal_merge", "ndvi_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\NDVI_Anomalies")
+vci_folder = setting("zonal_merge", "vci_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\NDVI_Data_2013FEB_2025JUL\NDVI_TIF\Clipped_NDVI_Real\NDVI_VCI")
+spi_folder = setting("zonal_merge", "spi_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Chirps\Clipped_250m\SPI1")
+
+out_tables_folder = setting("zonal_merge", "out_tables_folder", r"D:\GIS_Projects\DroughtMonitoring_ArcoSeco\Zonal_Stats")
+final_csv = setting("zonal_merge", "final_csv", os.path.join(out_tables_folder, "NDVI_VCI_SPI1_Merged.csv"))
 os.makedirs(out_tables_folder, exist_ok=True)
+zone_index_tif = os.path.join(out_tables_folder, "zone_index_corregimientos.tif")
+
+# "combined": one co-read of the NDVI anomaly, VCI and SPI rasters per month,
+#             rows streamed to final_csv (corregimie, fecha, spi_1, ndvi_anom, vci)
+# "separate": one zonal pass per dataset, then merged with pandas
+zonal_mode = setting("zonal_merge", "zonal_mode", "combined")
+
+# Combined mode pixel weighting:
+# "centre"   -> pixel belongs to the zone containing its centre (as ArcGIS)
+# "coverage" -> pixels weighted by the fraction of their area inside the zone
+#               (accurate for small corregimientos, no oversampling)
+zonal_weighting = setting("zonal_merge", "zonal_weighting", "centre")
+coverage_npz = os.path.join(out_tables_folder, "coverage_corregimientos.npz")
+
+# Optional datacube (build_datacube.py) with variables spi1, zscore and vci on
+# the snap grid: combined "centre" mode then reads each variable once for all
+# months instead of one file per month (None = use the files)
+datacube_store = setting("zonal_merge", "datacube_store", None)
+cube_variables = {"spi_1": "spi1", "ndvi_anom": "zscore", "vci": "vci"}
 
-# Date range to process (YYYY, MM)
-months_list = [(2023, m) for m in range(1, 13)] + \
-              [(2024, m) for m in range(1, 13)] + \
-              [(2025, m) for m in range(1, 7)]
+# Date range to process (YYYY, MM); in the config as a list of (year, month) pairs
+months_list = setting("zonal_merge", "months_list",
+                      [(2023, m) for m in range(1, 13)] +
+                      [(2024, m) for m in range(1, 13)] +
+                      [(2025, m) for m in range(1, 7)])
 
 # ---------------- FUNCTION: Find raster with flexible day ----------------
-def find_raster(folder, pattern_base, year, month):
+def find_raster(folder, variable, year, month):
     """
-    Search for raster file in 'folder' matching year and month, return full path.
-    pattern_base should be something like 'zscore_real_clipped_NDVI' or 'VCI'.
+    Raster of a catalog variable ('zscore', 'vci', 'spi1') in 'folder' for year
+    and month, whatever its day, from the raster catalog (indexed lookup).
     """
-    search_pattern = os.path.join(folder, f"{pattern_base}_{year}_{month:02d}_*.tif")
-    files = glob.glob(search_pattern)
-    if not files:
-        raise FileNotFoundError(f"No raster found for {pattern_base} {year}-{month:02d}")
-    return files[0]  # If multiple, take the first match
+    path = catalog_lookup(variable, folder, year, month)
+    if path is None:
+        raise FileNotFoundError(f"No raster found for {variable} {year}-{month:02d}")
+    return path  # If multiple, the first day
 
 # ---------------- FUNCTION: Zonal Stats ----------------
-def run_zonal_stats(raster_path, out_table_path):
-    arcpy.sa.ZonalStatisticsAsTable(
-        in_zone_data=zones_shp,
-        zone_field=zone_field,
-        in_value_raster=raster_path,
-        out_table=out_table_path,
-        ignore_nodata="DATA",
-        statistics_type="MEAN"
-    )
-
-# ---------------- RUN ZONAL STATS FOR EACH DATASET ----------------
-ndvi_dfs = []
-vci_dfs = []
-spi_dfs = []
-
-for year, month in months_list:
-    # NDVI anomaly
-    ndvi_file = find_raster(ndvi_folder, "zscore_real_clipped_NDVI", year, month)
-    ndvi_table = os.path.join(out_tables_folder, f"NDVI_{year}_{month:02d}.dbf")
-    run_zonal_stats(ndvi_file, ndvi_table)
-    df_ndvi = pd.DataFrame(arcpy.da.TableToNumPyArray(ndvi_table, [zone_field, "MEAN"]))
-    df_ndvi["Fecha"] = f"{year}-{month:02d}"
-    df_ndvi.rename(columns={"MEAN": "NDVI_Anom"}, inplace=True)
-    ndvi_dfs.append(df_ndvi)
-
-    # VCI
-    vci_file = find_raster(vci_folder, "VCI", year, month)
-    vci_table = os.path.join(out_tables_folder, f"VCI_{year}_{month:02d}.dbf")
-    run_zonal_stats(vci_file, vci_table)
-    df_vci = pd.DataFrame(arcpy.da.TableToNumPyArray(vci_table, [zone_field, "MEAN"]))
-    df_vci["Fecha"] = f"{year}-{month:02d}"
-    df_vci.rename(columns={"MEAN": "VCI"}, inplace=True)
-    vci_dfs.append(df_vci)
-
-    # SPI-1 (no day in filename)
-    spi_file = os.path.join(spi_folder, f"SPI1_{year}_{month:02d}.tif")
-    if not os.path.exists(spi_file):
-        raise FileNotFoundError(f"No SPI1 raster found for {year}-{month:02d}")
-    spi_table = os.path.join(out_tables_folder, f"SPI1_{year}_{month:02d}.dbf")
-    run_zonal_stats(spi_file, spi_table)
-    df_spi = pd.DataFrame(arcpy.da.TableToNumPyArray(spi_table, [zone_field, "MEAN"]))
-    df_spi["Fecha"] = f"{year}-{month:02d}"
-    df_spi.rename(columns={"MEAN": "SPI_1"}, inplace=True)
-    spi_dfs.append(df_spi)
-
-# ---------------- MERGE ALL ----------------
-df_ndvi_all = pd.concat(ndvi_dfs, ignore_index=True)
-df_vci_all = pd.concat(vci_dfs, ignore_index=True)
-df_spi_all = pd.concat(spi_dfs, ignore_index=True)
-
-merged = pd.merge(df_ndvi_all, df_vci_all, on=[zone_field, "Fecha"])
-merged = pd.merge(merged, df_spi_all, on=[zone_field, "Fecha"])
-
-# Save final CSV
-merged.to_csv(final_csv, index=False, encoding="utf-8-sig")
-print(f"Final table saved at: {final_csv}")
+_zindex = None
+
+def zone_index():
+    """Zone index on the snap grid, loaded on first use (not on import: the pipeline imports every stage)."""
+    global _zindex
+    if _zindex is None:
+        _zindex = load_zone_index(zones_shp, snap_raster, zone_index_tif, [zone_field])
+    return _zindex
+
+def run_zonal_stats(raster_path):
+    """Zonal MEAN per zone, as read back from the ZonalStatisticsAsTable output."""
+    zindex = zone_index()
+    rows = zonal_rows(zonal_stats(raster_path, zindex), zindex)
+    return pd.DataFrame(rows, columns=[zone_field, "MEAN"])
+
+# ---------------- FUNCTION: Find SPI raster (no day in filename) ----------------
+def find_spi_raster(year, month):
+    return find_raster(spi_folder, "spi1", year, month)
+
+# ---------------- COMBINED FROM THE DATACUBE: ONE PASS PER VARIABLE ----------------
+def run_combined_cube():
+    zindex = zone_index()
+    means, counts = {}, {}
+    for key, variable in cube_variables.items():
+        cube = open_cube(datacube_store, variable)
+        idx = [cube.index_of(year, month) for year, month in months_list]
+        missing = [ym for ym, i in zip(months_list, idx) if i is None]
+        if missing:
+            raise FileNotFoundError(f"{variable}: no cube date for {missing[0][0]}-{missing[0][1]:02d}")
+        means[key], counts[key] = zonal_means_cube(cube, zindex, idx)
+        print(f"Zonal means of {variable} for {len(idx)} months")
+
+    with open(final_csv, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["corregimie", "fecha", "spi_1", "ndvi_anom", "vci"])
+        for t, (year, month) in enumerate(months_list):
+            fecha = f"{year}-{month:02d}-01"
+            for i, attrs in enumerate(zindex.table):
+                if all(counts[k][t, i] > 0 for k in cube_variables):
+                    writer.writerow([attrs[zone_field], fecha, means["spi_1"][t, i],
+                                     means["ndvi_anom"][t, i], means["vci"][t, i]])
+    print(f"Final table saved at: {final_csv}")
+
+# ---------------- COMBINED: ONE CO-READ PER MONTH, ROWS STREAMED ----------------
+def run_combined():
+    if zonal_weighting == "coverage":
+        cov = load_coverage(zones_shp, snap_raster, coverage_npz, [zone_field])
+        zone_table = cov.table
+        zone_means = partial(coverage_means_multi, cov=cov)
+    else:
+        zindex = zone_index()
+        zone_table = zindex.table
+        zone_means = partial(zonal_means_multi, zindex=zindex)
+
+    with open(final_csv, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["corregimie", "fecha", "spi_1", "ndvi_anom", "vci"])
+        for year, month in months_list:
+            paths = {
+                "spi_1": find_spi_raster(year, month),
+                "ndvi_anom": find_raster(ndvi_folder, "zscore", year, month),
+                "vci": find_raster(vci_folder, "vci", year, month),
+            }
+            means, counts = zone_means(paths)
+            fecha = f"{year}-{month:02d}-01"
+            for i, attrs in enumerate(zone_table):
+                # Same rows an inner join of the three tables would keep
+                if all(counts[k][i] > 0 for k in paths):
+                    writer.writerow([attrs[zone_field], fecha, means["spi_1"][i],
+                                     means["ndvi_anom"][i], means["vci"][i]])
+            print(f"Zonal means written for {year}-{month:02d}")
+    print(f"Final table saved at: {final_csv}")
+
+# ---------------- SEPARATE: ZONAL STATS PER DATASET + MERGE ----------------
+def run_separate():
+    ndvi_dfs = []
+    vci_dfs = []
+    spi_dfs = []
+
+    for year, month in months_list:
+        # NDVI anomaly
+        ndvi_file = find_raster(ndvi_folder, "zscore", year, month)
+        df_ndvi = run_zonal_stats(ndvi_file)
+        df_ndvi["Fecha"] = f"{year}-{month:02d}"
+        df_ndvi.rename(columns={"MEAN": "NDVI_Anom"}, inplace=True)
+        ndvi_dfs.append(df_ndvi)
+
+        # VCI
+        vci_file = find_raster(vci_folder, "vci", year, month)
+        df_vci = run_zonal_stats(vci_file)
+        df_vci["Fecha"] = f"{year}-{month:02d}"
+        df_vci.rename(columns={"MEAN": "VCI"}, inplace=True)
+        vci_dfs.append(df_vci)
+
+        # SPI-1 (no day in filename)
+        spi_file = find_spi_raster(year, month)
+        df_spi = run_zonal_stats(spi_file)
+        df_spi["Fecha"] = f"{year}-{month:02d}"
+        df_spi.rename(columns={"MEAN": "SPI_1"}, inplace=True)
+        spi_dfs.append(df_spi)
+
+    # ---------------- MERGE ALL ----------------
+    df_ndvi_all = pd.concat(ndvi_dfs, ignore_index=True)
+    df_vci_all = pd.concat(vci_dfs, ignore_index=True)
+    df_spi_all = pd.concat(spi_dfs, ignore_index=True)
+
+    merged = pd.merge(df_ndvi_all, df_vci_all, on=[zone_field, "Fecha"])
+    merged = pd.merge(merged, df_spi_all, on=[zone_field, "Fecha"])
+
+    # Save final CSV
+    merged.to_csv(final_csv, index=False, encoding="utf-8-sig")
+    print(f"Final table saved at: {final_csv}")
+
+
+# ---------------- INPUTS OF THE FINAL TABLE ----------------
+def merge_inputs():
+    paths = [zones_shp, os.path.splitext(zones_shp)[0] + ".dbf", snap_raster]
+    for year, month in months_list:
+        paths += [find_spi_raster(year, month),
+                  find_raster(ndvi_folder, "zscore", year, month),
+                  find_raster(vci_folder, "vci", year, month)]
+    return paths
+
+
+merge_params = {"mode": zonal_mode, "weighting": zonal_weighting, "months": months_list,
+                "datacube": bool(datacube_store)}
+
+# ---------------- STAGE: ONE ITEM, THE FINAL TABLE ----------------
+def plan(manifest):
+    inputs = merge_inputs()
+    if manifest.is_current(final_csv, inputs, merge_params):
+        print(f"Final table is up to date: {final_csv}")
+        return []
+    return [inputs]
+
+
+def process(inputs):
+    if zonal_mode == "combined" and datacube_store and zonal_weighting == "centre":
+        run_combined_cube()
+    elif zonal_mode == "combined":
+        run_combined()
+    else:
+        run_separate()
+    return [(final_csv, inputs, merge_params)], None
+
+
+if __name__ == "__main__":
+    run_standalone(plan, process)